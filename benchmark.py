@@ -0,0 +1,378 @@
+"""
+Benchmarks for collection, report generation and delivery.
+
+Every part is driven separately: collecting the system information with every
+available probe, the report builders of all three systems (Windows with fake
+drives), the serialization of a message and a whole send_mail() against an
+SMTP sink on localhost. Nothing leaves the machine and no real system values
+end up in the reports.
+
+For every benchmark the latency percentiles, the peak memory allocated per run
+(tracemalloc) and the peak RSS of the process after the benchmark are printed.
+The medians can be stored as baseline; later runs are compared against it and
+the script exits with status 1 if a benchmark got slower than the tolerance.
+
+With --startup, the cold start test of main.py in tests/test_startup.py is run
+instead: its import time measured with "python -X importtime" must stay within a
+budget, and none of the heavy modules that are only needed later may be imported
+on startup.
+
+Usage:
+    python benchmark.py [repetitions] [--only NAME] [--save-baseline] [--baseline FILE] [--tolerance 0.25]
+    python benchmark.py --startup [--startup-budget MS]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import socketserver
+import subprocess
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from email.generator import BytesGenerator
+
+import psutil
+
+from src.Mail.Sender import MailSender
+from src.Mail.SMTPSession import SMTPSession
+from src.System.DataCollector import DataCollector
+from src.System.DiskCollector import MountUsage
+from src.System.ProcessScanner import ProcessTop, ProcessUsage
+from src.System.GlobalIPResolver import GlobalIPResolver
+from src.System.MetricSampler import MetricSampler
+from src.System.SystemProbe import ProcProbe, PsutilProbe
+
+# System information as returned by DataCollector.collect(), with fixed values
+SAMPLE_INFO = {
+    "hostname": "raspberrypi",
+    "operating_system": "Linux",
+    "uptime_days": 12,
+    "uptime_hours": 5,
+    "uptime_minutes": 42,
+    "uptime_seconds": 7,
+    "total_memory": 29.12,
+    "used_memory": 11.73,
+    "free_memory": 16.07,
+    "cpu_percent_now": 7.5,
+    "cpu_freq_mhz": None,
+    "cpu_physical": 4,
+    "cpu_logical": 4,
+    "total_ram_gb": 3.79,
+    "used_ram_gb": 0.91,
+    "available_ram_gb": 2.61,
+    "ram_percent": 31.2,
+    "disk_mounts": (
+        MountUsage("/", "/dev/mmcblk0p2", "ext4", "ok", 29 * 1024 ** 3, 12 * 1024 ** 3, 16 * 1024 ** 3, 42.1),
+        MountUsage("/boot/firmware", "/dev/mmcblk0p1", "vfat", "ok", 510 * 1024 ** 2, 64 * 1024 ** 2,
+                   446 * 1024 ** 2, 12.5),
+        MountUsage("/mnt/nas", "nas:/export", "nfs4", "hung"),
+    ),
+    "processes": ProcessTop(
+        (ProcessUsage(812, "python3", 87.5, 96 * 1024 ** 2, 2048.0), ProcessUsage(455, "dockerd", 4.1, 71 * 1024 ** 2, None),
+         ProcessUsage(1, "systemd", 0.2, 12 * 1024 ** 2, 0.0)),
+        (ProcessUsage(812, "python3", 87.5, 96 * 1024 ** 2, 2048.0), ProcessUsage(455, "dockerd", 4.1, 71 * 1024 ** 2, None),
+         ProcessUsage(1, "systemd", 0.2, 12 * 1024 ** 2, 0.0)),
+        (ProcessUsage(812, "python3", 87.5, 96 * 1024 ** 2, 2048.0), ProcessUsage(901, "rsync", 0.1, 8 * 1024 ** 2, 524288.0)),
+        143, True, 0.004, 86400.0),
+    "metrics": None,
+    "metrics_window": 0,
+    "local_ip": "192.168.178.20",
+    "global_ip": "203.0.113.5",
+    "global_ip_changed": False,
+}
+
+# Drives of a Windows machine, with their usage as read by the collector
+WINDOWS_MOUNTS = (
+    MountUsage("C:\\", "C:\\", "NTFS", "ok", 511 * 1024 ** 3, 203 * 1024 ** 3, 308 * 1024 ** 3, 39.7),
+    MountUsage("D:\\", "D:\\", "NTFS", "ok", 1863 * 1024 ** 3, 1201 * 1024 ** 3, 662 * 1024 ** 3, 64.5),
+    MountUsage("Z:\\", "\\\\nas\\share", "NTFS", "hung"),
+)
+
+DEFAULT_BASELINE = "benchmark-baseline.json"
+
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    """
+    Accepts every command and discards the message data.
+    """
+
+    def reply(self, line):
+        self.wfile.write(line + b"\r\n")
+
+    def handle(self):
+        self.reply(b"220 benchmark sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self.wfile.write(b"250-benchmark sink\r\n250 SIZE 100000000\r\n")
+            elif command == b"DATA":
+                self.reply(b"354 go ahead")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self.server.messages += 1
+                self.reply(b"250 queued")
+            elif command == b"QUIT":
+                self.reply(b"221 bye")
+                return
+            else:
+                self.reply(b"250 ok")
+
+
+def start_smtp_sink():
+    """
+    Starts an SMTP server on a free port of localhost that discards all mails.
+
+    Returns:
+        socketserver.ThreadingTCPServer: The running server.
+    """
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SinkHandler)
+    server.daemon_threads = True
+    server.messages = 0
+    threading.Thread(target=server.serve_forever, name="smtp-sink", daemon=True).start()
+    return server
+
+
+def peak_rss_kib():
+    """
+    Returns:
+        float: The peak resident set size of this process so far in KiB.
+    """
+    try:
+        import resource
+    except ImportError:
+        # Windows
+        return psutil.Process().memory_info().peak_wset / 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB everywhere else
+    return peak / 1024 if sys.platform == "darwin" else peak
+
+
+def measure(function, repetitions):
+    """
+    Runs a function repeatedly and measures its duration and peak allocation.
+
+    Args:
+        function (callable): The function to measure.
+        repetitions (int): Number of runs.
+
+    Returns:
+        dict: Median, p90, p99 and minimum duration in milliseconds, the median peak
+              allocation in KiB and the peak RSS of the process in KiB.
+    """
+    # Warm-up, so one-time work like compiling templates is not part of the figures
+    function()
+
+    durations = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+
+    peaks = []
+    tracemalloc.start()
+    for _ in range(min(repetitions, 50)):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        function()
+        peaks.append((tracemalloc.get_traced_memory()[1] - baseline) / 1024)
+    tracemalloc.stop()
+
+    percentiles = statistics.quantiles(durations, n=100, method="inclusive") if len(durations) > 1 else durations * 99
+    return {
+        "median": statistics.median(durations),
+        "p90": percentiles[89],
+        "p99": percentiles[98],
+        "min": min(durations),
+        "peak_kib": statistics.median(peaks),
+        "rss_kib": peak_rss_kib(),
+    }
+
+
+def probe_sample(probe):
+    """
+    Reads the values of one sampler tick with a probe.
+    """
+    probe.cpu_percent()
+    probe.memory()
+    probe.load_1()
+    probe.disk_usage("/")
+    probe.uptime_seconds()
+
+
+def create_collector(probe):
+    """
+    Creates a DataCollector whose CPU usage comes from a sampler, so system_info() doesn't block for a second.
+    """
+    sampler = MetricSampler("/", probe=probe)
+    sampler.sample()
+    return DataCollector(sampler=sampler, probe=probe)
+
+
+def create_sender(operating_system):
+    """
+    Creates a MailSender that is only used for rendering.
+    """
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    sender = MailSender("sender@example.com", "password", "receiver@example.com", script_dir, "/", operating_system,
+                        "localhost", 465, True, 12345, 22, "pi")
+    return sender
+
+
+def serialize(message):
+    """
+    Serializes a message the way the spool and the SMTP session do.
+    """
+    BytesGenerator(io.BytesIO(), policy=message.policy.clone(linesep="\r\n")).flatten(message)
+
+
+def create_end_to_end(sink):
+    """
+    Creates a MailSender that collects the real system values and sends to the sink.
+
+    The global IP is answered from the resolver cache, so the providers are never asked.
+
+    Returns:
+        callable: Runs one send_mail() without its console output.
+    """
+    ip_resolver = GlobalIPResolver(ttl=float("inf"))
+    ip_resolver.ip = SAMPLE_INFO["global_ip"]
+    ip_resolver.fetched_at = time.time()
+    collector = create_collector(PsutilProbe())
+    collector.ip_resolver = ip_resolver
+    smtp_session = SMTPSession("127.0.0.1", sink.server_address[1], security="none")
+
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    sender = MailSender("sender@example.com", "password", "receiver@example.com", script_dir, "/", "Linux",
+                        "127.0.0.1", sink.server_address[1], True, 12345, 22, "pi", data_collector=collector,
+                        smtp_session=smtp_session)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            sender.send_mail()
+    return run
+
+
+def check_startup(budget):
+    """
+    Runs the cold start test of main.py (tests/test_startup.py) with the budget.
+
+    Returns:
+        bool: True if the startup is within the budget and no lazy module was imported.
+    """
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    result = subprocess.run([sys.executable, "-m", "pytest", "-q", "-s", "-p", "no:cacheprovider",
+                             os.path.join("tests", "test_startup.py")], cwd=script_dir,
+                            env=dict(os.environ, STARTUP_BUDGET_MS=str(budget)))
+    return result.returncode == 0
+
+
+def load_baseline(filename):
+    try:
+        with open(filename, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(filename, results):
+    temp_file = filename + ".tmp"
+    with open(temp_file, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+    os.replace(temp_file, filename)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns:
+        list: A line for every benchmark whose median got slower than the tolerance allows.
+    """
+    regressions = []
+    for label, figures in results.items():
+        reference = (baseline or {}).get(label)
+        if reference is None:
+            continue
+        # Differences below 50 microseconds are timer and scheduling noise, whatever the ratio
+        if figures["median"] > reference["median"] * (1 + tolerance) and figures["median"] - reference["median"] > 0.05:
+            regressions.append(f"{label}: median {figures['median']:.3f} ms, baseline {reference['median']:.3f} ms "
+                               f"(+{(figures['median'] / reference['median'] - 1) * 100:.0f}%)")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for collection, report generation and delivery.")
+    parser.add_argument("repetitions", nargs="?", type=int, default=500, help="runs per benchmark")
+    parser.add_argument("--only", help="run only the benchmarks whose name contains this text")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="file the baseline is stored in")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="fraction a median may exceed its baseline before it counts as regression")
+    parser.add_argument("--startup", action="store_true", help="only check the cold start of main.py")
+    parser.add_argument("--startup-budget", type=float, default=150,
+                        help="milliseconds importing main.py may take (default: 150, raise it on slow devices)")
+    args = parser.parse_args()
+
+    if args.startup:
+        sys.exit(0 if check_startup(args.startup_budget) else 1)
+
+    linux_sender = create_sender("Linux")
+    benchmarks = [("linux report HTML", lambda: linux_sender.html_builder.render(
+        "linux", linux_sender.report_context(SAMPLE_INFO)))]
+    windows_info = dict(SAMPLE_INFO, disk_mounts=WINDOWS_MOUNTS)
+    for operating_system, builder, info in (("Raspberry", "pi_mail", SAMPLE_INFO), ("Linux", "linux_mail", SAMPLE_INFO),
+                                            ("Windows", "windows_mail", windows_info)):
+        sender = create_sender(operating_system)
+        benchmarks.append((builder, lambda sender=sender, builder=builder, info=info: getattr(sender, builder)(info)))
+    message = linux_sender.linux_mail(SAMPLE_INFO)
+    benchmarks.append(("serialize linux_mail", lambda: serialize(message)))
+
+    probes = [PsutilProbe()]
+    try:
+        probes.append(ProcProbe())
+    except OSError:
+        pass
+    for probe in probes:
+        benchmarks.append((f"sample ({probe.name} probe)", lambda probe=probe: probe_sample(probe)))
+        collector = create_collector(probe)
+        benchmarks.append((f"system_info ({probe.name} probe)",
+                           lambda collector=collector: collector.system_info("/")))
+
+    sink = start_smtp_sink()
+    benchmarks.append(("send_mail end-to-end", create_end_to_end(sink)))
+
+    if args.only:
+        benchmarks = [(label, function) for label, function in benchmarks if args.only in label]
+
+    results = {}
+    print(f"{'Benchmark':<28} {'median ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'min ms':>10} {'peak KiB':>10} "
+          f"{'RSS MiB':>8}")
+    for label, function in benchmarks:
+        # Sending and collecting are much slower than rendering, fewer runs are enough
+        repetitions = args.repetitions if "send_mail" not in label else max(2, args.repetitions // 10)
+        figures = results[label] = measure(function, repetitions)
+        print(f"{label:<28} {figures['median']:>10.3f} {figures['p90']:>10.3f} {figures['p99']:>10.3f} "
+              f"{figures['min']:>10.3f} {figures['peak_kib']:>10.1f} {figures['rss_kib'] / 1024:>8.1f}")
+
+    if args.save_baseline:
+        baseline = load_baseline(args.baseline) or {}
+        baseline.update(results)
+        save_baseline(args.baseline, baseline)
+        print(f"Baseline stored in {args.baseline}")
+    else:
+        baseline = load_baseline(args.baseline)
+        if baseline is None:
+            print(f"No baseline in {args.baseline}, store one with --save-baseline")
+        else:
+            regressions = compare(results, baseline, args.tolerance)
+            for line in regressions:
+                print("Regression:", line)
+            if regressions:
+                sys.exit(1)
+            print(f"No regression against {args.baseline}")
@@ -44,18 +44,24 @@ def install_requirements(venv_dir, requirements_file):
 
 def read_config(filename):
     """
-    Reads the configuration file and loads the settings.
+    Reads and validates the configuration file, exiting with the list of errors if it can't be used.
 
     Args:
         filename (str): The path to the configuration file.
 
     Returns:
-        dict: A dictionary containing the loaded settings.
+        Settings: The loaded settings.
     """
-    config = {}
-    with open(filename, 'r') as file:
-        exec(file.read(), config)
-    return config
+    from src.Config.Settings import ConfigError, load_settings
+    try:
+        return load_settings(filename)
+    except ConfigError as e:
+        print(f"The settings in {filename} have errors:")
+        for problem in e.problems:
+            print("  " + problem)
+    except OSError as e:
+        print("Error reading the settings:", e)
+    sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -1,48 +1,192 @@
 """
-Main script to maintain service functionality and send emails at specified time.
+Main script to maintain service functionality and run the scheduled jobs.
+
+Usage:
+    python main.py               Runs resident and sends the jobs on their schedule.
+    python main.py --once [ACTION]
+                                 Runs one action (default "report"), delivers the mail and exits.
+                                 Used by the systemd timer units.
 """
 
-import time
-import threading
+import argparse
 import os
+import signal
+import sys
+import time
 
+from src.Mail.MailSpool import DeliveryWorker, MailSpool
 from src.Mail.Sender import MailSender
+from src.Mail.SMTPSession import SMTPSession
+from src.Schedule.RunLedger import RunLedger
+from src.Config.Settings import SCHEMA, ConfigError, SettingsWatcher, load_settings
+from src.Schedule.Scheduler import Job, Scheduler
 from src.System.DataCollector import DataCollector
+from src.System.GlobalIPResolver import GlobalIPResolver
+from src.Telemetry.Instrumentation import instrumentation
 
 
 def read_config(filename):
     """
-    Reads the configuration file and loads the settings.
+    Reads and validates the configuration file, exiting with the list of errors if it can't be used.
 
     Args:
         filename (str): The path to the configuration file.
 
     Returns:
-        dict: A dictionary containing the loaded settings.
+        Settings: The loaded settings.
+    """
+    try:
+        return load_settings(filename)
+    except ConfigError as e:
+        print(f"The settings in {filename} have errors:")
+        for problem in e.problems:
+            print("  " + problem)
+    except OSError as e:
+        print("Error reading the settings:", e)
+    sys.exit(1)
+
+
+def configured_jobs(config):
+    """
+    Returns the job definitions from the configuration.
+
+    Falls back to a single daily report at SEND_HOUR:SEND_MINUTE for older configuration files.
+
+    Args:
+        config (Settings): The loaded settings.
+
+    Returns:
+        dict: Maps job names to their options.
+    """
+    if config.get("JOBS") is not None:
+        return config["JOBS"]
+    return {"daily_report": {"cron": f"{config['SEND_MINUTE']} {config['SEND_HOUR']} * * *", "action": "report"}}
+
+
+def send_report():
+    """
+    Collects the system information and sends the report mail.
+    """
+    mail_sender.send_mail()
+
+
+def refresh_status():
+    """
+    Collects the system information for the status endpoint, without sending anything.
+
+    Returns:
+        tuple: The snapshot and the rendered report.
     """
-    config = {}
-    with open(filename, 'r') as file:
-        exec(file.read(), config)
-    return config
+    info = data_collector.collect(disk_path)
+    return info["snapshot"], mail_sender.report_html(info)
 
 
-def schedule_task():
+def check_global_ip():
     """
-    Schedules the task to send the email at the specified time.
+    Looks up the global IP address and sends the report mail only if it changed since the last report.
     """
-    while True:
-        current_time = time.localtime()
-        print(current_time)  # Debugging output
-        if current_time.tm_hour == config["SEND_HOUR"] and current_time.tm_min == config["SEND_MINUTE"]:
-            mail_sender = MailSender(sender_email, mail_password, receiver_email, script_dir, disk_path, operating_system,
-                                     smtp_server_address, smtp_server_port, pi_external, pi_external_port, pi_local_port, pi_user)
-            mail_sender.send_mail()
-            print("Mail has been sent")  # Debugging output
-            print(f"Time: {current_time}")  # Debugging output
-        time.sleep(60)  # Check every minute if it's time to send the email
+    ip_resolver.resolve(force=True)
+    if ip_resolver.changed:
+        print(f"Global IP changed from {ip_resolver.reported_ip} to {ip_resolver.ip}")
+        send_report()
+
+
+def apply_settings(old, new):
+    """
+    Applies a changed settings.conf to the running service.
+
+    Jobs, recipients, SMTP settings and the retry policy of the spool take effect right away,
+    spooled mails stay where they are. Other changes are reported and need a restart.
+
+    Args:
+        old (Settings): The settings in use until now.
+        new (Settings): The changed settings.
+    """
+    changed = new.changed(old)
+    if not changed:
+        return
+    print("Settings changed:", ", ".join(sorted(changed)))
+
+    if changed & {"JOBS", "SEND_HOUR", "SEND_MINUTE", "CATCH_UP"}:
+        old_jobs, new_jobs = configured_jobs(old), configured_jobs(new)
+        try:
+            # All jobs are created and their next run is determined first,
+            # so a job that can't be scheduled leaves the schedule untouched
+            jobs = {name: Job.from_config(name, options, actions) for name, options in new_jobs.items()
+                    if old_jobs.get(name) != options or "CATCH_UP" in changed}
+            now = time.time()
+            for job in jobs.values():
+                job.spec.next_after(now)
+        except ValueError as e:
+            print("Keeping the current jobs:", e)
+        else:
+            scheduler.catch_up = new["CATCH_UP"]
+            for name in old_jobs.keys() - new_jobs.keys():
+                scheduler.remove_job(name)
+                print(f"Removed job '{name}'")
+            for name, job in jobs.items():
+                # Slots of the new schedule before now were not missed, the service was running
+                scheduler.add_job(job, catch_up=False)
+                print(f"Scheduled job '{name}' ({job.spec!r})")
+
+    mail_sender.sender_email = new["SENDER_MAIL"]
+    mail_sender.mail_password = new["SENDER_PASSWORD"]
+    mail_sender.receiver_email = new["RECEIVER_MAIL"]
+    mail_sender.smtp_server_address = new["SMTP_SERVER_ADDRESS"]
+    mail_sender.smtp_server_port = new["SMTP_SERVER_PORT"]
+    mail_sender.pi_external = new["PI_EXTERNAL"]
+    mail_sender.pi_external_port = new["PI_EXTERNAL_PORT"]
+    mail_sender.pi_local_port = new["PI_LOCAL_PORT"]
+    mail_sender.pi_user = new["PI_USER"]
+    mail_sender.sparklines.budget = new["CHART_BUDGET"]
+    smtp_session.reconfigure(new["SMTP_SERVER_ADDRESS"], new["SMTP_SERVER_PORT"], new["SENDER_MAIL"],
+                             new["SENDER_PASSWORD"], new["SMTP_SECURITY"], new["SMTP_IDLE_TIMEOUT"])
+    delivery_worker.retry_base = new["SPOOL_RETRY_BASE"]
+    delivery_worker.retry_max = new["SPOOL_RETRY_MAX"]
+    delivery_worker.max_age = new["SPOOL_MAX_AGE"]
+    ip_resolver.ttl = new["GLOBAL_IP_TTL"]
+    data_collector.disks.timeout = new["DISK_TIMEOUT"]
+    if data_collector.processes is not None:
+        data_collector.processes.budget = new["PROCESS_SCAN_BUDGET"]
+    if changed & {"COLLECT_TIMEOUT", "COLLECT_DEADLINE"}:
+        data_collector.collector_timeout = new["COLLECT_TIMEOUT"]
+        data_collector.collect_deadline = new["COLLECT_DEADLINE"]
+        # The pipeline is built again with the new timeouts on the next collection
+        data_collector.pipeline = None
+
+    later = sorted(name for name in changed if name in SCHEMA and not SCHEMA[name].live)
+    if later:
+        print("Changes that take effect after a restart:", ", ".join(later))
+
+
+def run_once(action):
+    """
+    Runs a single action and delivers the spooled mails that are due, without starting any thread.
+
+    Args:
+        action (callable): The action to run.
+
+    Returns:
+        int: The exit status, 1 if mails are left in the spool for the next run.
+    """
+    try:
+        action()
+    finally:
+        delivery_worker.deliver_due()
+        smtp_session.close()
+    left = len(spool.pending())
+    if left:
+        print(f"{left} mail(s) left in the spool for the next run")
+        return 1
+    return 0
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sends emails with system information on a schedule.")
+    parser.add_argument("--once", nargs="?", const="report", metavar="ACTION",
+                        help="run one action (default: report), deliver the mail and exit")
+    args = parser.parse_args()
+
     # Get the directory path where the script is located
     script_dir = os.path.dirname(os.path.realpath(__file__))
 
@@ -64,10 +208,39 @@ if __name__ == "__main__":
     pi_local_port = config["PI_LOCAL_PORT"]
     pi_user = config["PI_USER"]
 
+    # Timings of the pipeline stages, a SIGUSR1 profiles the next run with cProfile
+    if config.get("INSTRUMENTATION", False):
+        log_file = config.get("INSTRUMENTATION_LOG")
+        textfile = config.get("PROMETHEUS_TEXTFILE")
+        instrumentation.configure(True, os.path.join(script_dir, log_file) if log_file else None,
+                                  os.path.join(script_dir, textfile) if textfile else None,
+                                  os.path.join(script_dir, config.get("PROFILE_DIR", "profiles")))
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: instrumentation.request_profile())
+
     # Initialize system variables
-    data_collector = DataCollector()
+    ip_resolver = GlobalIPResolver(config.get("GLOBAL_IP_PROVIDERS"), config.get("GLOBAL_IP_TTL", 3600),
+                                   os.path.join(script_dir, config.get("GLOBAL_IP_CACHE", "global-ip.json")),
+                                   client=config.get("GLOBAL_IP_CLIENT", "auto"))
+    data_collector = DataCollector(collector_timeout=config.get("COLLECT_TIMEOUT", 5),
+                                   collect_deadline=config.get("COLLECT_DEADLINE", 10),
+                                   ip_resolver=ip_resolver, disk_timeout=config.get("DISK_TIMEOUT", 2),
+                                   top_processes=config.get("TOP_PROCESSES", 5),
+                                   process_budget=config.get("PROCESS_SCAN_BUDGET", 0.5))
     operating_system = data_collector.get_operating_system()
 
+    # A SIGHUP determines the static facts like the hostname and the total RAM again
+    # and makes the running service check settings.conf for changes right away
+    settings_watcher = None
+
+    def handle_sighup(signum, frame):
+        data_collector.host_facts.refresh()
+        if settings_watcher is not None:
+            settings_watcher.check_now()
+
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, handle_sighup)
+
     # Check if the disk path should be chosen automatically
     if disk_path == "auto":
         if operating_system == "Windows":
@@ -75,9 +248,106 @@ if __name__ == "__main__":
         else:
             disk_path = "/"
 
-    # Start the scheduled task in a background thread
-    threading.Thread(target=schedule_task, daemon=True).start()
+    # One SMTP session for all mails, the connection is kept open between sends until it is idle
+    smtp_session = SMTPSession(smtp_server_address, smtp_server_port, sender_email, mail_password,
+                               config.get("SMTP_SECURITY", "ssl"), config.get("SMTP_IDLE_TIMEOUT", 60))
+
+    # Mails are spooled on disk and delivered with retries by a separate worker,
+    # so a slow or unreachable mail provider never delays the scheduled jobs
+    spool = MailSpool(os.path.join(script_dir, config.get("SPOOL_DIR", "spool")))
+    delivery_worker = DeliveryWorker(spool, smtp_session, config.get("SPOOL_RETRY_BASE", 30),
+                                     config.get("SPOOL_RETRY_MAX", 3600), config.get("SPOOL_MAX_AGE", 2 * 86400))
+    if not args.once:
+        delivery_worker.start()
+
+    # Optional background sampler, so reports don't block on measuring the CPU usage
+    # Its samples also feed the on-disk history shown in the reports
+    sampler = None
+    metric_store = None
+    if not args.once and config.get("SAMPLER_INTERVAL", 0) > 0:
+        # Optional parts are only imported when they are enabled, which keeps the startup short
+        from src.System.MetricSampler import MetricSampler
+        from src.System.MetricStore import MetricStore
+
+        metric_store = MetricStore(os.path.join(script_dir, config.get("METRIC_STORE_DIR", "metrics")),
+                                   config.get("METRIC_RETENTION_DAYS"), config.get("METRIC_STORE_FLUSH", 600))
+        sampler = MetricSampler(disk_path, config["SAMPLER_INTERVAL"], config.get("SAMPLER_WINDOW", 360),
+                                metric_store)
+        sampler.start()
+    data_collector.sampler = sampler
+    data_collector.metric_store = metric_store
+
+    # The sender is reused for every report, so templates and logos are only loaded once
+    mail_sender = MailSender(sender_email, mail_password, receiver_email, script_dir, disk_path, operating_system,
+                             smtp_server_address, smtp_server_port, pi_external, pi_external_port, pi_local_port, pi_user,
+                             data_collector=data_collector, smtp_session=smtp_session, spool=spool,
+                             chart_budget=config.get("CHART_BUDGET", 0.25),
+                             snapshot_file=os.path.join(script_dir, config.get("SNAPSHOT_FILE", "last-snapshot.json")))
+
+    # Actions that can be referenced by the jobs in settings.conf
+    actions = {
+        "report": send_report,
+        "ip_check": check_global_ip,
+    }
+
+    # As aggregator, one digest of all hosts can be sent instead of a mail per host
+    if config.get("FLEET_HOSTS"):
+        from src.Fleet.FleetPoller import FleetPoller
+        fleet_poller = FleetPoller(config["FLEET_HOSTS"], config.get("FLEET_TIMEOUT", 5))
+        actions["fleet_digest"] = lambda: mail_sender.send_fleet_digest(fleet_poller)
+
+    # One-shot mode for the systemd timer: no scheduler, no background threads, the process exits right away
+    if args.once:
+        if args.once not in actions:
+            parser.error(f"unknown action '{args.once}', choose from {', '.join(actions)}")
+        sys.exit(run_once(actions[args.once]))
+
+    # Optional watch mode, checks the alert rules between the reports and mails right away
+    if config.get("WATCH_INTERVAL", 0) > 0:
+        from src.Alert.AlertMonitor import AlertMonitor, AlertRule
+        rules = [AlertRule.from_config(name, options, config.get("ALERT_MIN_INTERVAL", 3600))
+                 for name, options in config.get("ALERTS", {}).items()]
+        alert_monitor = AlertMonitor(rules, mail_sender.send_alert, disk_path, config["WATCH_INTERVAL"], ip_resolver)
+        alert_monitor.start()
+
+    # Optional agent, lets a fleet aggregator poll the snapshot of this host
+    if config.get("FLEET_AGENT_PORT", 0) > 0:
+        from src.Fleet.Agent import SnapshotAgent
+        agent = SnapshotAgent(data_collector, disk_path, config.get("FLEET_AGENT_ADDRESS", "0.0.0.0"),
+                              config["FLEET_AGENT_PORT"])
+        agent.start()
+
+    # Optional status endpoint for dashboards, answers from the last refresh held in memory
+    if config.get("STATUS_PORT", 0) > 0:
+        from src.Status.StatusServer import StatusServer
+        status_server = StatusServer(refresh_status, config.get("STATUS_ADDRESS", "127.0.0.1"), config["STATUS_PORT"],
+                                     config.get("STATUS_REFRESH", 60))
+        status_server.start()
+
+    # The ledger records every run so no slot is sent twice and missed slots are caught up
+    ledger = RunLedger(os.path.join(script_dir, config.get("LEDGER_FILE", "run-ledger.log")))
+    scheduler = Scheduler(ledger, config.get("CATCH_UP", "latest"))
+    for name, options in configured_jobs(config).items():
+        # A job that can't be scheduled is left out, the other jobs still run
+        try:
+            job = Job.from_config(name, options, actions)
+            scheduler.add_job(job)
+        except ValueError as e:
+            print(f"Skipping job '{name}':", e)
+            continue
+        print(f"Scheduled job '{name}' ({job.spec!r})")
+
+    # Changes of settings.conf are applied without a restart
+    settings_watcher = SettingsWatcher(config_file, config, apply_settings, config["CONFIG_CHECK_INTERVAL"])
+    settings_watcher.start()
+
+    # systemd stops the service with SIGTERM, exit normally so the metric store is written
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-    # Infinite loop to keep the script running
-    while True:
-        time.sleep(1)  # Debugging output to keep the script running
+    # The scheduler thread sleeps until the next deadline, the main thread just waits for it
+    scheduler.start()
+    try:
+        scheduler.join()
+    finally:
+        if sampler is not None:
+            sampler.stop()
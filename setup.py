@@ -79,7 +79,11 @@ if __name__ == "__main__":
 
     # Service setup
     if operating_system == "Linux" or operating_system == "Raspberry":
-        if not service.check_file_exists("/etc/systemd/system", "info-mail.service"):
+        if "--timer" in sys.argv:
+            # One timer per job starts "main.py --once", no process stays resident between the mails
+            from main import configured_jobs, read_config
+            service.setLinuxTimer(configured_jobs(read_config(os.path.join(script_dir, 'settings.conf'))))
+        elif not service.check_file_exists("/etc/systemd/system", "info-mail.service"):
             service.setLinuxService()
     else:
         print("Service for Windows is not implemented yet, but you can try the mail sending.")
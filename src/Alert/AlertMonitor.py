@@ -0,0 +1,298 @@
+"""
+Continuous threshold checks between the scheduled reports.
+
+Every rule watches one metric. A threshold rule fires once its condition has
+held for a while (debounce) and only clears again once the value is back past
+a separate clear threshold (hysteresis), so a value hovering around the limit
+doesn't flap. A change rule fires whenever the value differs from the last one
+seen. Alert mails of a rule are rate limited, alerts suppressed by the limit
+are counted and mentioned in the next mail.
+"""
+
+import threading
+import time
+
+from ..System.SystemProbe import create_probe
+
+
+class AlertRule:
+    """
+    A threshold or change rule on one metric.
+    """
+
+    OK = "ok"
+    PENDING = "pending"
+    FIRING = "firing"
+
+    def __init__(self, name, metric, above=None, below=None, clear=None, duration=0, changed=False,
+                 min_interval=3600):
+        """
+        Initialize the AlertRule object.
+
+        Args:
+            name (str): Unique name of the rule.
+            metric (str): Name of the watched metric, one of AlertMonitor.METRICS.
+            above (float): Fire when the value is above this threshold.
+            below (float): Fire when the value is below this threshold.
+            clear (float): Value the metric must get back to before the rule clears,
+                           by default the threshold itself.
+            duration (float): Seconds the condition must hold before the rule fires.
+            changed (bool): Fire whenever the value changes, instead of a threshold.
+            min_interval (float): Minimum seconds between two alert mails of this rule.
+
+        Raises:
+            ValueError: If not exactly one of above, below and changed is given.
+        """
+        if sum((above is not None, below is not None, bool(changed))) != 1:
+            raise ValueError(f"Alert '{name}' needs exactly one of 'above', 'below' or 'changed'")
+        self.name = name
+        self.metric = metric
+        self.above = above
+        self.below = below
+        self.changed = bool(changed)
+        if clear is None:
+            clear = above if above is not None else below
+        self.clear = clear
+        self.duration = duration
+        self.min_interval = min_interval
+
+        self.state = self.OK
+        self.since = None
+        self.last_value = None
+        self.last_alert = None
+        self.suppressed = 0
+
+    @classmethod
+    def from_config(cls, name, options, min_interval=3600):
+        """
+        Creates a rule from its settings.conf entry.
+
+        Args:
+            name (str): Name of the rule.
+            options (dict): The rule options: "metric" and one of "above", "below" or "changed",
+                            optionally "clear", "for" (seconds) and "min_interval" (seconds).
+            min_interval (float): Default minimum seconds between two alert mails.
+
+        Returns:
+            AlertRule: The configured rule.
+
+        Raises:
+            ValueError: If the options are invalid, e.g. an unknown metric or a threshold that is no number.
+        """
+        if options.get("metric") not in AlertMonitor.METRICS:
+            raise ValueError(f"Alert '{name}' has an unknown metric '{options.get('metric')}'")
+        for key in ("above", "below", "clear", "for", "min_interval"):
+            value = options.get(key)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise ValueError(f"Alert '{name}': '{key}' must be a number")
+        return cls(name, options["metric"], options.get("above"), options.get("below"), options.get("clear"),
+                   options.get("for", 0), options.get("changed", False), options.get("min_interval", min_interval))
+
+    def _triggered(self, value):
+        if self.above is not None:
+            return value > self.above
+        return value < self.below
+
+    def _cleared(self, value):
+        if self.above is not None:
+            return value <= self.clear
+        return value >= self.clear
+
+    def describe(self, value):
+        """
+        Args:
+            value: The current value of the metric.
+
+        Returns:
+            str: A one-line description of the alert.
+        """
+        if self.changed:
+            return f"{self.name}: {self.metric} changed from {self.last_value} to {value}"
+        limit = f"above {self.above}" if self.above is not None else f"below {self.below}"
+        held = f" for {round(self.duration)}s" if self.duration else ""
+        return f"{self.name}: {self.metric} is {round(value, 2)}, {limit}{held}"
+
+    def evaluate(self, value, now):
+        """
+        Feeds the current value into the rule.
+
+        Args:
+            value: The current value of the metric, None if it could not be read.
+            now (float): Monotonic time of the check.
+
+        Returns:
+            str: The alert description if an alert mail is due, else None.
+        """
+        if value is None:
+            return None
+
+        if self.changed:
+            fire = self.last_value is not None and value != self.last_value
+            description = self.describe(value) if fire else None
+            self.last_value = value
+        else:
+            fire = False
+            if self.state == self.FIRING:
+                if self._cleared(value):
+                    print(f"Alert '{self.name}' cleared at {self.metric} = {round(value, 2)}")
+                    self.state = self.OK
+            elif self._triggered(value):
+                if self.state == self.OK:
+                    self.state = self.PENDING
+                    self.since = now
+                if now - self.since >= self.duration:
+                    self.state = self.FIRING
+                    fire = True
+            else:
+                # The condition broke off before it held long enough
+                self.state = self.OK
+            description = self.describe(value) if fire else None
+
+        if not fire:
+            return None
+        if self.last_alert is not None and now - self.last_alert < self.min_interval:
+            self.suppressed += 1
+            return None
+        if self.suppressed:
+            description += f" ({self.suppressed} earlier alert(s) suppressed by the rate limit)"
+            self.suppressed = 0
+        self.last_alert = now
+        return description
+
+
+class AlertMonitor:
+    """
+    Checks the alert rules in a background thread every few seconds.
+
+    Only the metrics used by the rules are read, and all of them are cheap: a
+    statvfs of the disk, the memory counters, the CPU usage since the previous
+    check and the cached global IP. The CPU time spent per check is measured
+    with the thread's own CPU clock and reported.
+    """
+
+    METRICS = ("disk_free_gb", "disk_percent", "ram_percent", "cpu_percent", "load_1", "global_ip")
+
+    # Print the cost of the checks after this many ticks
+    REPORT_EVERY = 720
+
+    def __init__(self, rules, alert, disk_path, interval=5, ip_resolver=None, probe=None):
+        """
+        Initialize the AlertMonitor object.
+
+        Args:
+            rules (list): The AlertRule objects.
+            alert (callable): Called with the list of alert descriptions and the cost summary
+                              whenever alerts are due.
+            disk_path (str): Path of the disk whose usage is watched.
+            interval (float): Seconds between two checks.
+            ip_resolver (GlobalIPResolver): Resolver the global IP is read from. It is only
+                                            fetched again once the resolver's TTL has expired.
+            probe (PsutilProbe): Backend the values are read with, by default the fastest one available.
+        """
+        self.probe = probe if probe is not None else create_probe()
+        self.rules = list(rules)
+        self.alert = alert
+        self.disk_path = disk_path
+        self.interval = interval
+        self.ip_resolver = ip_resolver
+        self.ticks = 0
+        self.cpu_total = 0.0
+        self.cpu_max = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+        readers = {
+            "disk_free_gb": lambda: self.probe.disk_usage(self.disk_path)[2] / (1024 ** 3),
+            "disk_percent": lambda: self.probe.disk_usage(self.disk_path)[3],
+            "ram_percent": lambda: self.probe.memory()[3],
+            # Measures the CPU usage since the previous check, so it never blocks
+            "cpu_percent": self.probe.cpu_percent,
+            "load_1": self.probe.load_1,
+            "global_ip": self._global_ip,
+        }
+        used = {rule.metric for rule in self.rules}
+        self._readers = {name: reader for name, reader in readers.items() if name in used}
+
+    def _global_ip(self):
+        if self.ip_resolver is None:
+            return None
+        return self.ip_resolver.resolve()
+
+    def read_metrics(self):
+        """
+        Returns:
+            dict: The current value of every metric used by the rules, None if it could not be read.
+        """
+        values = {}
+        for name, reader in self._readers.items():
+            try:
+                values[name] = reader()
+            except Exception as e:
+                print(f"Error reading {name} for the alerts:", e)
+                values[name] = None
+        return values
+
+    def check(self, now=None):
+        """
+        Reads the metrics once and evaluates every rule.
+
+        Args:
+            now (float): Monotonic time of the check, by default the current time.
+
+        Returns:
+            list: The descriptions of the alerts that are due.
+        """
+        start = time.thread_time()
+        now = time.monotonic() if now is None else now
+        values = self.read_metrics()
+        alerts = []
+        for rule in self.rules:
+            description = rule.evaluate(values.get(rule.metric), now)
+            if description is not None:
+                alerts.append(description)
+
+        cost = time.thread_time() - start
+        self.ticks += 1
+        self.cpu_total += cost
+        self.cpu_max = max(self.cpu_max, cost)
+        return alerts
+
+    def cost_summary(self):
+        """
+        Returns:
+            str: The CPU time spent per check as one line.
+        """
+        if self.ticks == 0:
+            return "Alert checks: none yet"
+        return (f"Alert checks: {self.ticks} checks of {len(self.rules)} rule(s), CPU "
+                f"{self.cpu_total / self.ticks * 1000:.3f} ms on average, {self.cpu_max * 1000:.3f} ms at most")
+
+    def _run(self):
+        # Prime the CPU counters, the first value of cpu_percent() is meaningless
+        self.probe.cpu_percent()
+        while not self._stop.wait(self.interval):
+            try:
+                alerts = self.check()
+                if alerts:
+                    self.alert(alerts, self.cost_summary())
+            except Exception as e:
+                print("Error checking the alerts:", e)
+            if self.ticks % self.REPORT_EVERY == 0:
+                print(self.cost_summary())
+
+    def start(self):
+        """
+        Starts the watch thread.
+        """
+        print(f"Watching {len(self.rules)} alert rule(s) every {self.interval}s")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="alert-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the watch thread.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
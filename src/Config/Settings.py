@@ -0,0 +1,460 @@
+"""
+Parsed, validated settings from settings.conf and their reload.
+
+The file keeps its Python syntax, but it is never executed: only assignments
+of literal values (and arithmetic on numbers like 2 * 86400) are accepted.
+Every setting is checked against SCHEMA, so a typo is reported with its line
+instead of crashing the service, and a broken file on reload keeps the
+settings that are in use.
+"""
+
+import ast
+import copy
+import operator
+import os
+import threading
+import time
+from typing import Any, Callable, NamedTuple, Optional, Tuple
+
+from ..Schedule.Scheduler import CronSpec, IntervalSpec, Scheduler
+
+
+class ConfigError(ValueError):
+    """
+    The settings file can't be used. problems holds one line per error.
+    """
+
+    def __init__(self, filename, problems):
+        self.filename = filename
+        self.problems = list(problems)
+        super().__init__(f"{filename}: " + "; ".join(self.problems))
+
+
+_REQUIRED = object()
+
+
+class Setting(NamedTuple):
+    """
+    Type, default and check of one setting.
+
+    live: The running service applies a change without a restart.
+    """
+
+    types: Tuple[type, ...]
+    default: Any = _REQUIRED
+    check: Optional[Callable[[Any], Optional[str]]] = None
+    live: bool = False
+
+
+def _positive(value):
+    return None if value > 0 else "must be greater than 0"
+
+
+def _not_negative(value):
+    return None if value >= 0 else "must not be negative"
+
+
+def _port(value):
+    return None if 0 <= value <= 65535 else "is not a port number"
+
+
+def _between(low, high):
+    def check(value):
+        return None if low <= value <= high else f"must be between {low} and {high}"
+    return check
+
+
+def _one_of(*choices):
+    def check(value):
+        return None if value in choices else f"must be one of {', '.join(map(repr, choices))}"
+    return check
+
+
+# The actions a job can run, fleet_digest only on an aggregator with FLEET_HOSTS
+JOB_ACTIONS = ("report", "ip_check", "fleet_digest")
+
+
+def _check_jobs(jobs):
+    for name, options in jobs.items():
+        if not isinstance(options, dict):
+            return f"job '{name}' must be a dict"
+        try:
+            if "cron" in options:
+                spec = CronSpec(options["cron"])
+            elif "every" in options:
+                spec = IntervalSpec(options["every"])
+            else:
+                return f"job '{name}' needs either 'cron' or 'every'"
+            # A cron like "0 0 31 2 *" parses, but never runs
+            spec.next_after(time.time())
+        except (ValueError, TypeError) as e:
+            return f"job '{name}': {e}"
+        if options.get("action", "report") not in JOB_ACTIONS:
+            return f"job '{name}' has an unknown action '{options['action']}'"
+        if options.get("catch_up", "latest") not in Scheduler.CATCH_UP_POLICIES:
+            return f"job '{name}' has an unknown catch-up policy '{options['catch_up']}'"
+    return None
+
+
+def _check_alerts(alerts):
+    # Imported here, the alert rules are only needed with alerts configured
+    from ..Alert.AlertMonitor import AlertRule
+    for name, options in alerts.items():
+        if not isinstance(options, dict):
+            return f"rule '{name}' must be a dict"
+        try:
+            AlertRule.from_config(name, options)
+        except (ValueError, TypeError) as e:
+            return str(e)
+    return None
+
+
+_NUMBER = (int, float)
+
+SCHEMA = {
+    # Schedule
+    "JOBS": Setting((dict, type(None)), None, _check_jobs, live=True),
+    "SEND_HOUR": Setting((int,), None, _between(0, 23)),
+    "SEND_MINUTE": Setting((int,), None, _between(0, 59)),
+    "CATCH_UP": Setting((str,), "latest", _one_of(*Scheduler.CATCH_UP_POLICIES), live=True),
+    "LEDGER_FILE": Setting((str,), "run-ledger.log"),
+    # Email
+    "SENDER_MAIL": Setting((str,), live=True),
+    "SENDER_PASSWORD": Setting((str,), live=True),
+    "RECEIVER_MAIL": Setting((str,), live=True),
+    "SMTP_SERVER_ADDRESS": Setting((str,), live=True),
+    "SMTP_SERVER_PORT": Setting((int,), check=_port, live=True),
+    "SMTP_SECURITY": Setting((str,), "ssl", _one_of("ssl", "starttls", "none"), live=True),
+    "SMTP_IDLE_TIMEOUT": Setting(_NUMBER, 60, _not_negative, live=True),
+    # Spool
+    "SPOOL_DIR": Setting((str,), "spool"),
+    "SPOOL_RETRY_BASE": Setting(_NUMBER, 30, _positive, live=True),
+    "SPOOL_RETRY_MAX": Setting(_NUMBER, 3600, _positive, live=True),
+    "SPOOL_MAX_AGE": Setting(_NUMBER, 2 * 86400, _positive, live=True),
+    # Raspberry
+    "PI_EXTERNAL": Setting((bool,), live=True),
+    "PI_EXTERNAL_PORT": Setting((int,), check=_port, live=True),
+    "PI_LOCAL_PORT": Setting((int,), check=_port, live=True),
+    "PI_USER": Setting((str,), live=True),
+    # Drive
+    "DISK_PATH": Setting((str,), "auto"),
+    # Collection
+    "COLLECT_TIMEOUT": Setting(_NUMBER, 5, _positive, live=True),
+    "COLLECT_DEADLINE": Setting(_NUMBER, 10, _positive, live=True),
+    "DISK_TIMEOUT": Setting(_NUMBER, 2, _positive, live=True),
+    "TOP_PROCESSES": Setting((int,), 5, _not_negative),
+    "PROCESS_SCAN_BUDGET": Setting(_NUMBER, 0.5, _positive, live=True),
+    # Global IP
+    "GLOBAL_IP_PROVIDERS": Setting((list, type(None)), None),
+    "GLOBAL_IP_TTL": Setting(_NUMBER, 3600, _not_negative, live=True),
+    "GLOBAL_IP_CACHE": Setting((str,), "global-ip.json"),
+    "GLOBAL_IP_CLIENT": Setting((str,), "auto", _one_of("auto", "http.client", "requests")),
+    # Metric sampling and history
+    "SAMPLER_INTERVAL": Setting(_NUMBER, 0, _not_negative),
+    "SAMPLER_WINDOW": Setting((int,), 360, _positive),
+    "METRIC_STORE_DIR": Setting((str,), "metrics"),
+    "METRIC_STORE_FLUSH": Setting(_NUMBER, 600, _positive),
+    "METRIC_RETENTION_DAYS": Setting((dict, type(None)), None),
+    "CHART_BUDGET": Setting(_NUMBER, 0.25, _positive, live=True),
+    "SNAPSHOT_FILE": Setting((str,), "last-snapshot.json"),
+    # Alerts
+    "WATCH_INTERVAL": Setting(_NUMBER, 0, _not_negative),
+    "ALERTS": Setting((dict,), {}, _check_alerts),
+    "ALERT_MIN_INTERVAL": Setting(_NUMBER, 3600, _not_negative),
+    # Status endpoint
+    "STATUS_PORT": Setting((int,), 0, _port),
+    "STATUS_ADDRESS": Setting((str,), "127.0.0.1"),
+    "STATUS_REFRESH": Setting(_NUMBER, 60, _positive),
+    # Fleet
+    "FLEET_AGENT_PORT": Setting((int,), 0, _port),
+    "FLEET_AGENT_ADDRESS": Setting((str,), "0.0.0.0"),
+    "FLEET_HOSTS": Setting((dict,), {}),
+    "FLEET_TIMEOUT": Setting(_NUMBER, 5, _positive),
+    # Instrumentation
+    "INSTRUMENTATION": Setting((bool,), False),
+    "INSTRUMENTATION_LOG": Setting((str, type(None)), ""),
+    "PROMETHEUS_TEXTFILE": Setting((str, type(None)), ""),
+    "PROFILE_DIR": Setting((str,), "profiles"),
+    # Settings reload
+    "CONFIG_CHECK_INTERVAL": Setting(_NUMBER, 0, _not_negative),
+}
+
+_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+}
+
+
+def _literal(node):
+    """
+    Evaluates a literal value, allowing arithmetic on numbers.
+
+    Raises:
+        ValueError: If the expression is anything else, like a name or a call.
+    """
+    if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+        left, right = _literal(node.left), _literal(node.right)
+        if isinstance(left, _NUMBER) and isinstance(right, _NUMBER) and not isinstance(left, bool) \
+                and not isinstance(right, bool):
+            return _OPERATORS[type(node.op)](left, right)
+        raise ValueError("arithmetic is only allowed on numbers")
+    return ast.literal_eval(node)
+
+
+def _type_names(types):
+    return " or ".join("None" if kind is type(None) else kind.__name__ for kind in types)
+
+
+class Settings:
+    """
+    The validated settings of one version of settings.conf.
+
+    Reads like the dict the file used to be executed into (settings["SMTP_SERVER_PORT"],
+    settings.get(...)) and also by attribute (settings.SMTP_SERVER_PORT). Settings missing
+    in the file have their default from SCHEMA.
+    """
+
+    def __init__(self, values, stamp=None):
+        self._values = values
+        self.stamp = stamp
+
+    @classmethod
+    def parse(cls, text, filename="settings.conf", stamp=None):
+        """
+        Parses the text of a settings file.
+
+        Args:
+            text (str): The file content.
+            filename (str): Name used in the error messages.
+            stamp (tuple): Identifies the file version the text was read from.
+
+        Returns:
+            Settings: The settings.
+
+        Raises:
+            ConfigError: With every problem found in the file.
+        """
+        try:
+            tree = ast.parse(text, filename)
+        except SyntaxError as e:
+            raise ConfigError(filename, [f"line {e.lineno}: {e.msg}"])
+
+        problems = []
+        values = {}
+        # Names assigned in the file, a rejected value is reported once and not as missing as well
+        assigned = set()
+        for statement in tree.body:
+            if isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Constant):
+                # A bare string, used as comment
+                continue
+            if not (isinstance(statement, ast.Assign) and len(statement.targets) == 1
+                    and isinstance(statement.targets[0], ast.Name)):
+                problems.append(f"line {statement.lineno}: only 'NAME = value' assignments are allowed")
+                continue
+            name = statement.targets[0].id
+            assigned.add(name)
+            try:
+                value = _literal(statement.value)
+            except (ValueError, TypeError, SyntaxError, ArithmeticError):
+                problems.append(f"line {statement.lineno}: {name} must be a plain value "
+                                f"(number, string, True/False/None, list or dict)")
+                continue
+
+            setting = SCHEMA.get(name)
+            if setting is None:
+                # Unknown names don't stop the service, but are most likely typos
+                print(f"{filename}, line {statement.lineno}: unknown setting {name} is ignored")
+                continue
+            if isinstance(value, bool) and bool not in setting.types:
+                problems.append(f"line {statement.lineno}: {name} must be {_type_names(setting.types)}, "
+                                f"not {value!r}")
+                continue
+            if not isinstance(value, setting.types):
+                problems.append(f"line {statement.lineno}: {name} must be {_type_names(setting.types)}, "
+                                f"not {type(value).__name__}")
+                continue
+            if setting.check is not None and value is not None:
+                error = setting.check(value)
+                if error:
+                    problems.append(f"line {statement.lineno}: {name} {error}")
+                    continue
+            values[name] = value
+
+        missing = [name for name, setting in SCHEMA.items() if setting.default is _REQUIRED and name not in assigned]
+        problems += [f"{name} is missing" for name in missing]
+        jobs_rejected = "JOBS" in assigned and "JOBS" not in values
+        if values.get("JOBS") is None and not jobs_rejected \
+                and ("SEND_HOUR" not in assigned or "SEND_MINUTE" not in assigned):
+            problems.append("JOBS is missing")
+        fleet_jobs = [name for name, options in (values.get("JOBS") or {}).items()
+                      if isinstance(options, dict) and options.get("action") == "fleet_digest"]
+        if fleet_jobs and not values.get("FLEET_HOSTS"):
+            problems.append(f"JOBS: the action 'fleet_digest' of {', '.join(fleet_jobs)} needs FLEET_HOSTS")
+        if problems:
+            raise ConfigError(filename, problems)
+
+        for name, setting in SCHEMA.items():
+            if name not in values:
+                # Copied, so no version of the settings can change the defaults of another
+                values[name] = copy.deepcopy(setting.default)
+        return cls(values, stamp)
+
+    def __getitem__(self, name):
+        return self._values[name]
+
+    def __contains__(self, name):
+        return name in self._values
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __getattr__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def get(self, name, default=None):
+        value = self._values.get(name)
+        return default if value is None else value
+
+    def changed(self, other):
+        """
+        Args:
+            other (Settings): An earlier version.
+
+        Returns:
+            set: The names of the settings whose value differs.
+        """
+        return {name for name in self._values.keys() | other._values.keys()
+                if self._values.get(name) != other._values.get(name)}
+
+
+def file_stamp(filename):
+    """
+    Returns:
+        tuple: Modification time, size and inode of the file, which change with every write.
+    """
+    status = os.stat(filename)
+    return status.st_mtime_ns, status.st_size, status.st_ino
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def load_settings(filename):
+    """
+    Loads a settings file. The parsed settings are cached until the file changes.
+
+    Args:
+        filename (str): Path of settings.conf.
+
+    Returns:
+        Settings: The settings.
+
+    Raises:
+        ConfigError: If the file has errors.
+        OSError: If the file can't be read.
+    """
+    stamp = file_stamp(filename)
+    with _cache_lock:
+        cached = _cache.get(filename)
+        if cached is not None and cached.stamp == stamp:
+            return cached
+    with open(filename, "r", encoding="utf-8") as file:
+        settings = Settings.parse(file.read(), filename, stamp)
+    with _cache_lock:
+        _cache[filename] = settings
+    return settings
+
+
+class SettingsWatcher:
+    """
+    Reloads settings.conf when it changes and hands the new settings to a callback.
+
+    Changes are noticed by comparing the stamp of the file every interval seconds,
+    one stat() call, or right away after check_now() (e.g. from a SIGHUP handler).
+    A file with errors is reported once and the settings in use are kept.
+    """
+
+    def __init__(self, filename, settings, apply, interval=5):
+        """
+        Initialize the SettingsWatcher object.
+
+        Args:
+            filename (str): Path of settings.conf.
+            settings (Settings): The settings in use.
+            apply (callable): Called with the old and the new Settings after a change.
+            interval (float): Seconds between two checks of the file, 0 to only check on check_now().
+        """
+        self.filename = filename
+        self.settings = settings
+        self.apply = apply
+        self.interval = interval
+        self._rejected_stamp = None
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def check(self):
+        """
+        Reloads the file if it changed since the last check.
+
+        Returns:
+            bool: True if new settings were applied.
+        """
+        try:
+            stamp = file_stamp(self.filename)
+        except OSError as e:
+            print("Error checking the settings file:", e)
+            return False
+        if stamp == self.settings.stamp or stamp == self._rejected_stamp:
+            return False
+
+        try:
+            settings = load_settings(self.filename)
+        except (ConfigError, OSError) as e:
+            self._rejected_stamp = stamp
+            print("The changed settings file has errors, keeping the current settings:")
+            for problem in getattr(e, "problems", [str(e)]):
+                print("  " + problem)
+            return False
+
+        old, self.settings = self.settings, settings
+        try:
+            self.apply(old, settings)
+        except Exception as e:
+            print("Error applying the changed settings:", e)
+            return False
+        return True
+
+    def check_now(self):
+        """
+        Makes the watcher thread check the file right away. Safe to call from a signal handler.
+        """
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.interval or None)
+            self._wakeup.clear()
+            if not self._stopped:
+                self.check()
+
+    def start(self):
+        """
+        Starts watching in a background thread.
+        """
+        self._thread = threading.Thread(target=self._run, name="settings-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops watching.
+        """
+        self._stopped = True
+        self._wakeup.set()
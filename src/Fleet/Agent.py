@@ -0,0 +1,103 @@
+"""
+Agent that exposes the snapshot of this host to a fleet aggregator over HTTP.
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _AgentHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection open, so the aggregator can reuse it for the next poll
+    protocol_version = "HTTP/1.1"
+    # Idle connections are closed after this many seconds
+    timeout = 120
+
+    def do_GET(self):
+        if self.path != "/snapshot":
+            self.send_error(404)
+            return
+        try:
+            body = self.server.agent.snapshot_json()
+        except Exception as e:
+            print("Error collecting the snapshot for the aggregator:", e)
+            self.send_error(503)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Polls are frequent, don't print a line for every request
+        pass
+
+
+class SnapshotAgent:
+    """
+    Serves the current snapshot of this host as JSON on GET /snapshot.
+
+    A snapshot not older than max_age seconds, whichever thread collected it
+    (usually a scheduled report or the status endpoint), is served as it is.
+    Otherwise the agent collects one itself, within deadline seconds, which
+    stays below the default timeout of the aggregator.
+    """
+
+    def __init__(self, data_collector, disk_path, host="0.0.0.0", port=8765, max_age=10, deadline=3):
+        """
+        Initialize the SnapshotAgent object.
+
+        Args:
+            data_collector (DataCollector): The collector the snapshots are taken with.
+            disk_path (str): The path to the disk to collect information from.
+            host (str): Address to listen on.
+            port (int): Port to listen on, 0 for any free port.
+            max_age (float): Seconds a collected snapshot is served before a new one is collected.
+            deadline (float): Maximum seconds for a collection of the agent itself.
+        """
+        self.data_collector = data_collector
+        self.disk_path = disk_path
+        self.max_age = max_age
+        self.deadline = deadline
+        self._body = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer((host, port), _AgentHandler)
+        self.server.daemon_threads = True
+        self.server.agent = self
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def snapshot_json(self):
+        """
+        Returns:
+            bytes: The current snapshot as JSON, collected again once it is older than max_age.
+        """
+        with self._lock:
+            snapshot, collected_at = self.data_collector.latest_snapshot
+            if snapshot is None or time.monotonic() - collected_at >= self.max_age:
+                snapshot = self.data_collector.collect(self.disk_path, self.deadline)["snapshot"]
+            if snapshot is not self._snapshot:
+                self._body = snapshot.to_json().encode("utf-8")
+                self._snapshot = snapshot
+            return self._body
+
+    def start(self):
+        """
+        Starts serving in a background thread.
+        """
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fleet-agent", daemon=True)
+        self._thread.start()
+        print(f"Fleet agent listening on port {self.port}")
+
+    def stop(self):
+        """
+        Stops serving and closes the socket.
+        """
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,151 @@
+"""
+Concurrent polling of the snapshot agents of a fleet.
+"""
+
+import asyncio
+import time
+from typing import NamedTuple, Optional
+
+from ..System.Snapshot import Snapshot
+
+
+class FleetResult(NamedTuple):
+    """
+    The outcome of polling one host.
+    """
+
+    name: str
+    address: str
+    snapshot: Optional[Snapshot]
+    error: Optional[str]
+    elapsed: float
+
+
+class FleetPoller:
+    """
+    Polls the agents of all hosts at once with asyncio.
+
+    Every host has its own timeout, so a slow or unreachable host only delays
+    the digest by that timeout. The HTTP/1.1 connection to every agent is kept
+    open in a persistent event loop and reused by the next poll; if the agent
+    has closed it in between, it is opened again.
+    """
+
+    def __init__(self, hosts, timeout=5):
+        """
+        Initialize the FleetPoller object.
+
+        Args:
+            hosts (dict): Maps host names to the "address:port" of their agents.
+            timeout (float): Seconds to wait for every single host.
+        """
+        self.hosts = dict(hosts)
+        self.timeout = timeout
+        self._connections = {}
+        self._loop = asyncio.new_event_loop()
+
+    @staticmethod
+    def _split_address(address):
+        host, _, port = address.rpartition(":")
+        return host.strip("[]"), int(port)
+
+    async def _connection(self, name, address):
+        """
+        Returns:
+            tuple: The open (reader, writer) of the host and whether it was reused.
+        """
+        connection = self._connections.get(name)
+        if connection is not None and not connection[1].is_closing():
+            return connection, True
+        host, port = self._split_address(address)
+        connection = self._connections[name] = await asyncio.open_connection(host, port)
+        return connection, False
+
+    def _drop(self, name):
+        connection = self._connections.pop(name, None)
+        if connection is not None:
+            connection[1].close()
+
+    @staticmethod
+    async def _get(reader, writer, host):
+        """
+        Sends GET /snapshot and reads the response.
+
+        Returns:
+            bytes: The response body.
+
+        Raises:
+            ConnectionError: If the agent closed the connection.
+            ValueError: If the response is not a successful HTTP response.
+        """
+        writer.write(f"GET /snapshot HTTP/1.1\r\nHost: {host}\r\nAccept: application/json\r\n\r\n".encode("ascii"))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by the agent")
+        parts = status_line.split(None, 2)
+        if len(parts) < 2 or parts[1] != b"200":
+            raise ValueError(f"Unexpected response: {status_line.decode('latin-1').strip()}")
+
+        length = None
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.partition(b":")
+            if key.strip().lower() == b"content-length":
+                length = int(value)
+        if length is None:
+            raise ValueError("Response without Content-Length")
+        return await reader.readexactly(length)
+
+    async def _request(self, name, address):
+        (reader, writer), reused = await self._connection(name, address)
+        try:
+            body = await self._get(reader, writer, address)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self._drop(name)
+            if not reused:
+                raise
+            # The agent closed the kept connection in between, open a new one
+            (reader, writer), _ = await self._connection(name, address)
+            body = await self._get(reader, writer, address)
+        return Snapshot.from_json(body.decode("utf-8"))
+
+    async def _poll_host(self, name, address):
+        start = time.monotonic()
+        try:
+            snapshot = await asyncio.wait_for(self._request(name, address), self.timeout)
+        except asyncio.TimeoutError:
+            self._drop(name)
+            return FleetResult(name, address, None, f"timed out after {self.timeout}s", time.monotonic() - start)
+        except Exception as e:
+            self._drop(name)
+            return FleetResult(name, address, None, str(e) or type(e).__name__, time.monotonic() - start)
+        return FleetResult(name, address, snapshot, None, time.monotonic() - start)
+
+    async def _poll_all(self):
+        return await asyncio.gather(*(self._poll_host(name, address) for name, address in self.hosts.items()))
+
+    def poll(self):
+        """
+        Polls all hosts concurrently.
+
+        Returns:
+            list: A FleetResult per host, in the order of the hosts.
+        """
+        start = time.monotonic()
+        results = self._loop.run_until_complete(self._poll_all())
+        failed = sum(1 for result in results if result.snapshot is None)
+        print(f"Polled {len(results)} host(s) in {time.monotonic() - start:.2f}s, {failed} failed")
+        return results
+
+    def close(self):
+        """
+        Closes all connections and the event loop.
+        """
+        for name in list(self._connections):
+            self._drop(name)
+        self._loop.run_until_complete(asyncio.sleep(0))
+        self._loop.close()
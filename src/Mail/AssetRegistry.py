@@ -0,0 +1,54 @@
+"""
+Cache of the MIME parts for the image assets of the mails.
+"""
+
+import os
+import threading
+
+
+class AssetRegistry:
+    """
+    Loads every image asset once and keeps its base64-encoded MIME part ready to attach.
+
+    A part is only rebuilt when the modification time of its file changes. The
+    cached parts are shared by all messages and must not be modified.
+    """
+
+    def __init__(self, asset_dir):
+        """
+        Initialize the AssetRegistry object.
+
+        Args:
+            asset_dir (str): Directory containing the assets.
+        """
+        self.asset_dir = asset_dir
+        self._parts = {}
+        self._lock = threading.Lock()
+
+    def image_part(self, name, content_id):
+        """
+        Returns the MIME part of an image.
+
+        Args:
+            name (str): File name of the image in the asset directory.
+            content_id (str): Content-ID used to reference the image from the HTML ("cid:...").
+
+        Returns:
+            MIMEImage: The cached part.
+        """
+        path = os.path.join(self.asset_dir, name)
+        mtime = os.stat(path).st_mtime_ns
+        key = (name, content_id)
+
+        with self._lock:
+            cached = self._parts.get(key)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+
+            from email.mime.image import MIMEImage
+            with open(path, 'rb') as file:
+                # The base64 encoding happens here, once per file version
+                image = MIMEImage(file.read())
+            image.add_header('Content-ID', f'<{content_id}>')
+            self._parts[key] = (mtime, image)
+            return image
@@ -1,34 +1,34 @@
+import functools
+
+from ..Telemetry.Instrumentation import instrumentation
+from .Template import Template, read_template_file
+
+
 class HTMLBuilder:
-    def __init__(self):
-        self.styles = ""
-        self.body_content = ""
+    """Setzt die Berichte aus den einmal kompilierten Vorlagen zusammen, ohne eigenen Zustand."""
 
-    def add_style(self, style):
-        """Fügt dem HTML-Stil-Block einen neuen Stil hinzu."""
-        self.styles += style
+    @staticmethod
+    def layout(styles, body):
+        """Setzt Stile und Inhalt in das Grundgerüst des HTML-Dokuments ein."""
+        return (read_template_file("base.html")
+                .replace("[[ styles ]]", styles)
+                .replace("[[ body ]]", body))
 
-    def add_body_content(self, content):
-        """Fügt dem HTML-Baum Inhalt hinzu."""
-        self.body_content += content
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def report_template(name):
+        """
+        Kompiliert die Berichtsvorlage eines Systems einmal pro Prozess.
 
-    def get_html(self):
-        """Gibt das vollständige HTML-Dokument zurück."""
-        html_template = f"""
-        <!DOCTYPE html>
-        <html lang="de">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Resparry Pi Informationen</title>
-            <style>
-                /* Allgemeine Stile */
-                {self.styles}
-            </style>
-        </head>
-        <body>
-            <!-- Hauptcontainer -->
-            {self.body_content}
-        </body>
-        </html>
+        Grundgerüst, Standardstile, Systemstile und Inhalt werden zu einer Vorlage zusammengefügt.
         """
-        return html_template
+        styles = read_template_file("default.css") + read_template_file(f"{name}.css")
+        return Template(HTMLBuilder.layout(styles, read_template_file(f"{name}.html")))
+
+    def render(self, name, context):
+        """Gibt den fertigen Bericht eines Systems zurück, ohne den Zustand des Builders zu verändern."""
+        with instrumentation.stage(f"render.{name}") as stage:
+            html = self.report_template(name).render(context)
+            # Zeichen statt Bytes, der Bericht ist fast reines ASCII
+            stage.bytes = len(html)
+        return html
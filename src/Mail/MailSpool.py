@@ -0,0 +1,366 @@
+"""
+Durable on-disk spool for outgoing mails and the worker that delivers them.
+"""
+
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from email.generator import BytesGenerator
+
+from ..Telemetry.Instrumentation import instrumentation
+
+
+class SpoolEntry:
+    """
+    A spooled mail. Its delivery state is encoded in the file name,
+    "<created>_<id>_<attempts>_<next_try>.eml", so retries only rename the file.
+    """
+
+    def __init__(self, created, entry_id, attempts, next_try):
+        self.created = created
+        self.id = entry_id
+        self.attempts = attempts
+        self.next_try = next_try
+
+    @property
+    def filename(self):
+        return f"{self.created}_{self.id}_{self.attempts}_{self.next_try}.eml"
+
+    @classmethod
+    def parse(cls, filename):
+        """
+        Args:
+            filename (str): Name of a spool file.
+
+        Returns:
+            SpoolEntry: The entry, or None if the name is not a spool file name.
+        """
+        if not filename.endswith(".eml"):
+            return None
+        parts = filename[:-4].split("_")
+        if len(parts) != 4:
+            return None
+        try:
+            return cls(int(parts[0]), parts[1], int(parts[2]), int(parts[3]))
+        except ValueError:
+            return None
+
+
+class MailSpool:
+    """
+    Maildir-like spool directory.
+
+    Mails are written to tmp/, fsync'd and then renamed into new/, so a mail in
+    new/ is always complete. Mails that can't be delivered end up in dead/.
+    Every file starts with one JSON line holding the envelope, followed by the
+    serialized message with CRLF line endings.
+    """
+
+    # Files in tmp/ older than this many seconds are left over from an interrupted write
+    STALE_TMP_AGE = 3600
+
+    def __init__(self, directory):
+        """
+        Initialize the MailSpool object, create its directories and remove stale temporary files.
+
+        Args:
+            directory (str): Path of the spool directory.
+        """
+        self.directory = directory
+        self.tmp_dir = os.path.join(directory, "tmp")
+        self.new_dir = os.path.join(directory, "new")
+        self.dead_dir = os.path.join(directory, "dead")
+        for path in (self.tmp_dir, self.new_dir, self.dead_dir):
+            os.makedirs(path, exist_ok=True)
+        self._added = threading.Event()
+        self.remove_stale_tmp()
+
+    def remove_stale_tmp(self):
+        """
+        Removes the files an interrupted enqueue() left in tmp/. Recent files are kept,
+        another process may still be writing them.
+
+        Returns:
+            int: The number of files removed.
+        """
+        count = 0
+        now = time.time()
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            try:
+                if now - os.stat(path).st_mtime > self.STALE_TMP_AGE:
+                    os.remove(path)
+                    count += 1
+            except OSError as e:
+                print(f"Error removing the stale spool file {name}:", e)
+        if count:
+            print(f"Removed {count} incomplete mail(s) from the spool")
+        return count
+
+    def enqueue(self, message, from_addr, to_addrs):
+        """
+        Serializes a message into the spool. Never touches the network.
+
+        Args:
+            message (email.message.Message): The message.
+            from_addr (str): Envelope sender.
+            to_addrs (str | list): Envelope recipient(s).
+
+        Returns:
+            str: The id of the spooled mail.
+        """
+        if isinstance(to_addrs, str):
+            to_addrs = [to_addrs]
+        now = int(time.time())
+        entry = SpoolEntry(now, uuid.uuid4().hex, 0, now)
+
+        tmp_path = os.path.join(self.tmp_dir, entry.filename)
+        with instrumentation.stage("spool.serialize") as stage, open(tmp_path, "wb") as file:
+            file.write(json.dumps({"from": from_addr, "to": to_addrs}).encode("utf-8") + b"\n")
+            BytesGenerator(file, policy=message.policy.clone(linesep="\r\n")).flatten(message)
+            file.flush()
+            os.fsync(file.fileno())
+            stage.bytes = file.tell()
+        os.replace(tmp_path, os.path.join(self.new_dir, entry.filename))
+
+        self._added.set()
+        return entry.id
+
+    def pending(self):
+        """
+        Returns:
+            list: All entries waiting for delivery, oldest first.
+        """
+        entries = (SpoolEntry.parse(name) for name in os.listdir(self.new_dir))
+        return sorted((entry for entry in entries if entry is not None), key=lambda entry: entry.created)
+
+    def open(self, entry):
+        """
+        Opens a spooled mail for streaming it to the server.
+
+        Args:
+            entry (SpoolEntry): The entry.
+
+        Returns:
+            tuple: The envelope sender, the list of recipients and the open binary file,
+                   positioned at the start of the message. The caller closes the file.
+        """
+        file = open(os.path.join(self.new_dir, entry.filename), "rb")
+        try:
+            envelope = json.loads(file.readline())
+        except ValueError:
+            file.close()
+            raise
+        return envelope["from"], envelope["to"], file
+
+    def remove(self, entry):
+        """
+        Removes a delivered mail.
+        """
+        os.remove(os.path.join(self.new_dir, entry.filename))
+
+    def reschedule(self, entry, next_try):
+        """
+        Records a failed attempt and the time of the next one.
+
+        Args:
+            entry (SpoolEntry): The entry, updated in place.
+            next_try (float): Unix time of the next attempt.
+        """
+        old_path = os.path.join(self.new_dir, entry.filename)
+        entry.attempts += 1
+        entry.next_try = math.ceil(next_try)
+        os.replace(old_path, os.path.join(self.new_dir, entry.filename))
+
+    def bury(self, entry):
+        """
+        Moves a mail that can't be delivered to the dead-letter directory.
+        """
+        os.replace(os.path.join(self.new_dir, entry.filename), os.path.join(self.dead_dir, entry.filename))
+
+    def replay_dead(self):
+        """
+        Moves all dead letters back into the spool for another round of delivery attempts.
+
+        Returns:
+            int: The number of mails moved back.
+        """
+        count = 0
+        now = int(time.time())
+        for name in os.listdir(self.dead_dir):
+            entry = SpoolEntry.parse(name)
+            if entry is None:
+                continue
+            # The age restarts as well, otherwise the mail would be buried again right away
+            replayed = SpoolEntry(now, entry.id, 0, now)
+            os.replace(os.path.join(self.dead_dir, name), os.path.join(self.new_dir, replayed.filename))
+            count += 1
+        if count:
+            self._added.set()
+        return count
+
+    def wait(self, timeout):
+        """
+        Blocks until a mail is added or the timeout expires.
+
+        Args:
+            timeout (float): Seconds to wait, None to wait forever.
+        """
+        self._added.wait(timeout)
+        self._added.clear()
+
+    def wake(self):
+        """
+        Wakes up a waiting worker.
+        """
+        self._added.set()
+
+
+class DeliveryWorker:
+    """
+    Delivers the spooled mails in a background thread.
+
+    Failed deliveries are retried with exponential backoff and jitter. Mails
+    older than max_age or rejected permanently by the server (5xx) are moved to
+    the dead-letter directory. Between deliveries the thread sleeps until the
+    next retry is due, or until a new mail is spooled.
+    """
+
+    def __init__(self, spool, smtp_session, retry_base=30, retry_max=3600, max_age=2 * 86400):
+        """
+        Initialize the DeliveryWorker object.
+
+        Args:
+            spool (MailSpool): The spool to drain.
+            smtp_session (SMTPSession): The session used for delivery.
+            retry_base (float): Delay in seconds before the first retry.
+            retry_max (float): Maximum delay in seconds between two retries.
+            max_age (float): Seconds after which an undelivered mail is given up.
+        """
+        self.spool = spool
+        self.smtp_session = smtp_session
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.max_age = max_age
+        self._stopped = False
+        self._thread = None
+
+    def retry_delay(self, attempts):
+        """
+        Args:
+            attempts (int): Number of failed attempts so far.
+
+        Returns:
+            float: Seconds until the next attempt, between half and the full backoff.
+        """
+        delay = min(self.retry_max, self.retry_base * 2 ** min(attempts, 32))
+        return random.uniform(delay / 2, delay)
+
+    @staticmethod
+    def is_permanent(error):
+        """
+        Args:
+            error (Exception): The delivery error.
+
+        Returns:
+            bool: True if retrying can't help, because the server rejected the mail.
+        """
+        import smtplib
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            return all(code >= 500 for code, _ in error.recipients.values())
+        if isinstance(error, smtplib.SMTPAuthenticationError):
+            # Wrong credentials may be fixed in the meantime, keep retrying until max_age
+            return False
+        return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+    @staticmethod
+    def is_server_down(error):
+        """
+        Args:
+            error (Exception): The delivery error of a mail that is retried.
+
+        Returns:
+            bool: True if the server can't take any mail right now, so the other mails wait too.
+                  A temporary rejection (4xx) of one mail only delays that mail.
+        """
+        import smtplib
+        if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError,
+                              smtplib.SMTPAuthenticationError)):
+            return True
+        # SMTPException is an OSError as well, only errors of the connection itself count
+        return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+    def deliver_due(self):
+        """
+        Delivers all mails whose next attempt is due.
+
+        Returns:
+            float: Seconds until the next retry is due, or None if the spool is empty.
+        """
+        now = time.time()
+        next_due = None
+        server_down = False
+        for entry in self.spool.pending():
+            if now - entry.created > self.max_age:
+                print(f"Giving up mail {entry.id} after {entry.attempts} attempts")
+                self.spool.bury(entry)
+                continue
+            if server_down:
+                # Due mails wait for the retry of the mail that just failed
+                continue
+            if entry.next_try > now:
+                next_due = entry.next_try if next_due is None else min(next_due, entry.next_try)
+                continue
+
+            try:
+                from_addr, to_addrs, file = self.spool.open(entry)
+                with file:
+                    self.smtp_session.send_many([(file, from_addr, to_addrs)])
+            except Exception as e:
+                if self.is_permanent(e):
+                    print(f"Mail {entry.id} was rejected, moving it to the dead letters:", e)
+                    self.spool.bury(entry)
+                    continue
+                next_try = now + self.retry_delay(entry.attempts)
+                print(f"Delivery of mail {entry.id} failed, retrying at {time.ctime(next_try)}:", e)
+                self.spool.reschedule(entry, next_try)
+                next_due = entry.next_try if next_due is None else min(next_due, entry.next_try)
+                if self.is_server_down(e):
+                    # The server is unreachable, don't try the other mails now
+                    server_down = True
+                continue
+
+            self.spool.remove(entry)
+            print(f"Mail {entry.id} delivered")
+
+        return None if next_due is None else max(0.0, next_due - time.time())
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                timeout = self.deliver_due()
+            except Exception as e:
+                print("Error delivering spooled mails:", e)
+                timeout = self.retry_base
+            self.spool.wait(timeout)
+
+    def start(self):
+        """
+        Starts the delivery thread. Mails left in the spool by an earlier run are delivered first.
+        """
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="mail-delivery", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the delivery thread after the current delivery.
+        """
+        self._stopped = True
+        self.spool.wake()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,433 @@
+"""
+Reusable, authenticated SMTP connection.
+"""
+
+import functools
+import socket
+import threading
+import time
+
+from ..Telemetry.Instrumentation import instrumentation
+
+
+@functools.lru_cache(maxsize=None)
+def default_ssl_context():
+    """
+    Creates the SSL context once per process, loading the CA certificates is expensive.
+
+    Returns:
+        ssl.SSLContext: The shared default context.
+    """
+    import ssl
+    return ssl.create_default_context()
+
+
+@functools.lru_cache(maxsize=None)
+def _timed_smtp_classes():
+    """
+    Defines the connection classes on the first connect, so importing this module doesn't load smtplib and ssl.
+
+    Returns:
+        tuple: The plain and the SSL connection class.
+    """
+    import smtplib
+
+    class _TimedSMTP(smtplib.SMTP):
+        """
+        SMTP connection that records how long the TCP connect takes.
+        """
+
+        def __init__(self, timings, **kwargs):
+            self.timings = timings
+            super().__init__(**kwargs)
+
+        def _get_socket(self, host, port, timeout):
+            start = time.perf_counter()
+            sock = socket.create_connection((host, port), timeout, self.source_address)
+            self.timings["connect"] = time.perf_counter() - start
+            return sock
+
+    class _TimedSMTP_SSL(smtplib.SMTP_SSL):
+        """
+        SMTP over SSL connection that records the TCP connect and the TLS handshake separately.
+        """
+
+        def __init__(self, timings, **kwargs):
+            self.timings = timings
+            super().__init__(**kwargs)
+
+        def _get_socket(self, host, port, timeout):
+            start = time.perf_counter()
+            sock = socket.create_connection((host, port), timeout, self.source_address)
+            self.timings["connect"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            sock = self.context.wrap_socket(sock, server_hostname=self._host)
+            self.timings["tls"] = time.perf_counter() - start
+            return sock
+
+    return _TimedSMTP, _TimedSMTP_SSL
+
+
+class _DataWriter:
+    """
+    File-like target for the generator that streams the DATA phase to the server socket.
+
+    Lines starting with a dot are dot-stuffed on the fly, and the data is sent in
+    chunks, so no complete copy of the message is ever held in memory.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._buffer = bytearray()
+        self._line_start = True
+        self.bytes_sent = 0
+
+    def write(self, data):
+        if not data:
+            return
+        if self._line_start and data[:1] == b".":
+            self._buffer += b"."
+        self._buffer += data.replace(b"\n.", b"\n..")
+        self._line_start = data[-1:] == b"\n"
+        if len(self._buffer) >= self.CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._sock.sendall(self._buffer)
+            self.bytes_sent += len(self._buffer)
+            self._buffer.clear()
+
+    def finish(self):
+        """
+        Terminates the data with <CRLF>.<CRLF> and sends the rest.
+        """
+        if not self._line_start:
+            self._buffer += b"\r\n"
+        self._buffer += b".\r\n"
+        self.flush()
+
+
+class SMTPSession:
+    """
+    Keeps an authenticated SMTP connection alive across sends.
+
+    The connection is opened on the first send. Before a connection that was idle
+    for a while is reused, a NOOP checks that the server still accepts it. After
+    idle_timeout seconds without a send the connection is closed.
+
+    Security modes:
+        ssl: implicit TLS (usually port 465).
+        starttls: plain connection upgraded with STARTTLS (usually port 587).
+        none: no encryption, only for local test servers.
+    """
+
+    SECURITY_MODES = ("ssl", "starttls", "none")
+
+    def __init__(self, host, port, user=None, password=None, security="ssl", idle_timeout=60, noop_after=10,
+                 timeout=30):
+        """
+        Initialize the SMTPSession object.
+
+        Args:
+            host (str): SMTP server address.
+            port (int): SMTP server port.
+            user (str): Login user, None to skip the login.
+            password (str): Login password.
+            security (str): One of SECURITY_MODES.
+            idle_timeout (float): Seconds without a send after which the connection is closed.
+            noop_after (float): Seconds of idleness after which the connection is checked with NOOP.
+            timeout (float): Socket timeout in seconds.
+        """
+        if security not in self.SECURITY_MODES:
+            raise ValueError(f"Unknown SMTP security mode '{security}'")
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.security = security
+        self.idle_timeout = idle_timeout
+        self.noop_after = noop_after
+        self.timeout = timeout
+
+        self.timings = {}
+        self._server = None
+        self._last_used = 0.0
+        self._idle_timer = None
+        self._lock = threading.RLock()
+
+    def _connect(self):
+        """
+        Opens and authenticates a new connection.
+        """
+        self.timings = {"connect": 0.0, "tls": 0.0, "auth": 0.0, "data": 0.0, "bytes": 0}
+        _TimedSMTP, _TimedSMTP_SSL = _timed_smtp_classes()
+        if self.security == "ssl":
+            server = _TimedSMTP_SSL(self.timings, context=default_ssl_context(), timeout=self.timeout)
+        else:
+            server = _TimedSMTP(self.timings, timeout=self.timeout)
+        server.connect(self.host, self.port)
+
+        try:
+            if self.security == "starttls":
+                start = time.perf_counter()
+                server.starttls(context=default_ssl_context())
+                self.timings["tls"] = time.perf_counter() - start
+
+            if self.user:
+                start = time.perf_counter()
+                server.login(self.user, self.password)
+                self.timings["auth"] = time.perf_counter() - start
+        except Exception:
+            server.close()
+            raise
+
+        self._server = server
+
+    def reconfigure(self, host, port, user=None, password=None, security="ssl", idle_timeout=60):
+        """
+        Changes the server or the login. A send in progress finishes first, the next one
+        connects with the new settings.
+
+        Args:
+            host (str): SMTP server address.
+            port (int): SMTP server port.
+            user (str): Login user, None to skip the login.
+            password (str): Login password.
+            security (str): One of SECURITY_MODES.
+            idle_timeout (float): Seconds without a send after which the connection is closed.
+
+        Raises:
+            ValueError: If the security mode is unknown.
+        """
+        if security not in self.SECURITY_MODES:
+            raise ValueError(f"Unknown SMTP security mode '{security}'")
+        with self._lock:
+            connection_changed = (host, port, user, password, security) != (
+                self.host, self.port, self.user, self.password, self.security)
+            self.host = host
+            self.port = port
+            self.user = user
+            self.password = password
+            self.security = security
+            self.idle_timeout = idle_timeout
+        if connection_changed:
+            self.close()
+
+    def _ensure_connected(self):
+        """
+        Makes sure there is a usable connection, reconnecting if the old one went away.
+
+        Returns:
+            bool: True if an existing connection is reused.
+        """
+        import smtplib
+        if self._server is not None and time.monotonic() - self._last_used > self.noop_after:
+            try:
+                code, _ = self._server.noop()
+            except (smtplib.SMTPException, OSError):
+                code = None
+            if code != 250:
+                self._drop()
+
+        if self._server is None:
+            self._connect()
+            return False
+
+        self.timings = {"connect": 0.0, "tls": 0.0, "auth": 0.0, "data": 0.0, "bytes": 0}
+        return True
+
+    def _drop(self):
+        """
+        Closes the connection without waiting for the server.
+        """
+        if self._server is not None:
+            try:
+                self._server.close()
+            finally:
+                self._server = None
+
+    def _schedule_idle_close(self):
+        """
+        (Re)starts the timer that closes the connection after idle_timeout.
+        """
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+        self._idle_timer = threading.Timer(self.idle_timeout, self._close_if_idle)
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+
+    def _close_if_idle(self):
+        with self._lock:
+            if self._server is not None and time.monotonic() - self._last_used >= self.idle_timeout:
+                self.close()
+
+    def _transaction(self, from_addr, to_addrs, write_data):
+        """
+        Runs one MAIL/RCPT/DATA transaction, the message data is streamed by write_data.
+
+        Raises:
+            smtplib.SMTPSenderRefused: If the server refused the sender.
+            smtplib.SMTPRecipientsRefused: If the server refused all recipients.
+            smtplib.SMTPDataError: If the server refused the message data.
+        """
+        import smtplib
+        server = self._server
+        server.ehlo_or_helo_if_needed()
+        if isinstance(to_addrs, str):
+            to_addrs = [to_addrs]
+
+        code, response = server.mail(from_addr)
+        if code != 250:
+            server.rset()
+            raise smtplib.SMTPSenderRefused(code, response, from_addr)
+
+        refused = {}
+        for address in to_addrs:
+            code, response = server.rcpt(address)
+            if code not in (250, 251):
+                refused[address] = (code, response)
+        if len(refused) == len(to_addrs):
+            server.rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+        for address, (code, response) in refused.items():
+            print(f"SMTP: recipient {address} refused ({code} {response.decode('utf-8', 'replace')}), "
+                  f"sending to the others")
+
+        server.putcmd("data")
+        code, response = server.getreply()
+        if code != 354:
+            server.rset()
+            raise smtplib.SMTPDataError(code, response)
+
+        writer = _DataWriter(server.sock)
+        write_data(writer)
+        writer.finish()
+        self.timings["bytes"] += writer.bytes_sent
+
+        code, response = server.getreply()
+        if code != 250:
+            server.rset()
+            raise smtplib.SMTPDataError(code, response)
+        return refused
+
+    def _send_one(self, message, from_addr, to_addrs):
+        start = time.perf_counter()
+        if hasattr(message, "read"):
+            # A spooled mail, already serialized with CRLF line endings
+            def write_data(writer):
+                for chunk in iter(lambda: message.read(_DataWriter.CHUNK_SIZE), b""):
+                    writer.write(chunk)
+        elif isinstance(message, bytes):
+            def write_data(writer):
+                writer.write(message)
+        else:
+            # The generator writes part by part, so the whole message never exists as one string
+            from email.generator import BytesGenerator
+
+            def write_data(writer):
+                BytesGenerator(writer, policy=message.policy.clone(linesep="\r\n")).flatten(message)
+        self._transaction(from_addr, to_addrs, write_data)
+        self.timings["data"] += time.perf_counter() - start
+
+    def send_many(self, messages):
+        """
+        Sends several messages over one session.
+
+        Args:
+            messages (list): Tuples of (message, from_addr, to_addrs). A message is either an
+                             email.message.Message, its serialized bytes or a binary file
+                             positioned at the start of the serialized message (CRLF line endings).
+        """
+        import smtplib
+        with self._lock, instrumentation.run("delivery"):
+            reused = self._ensure_connected()
+            try:
+                for index, (message, from_addr, to_addrs) in enumerate(messages):
+                    position = message.tell() if hasattr(message, "read") else None
+                    try:
+                        self._send_one(message, from_addr, to_addrs)
+                    except smtplib.SMTPServerDisconnected:
+                        # A reused connection may have been closed by the server in between, retry once
+                        if not reused or index > 0:
+                            raise
+                        self._drop()
+                        self._connect()
+                        reused = False
+                        if position is not None:
+                            message.seek(position)
+                        self._send_one(message, from_addr, to_addrs)
+            except smtplib.SMTPServerDisconnected:
+                self._drop()
+                raise
+            except smtplib.SMTPException:
+                # The server answered (e.g. a rejected recipient), the session is still usable.
+                # SMTPException is an OSError, so this has to come before the socket errors.
+                raise
+            except OSError:
+                self._drop()
+                raise
+            except BaseException:
+                # Anything else, e.g. an encoding error of the generator or a KeyboardInterrupt, may have
+                # stopped in the middle of DATA; the next MAIL FROM would end up in that message
+                self._drop()
+                raise
+            finally:
+                self._last_used = time.monotonic()
+                if self._server is not None:
+                    self._schedule_idle_close()
+
+            print(self.timing_summary(reused, len(messages)))
+            if not reused:
+                instrumentation.record("smtp.connect", self.timings["connect"])
+                instrumentation.record("smtp.tls", self.timings["tls"])
+                instrumentation.record("smtp.auth", self.timings["auth"])
+            instrumentation.record("smtp.data", self.timings["data"], self.timings["bytes"])
+
+    def send(self, message, from_addr, to_addrs):
+        """
+        Sends a single message.
+
+        Args:
+            message (email.message.Message): The message.
+            from_addr (str): Envelope sender.
+            to_addrs (str | list): Envelope recipient(s).
+        """
+        self.send_many([(message, from_addr, to_addrs)])
+
+    def timing_summary(self, reused, count):
+        """
+        Args:
+            reused (bool): Whether an existing connection was reused.
+            count (int): Number of messages sent.
+
+        Returns:
+            str: The phase timings of the last send as one line.
+        """
+        if reused:
+            setup = "reused connection"
+        else:
+            setup = (f"connect {self.timings['connect']:.3f}s, tls {self.timings['tls']:.3f}s, "
+                     f"auth {self.timings['auth']:.3f}s")
+        return (f"SMTP: {setup}, data {self.timings['data']:.3f}s for {count} message(s) "
+                f"({self.timings['bytes']} bytes)")
+
+    def close(self):
+        """
+        Ends the session with QUIT and closes the connection.
+        """
+        import smtplib
+        with self._lock:
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+            if self._server is not None:
+                try:
+                    self._server.quit()
+                except (smtplib.SMTPException, OSError):
+                    pass
+                finally:
+                    self._drop()
@@ -1,20 +1,21 @@
+import html
 import os
-import psutil
-import smtplib
-import ssl
-import socket
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.image import MIMEImage
-from email.utils import make_msgid
+import time
 
 from ..System.DataCollector import DataCollector
+from ..Telemetry.Instrumentation import instrumentation
+from ..System.Snapshot import load_snapshot, save_snapshot
+from .AssetRegistry import AssetRegistry
 from .HTMLBuilder import HTMLBuilder
+from .SMTPSession import SMTPSession
+from .Sparkline import SparklineRenderer
+from .Template import load_template
 
 
 class MailSender:
     def __init__(self, sender_email, mail_password, receiver_email, script_dir, disk_path, operating_system, smtp_server_address, smtp_server_port, pi_external, pi_external_port, pi_local_port,
-                 pi_user):
+                 pi_user, data_collector=None, smtp_session=None, spool=None, chart_budget=0.25,
+                 snapshot_file=None):
         """
         Initialize the MailSender object.
 
@@ -27,6 +28,15 @@ class MailSender:
             operating_system (str): Operating system type.
             smtp_server_address (str): SMTP server address.
             smtp_server_port (int): SMTP server port.
+            data_collector (DataCollector): Collector to reuse across reports, so values of
+                                            earlier reports can stand in for timed out ones.
+            smtp_session (SMTPSession): Session to reuse across reports, by default a new SSL
+                                        session to the given SMTP server.
+            spool (MailSpool): If given, mails are put into this spool for a DeliveryWorker
+                               instead of being sent right away.
+            chart_budget (float): Maximum seconds to render one trend chart.
+            snapshot_file (str): File the snapshot of the last report is kept in, for the
+                                 "since the last report" section. None keeps it in memory only.
         """
         self.sender_email = sender_email
         self.receiver_email = receiver_email
@@ -41,10 +51,292 @@ class MailSender:
         self.pi_local_port = pi_local_port
         self.pi_user = pi_user
 
-        self.dataCollector = DataCollector()
+        self.dataCollector = data_collector if data_collector is not None else DataCollector()
         self.html_builder = HTMLBuilder()
-        self.local_ip = self.dataCollector.get_local_ip()
-        self.global_ip = self.dataCollector.get_global_ip()
+        self.assets = AssetRegistry(os.path.join(script_dir, 'assets'))
+        self.sparklines = SparklineRenderer(budget=chart_budget)
+        if smtp_session is None:
+            smtp_session = SMTPSession(smtp_server_address, smtp_server_port, sender_email, mail_password)
+        self.smtp_session = smtp_session
+        self.spool = spool
+        self.snapshot_file = snapshot_file
+        self.last_snapshot = load_snapshot(snapshot_file) if snapshot_file else None
+
+    @staticmethod
+    def html_message(html_content):
+        """
+        Creates a message with the HTML part.
+
+        The email.mime modules are imported with the first mail, not on startup.
+
+        Args:
+            html_content (str): The HTML of the mail.
+
+        Returns:
+            MIMEMultipart: Message object.
+        """
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+
+        message = MIMEMultipart()
+        message.attach(MIMEText(html_content, "html"))
+        return message
+
+    @staticmethod
+    def value(info, key, digits=None):
+        """
+        Formats a value of the system information.
+
+        Args:
+            info (dict): System information.
+            key (str): Key of the value.
+            digits (int): Number of digits to round to, None to keep the value as is.
+
+        Returns:
+            str: The value, or "n/a" if it could not be collected.
+        """
+        value = info.get(key)
+        if value is None:
+            return "n/a"
+        return value if digits is None else round(value, digits)
+
+    @staticmethod
+    def collection_note(info):
+        """
+        Describes values that are missing or stale in the report.
+
+        Args:
+            info (dict): System information.
+
+        Returns:
+            str: HTML paragraph, or an empty string if everything was collected.
+        """
+        result = info.get("collection")
+        if result is None:
+            return ""
+        notes = []
+        if result.names(result.STALE):
+            notes.append(f"from an earlier report: {', '.join(result.names(result.STALE))}")
+        if result.names(result.MISSING):
+            notes.append(f"unavailable: {', '.join(result.names(result.MISSING))}")
+        if not notes:
+            return ""
+        return f"<p><small>Not collected in time, {'; '.join(notes)}</small></p>"
+
+    @staticmethod
+    def ip_changed_note(info):
+        """
+        Args:
+            info (dict): System information.
+
+        Returns:
+            str: A note if the global IP changed since the last report, else an empty string.
+        """
+        return " <b>(changed since the last report)</b>" if info.get("global_ip_changed") else ""
+
+    @staticmethod
+    def cpu_window(info):
+        """
+        Formats the CPU statistics over the sampler window.
+
+        Args:
+            info (dict): System information.
+
+        Returns:
+            str: HTML paragraph, or an empty string if no samples are available.
+        """
+        if not info.get("metrics"):
+            return ""
+        cpu = info["metrics"]["cpu_percent"]
+        return (f"<p>Last {round(info['metrics_window'] / 60)} min: average {round(cpu['avg'], 1)}%; "
+                f"max {round(cpu['max'], 1)}%; p95 {round(cpu['p95'], 1)}%</p>")
+
+    @staticmethod
+    def history(info):
+        """
+        Formats the 24-hour and 7-day min/avg/max of CPU, RAM and disk usage as a table.
+
+        Args:
+            info (dict): System information.
+
+        Returns:
+            str: HTML table, or an empty string if there is no history yet.
+        """
+        history = info.get("history")
+        if not history or not any(history.values()):
+            return ""
+        rows = ["<tr><th></th><th colspan=\"3\">Last 24 hours</th><th colspan=\"3\">Last 7 days</th></tr>",
+                "<tr><th></th>" + "<th>min</th><th>avg</th><th>max</th>" * 2 + "</tr>"]
+        for name, label in (("cpu_percent", "CPU"), ("ram_percent", "RAM"), ("disk_percent", "Disk")):
+            cells = []
+            for period in ("24h", "7d"):
+                summary = history.get(period)
+                if summary is None:
+                    cells.append("<td>n/a</td>" * 3)
+                    continue
+                cells.append("".join(f"<td>{round(summary[name][key], 1)}%</td>" for key in ("min", "avg", "max")))
+            rows.append(f"<tr><th>{label}</th>{''.join(cells)}</tr>")
+        return f"<h4>History</h4><table class=\"history\">{''.join(rows)}</table>"
+
+    @staticmethod
+    def processes_table(info):
+        """
+        Formats the processes using the most CPU, RAM and I/O as a table.
+
+        Args:
+            info (dict): System information.
+
+        Returns:
+            str: HTML table, or an empty string if the processes were not scanned.
+        """
+        top = info.get("processes")
+        if not top or not top.scanned:
+            return ""
+        rows = ["<tr><th>Process</th><th>PID</th><th>CPU</th><th>RAM</th><th>I/O</th></tr>"]
+        for process in top.processes():
+            io_rate = "n/a" if process.io_rate is None else f"{round(process.io_rate / 1024, 1)} KiB/s"
+            rows.append(f"<tr><th>{html.escape(process.name)}</th><td>{process.pid}</td>"
+                        f"<td>{process.cpu_percent}%</td><td>{round(process.rss / (1024 ** 2), 1)} MB</td>"
+                        f"<td>{io_rate}</td></tr>")
+        if top.interval is None:
+            note = "CPU and I/O averaged since each process started"
+        else:
+            note = f"CPU and I/O averaged over the last {round(top.interval / 60)} min"
+        if not top.complete:
+            note += f", only {top.scanned} processes scanned in time"
+        return (f"<h4>Top processes</h4><table class=\"processes\">{''.join(rows)}</table>"
+                f"<p><small>{note}</small></p>")
+
+    # Shown instead of the usage of a mount that could not be read
+    MOUNT_STATUS = {"hung": "not responding", "skipped": "not read in time", "error": "unreadable"}
+
+    @classmethod
+    def mounts_table(cls, info):
+        """
+        Formats the usage of every mount as a table, mounts that could not be read are marked as unavailable.
+
+        Args:
+            info (dict): System information.
+
+        Returns:
+            str: HTML table, or an empty string if no mounts were collected.
+        """
+        mounts = info.get("disk_mounts")
+        if not mounts:
+            return ""
+        rows = ["<tr><th>Mount</th><th>Type</th><th>Total</th><th>Used</th><th>Free</th><th>Usage</th></tr>"]
+        for mount in mounts:
+            cells = f"<th>{html.escape(mount.mountpoint)}</th><td>{html.escape(mount.fstype)}</td>"
+            if mount.available:
+                cells += "".join(f"<td>{round(value / (1024 ** 3), 2)} GB</td>"
+                                 for value in (mount.total, mount.used, mount.free))
+                cells += f"<td>{mount.percent}%</td>"
+            else:
+                cells += f"<td colspan=\"4\">unavailable, {cls.MOUNT_STATUS[mount.status]}</td>"
+            rows.append(f"<tr>{cells}</tr>")
+        return f"<table class=\"mounts\">{''.join(rows)}</table>"
+
+    # Metric, label and line color of the trend charts
+    TREND_CHARTS = (
+        ("cpu_percent", "CPU", (214, 39, 40)),
+        ("ram_percent", "RAM", (31, 119, 180)),
+        ("disk_percent", "Disk", (44, 160, 44)),
+    )
+
+    def trend_charts(self, info):
+        """
+        Renders the sparklines of the last 24 hours.
+
+        Args:
+            info (dict): System information.
+
+        Returns:
+            list: Tuples of (label, content_id, MIMEImage) for every chart that could be rendered.
+        """
+        trends = info.get("trends")
+        if not trends:
+            return []
+        charts = []
+        with instrumentation.stage("charts") as stage:
+            for name, label, color in self.TREND_CHARTS:
+                content_id = f"trend_{name}"
+                part = self.sparklines.chart_part(trends.get(name) or [], color, content_id)
+                if part is not None:
+                    charts.append((label, content_id, part))
+            stage.bytes = sum(len(part.get_payload()) for _, _, part in charts)
+        return charts
+
+    @staticmethod
+    def trends_html(charts):
+        """
+        Args:
+            charts (list): The charts as returned by trend_charts().
+
+        Returns:
+            str: HTML with the charts, or an empty string if there are none.
+        """
+        if not charts:
+            return ""
+        images = "".join(f"<p>{label}: <img class=\"trend\" src=\"cid:{content_id}\" alt=\"{label} trend\"></p>"
+                         for label, content_id, _ in charts)
+        return f"<h4>Trends of the last 24 hours</h4>{images}"
+
+    @staticmethod
+    def since_last(info):
+        """
+        Describes the changes since the last report.
+
+        Args:
+            info (dict): System information.
+
+        Returns:
+            str: HTML list, or an empty string if there is no earlier report or nothing changed.
+        """
+        delta = info.get("delta")
+        if delta is None:
+            return ""
+        lines = delta.lines()
+        if not lines:
+            return ""
+        items = "".join(f"<li>{html.escape(line)}</li>" for line in lines)
+        return f"<h4>Since the last report</h4><ul>{items}</ul>"
+
+    def report_context(self, info, charts=()):
+        """
+        Prepares the values shared by all report templates.
+
+        Args:
+            info (dict): System information.
+            charts (list): The trend charts as returned by trend_charts().
+
+        Returns:
+            dict: The formatted values by placeholder name.
+        """
+        return {
+            "hostname": self.value(info, "hostname"),
+            "uptime_days": self.value(info, "uptime_days"),
+            "uptime_hours": self.value(info, "uptime_hours"),
+            "uptime_minutes": self.value(info, "uptime_minutes"),
+            "total_memory": self.value(info, "total_memory", 2),
+            "used_memory": self.value(info, "used_memory", 2),
+            "free_memory": self.value(info, "free_memory", 2),
+            "total_ram_gb": self.value(info, "total_ram_gb", 2),
+            "used_ram_gb": self.value(info, "used_ram_gb", 2),
+            "available_ram_gb": self.value(info, "available_ram_gb", 2),
+            "ram_percent": self.value(info, "ram_percent", 2),
+            "cpu_physical": self.value(info, "cpu_physical"),
+            "cpu_percent_now": self.value(info, "cpu_percent_now"),
+            "cpu_window": self.cpu_window(info),
+            "history": self.history(info),
+            "mounts": self.mounts_table(info),
+            "processes": self.processes_table(info),
+            "since_last": self.since_last(info),
+            "trends": self.trends_html(charts),
+            "local_ip": info.get("local_ip"),
+            "global_ip": info.get("global_ip"),
+            "ip_changed_note": self.ip_changed_note(info),
+            "collection_note": self.collection_note(info),
+        }
 
     def pi_mail(self, info):
         """
@@ -56,84 +348,26 @@ class MailSender:
         Returns:
             MIMEMultipart: Message object.
         """
-
-        # Add styles to the HTMLBuilder
-        self.html_builder.add_style("""
-            .highlight {
-                width: fit-content;
-                background-color: #f9f9f9;
-                padding: 10px;
-                border-radius: 5px;
-                box-shadow: 0 2px 5px rgba(0, 0, 0, 0.1);
-            }
-            img {
-                height: 40px;
-                margin-right: 10px;
-                vertical-align: middle;
-            }
-        """)
-
-        external_ip = (
-                f"<p>Your external IP is: {self.global_ip}</p>" +
-                "<p>To connect to your Raspberry Pi, use:</p>" +
-                f"<pre class ='highlight'> ssh -p {self.pi_external_port} {self.pi_user}@{self.global_ip} </pre>"
-        )
-
-        local_ip = (
-                f"<p>Your local IP is: {self.local_ip}</p>" +
-                "<p>To connect to your Raspberry Pi, use:</p>" +
-                f"<pre class ='highlight'> ssh -p {self.pi_local_port} {self.pi_user}@{self.local_ip} </pre>"
-        )
-
-        network = external_ip + local_ip if self.pi_external == True else local_ip
-
-        # Add body content to the HTMLBuilder
-        self.html_builder.add_body_content(f"""
-            <div class="main">
-                <div>
-                    <img src="cid:image_cid" alt="Raspberry Pi Logo">
-                </div>
-                <div style="height: 20px;"></div>
-                <div>
-                    <h2>Here are the current details of your Raspberry Pi:</h2>
-                    <div style="height: 20px;"></div>
-                    <div class="device-info">
-                        <h3>Device Information:</h3>
-                        <p>Name: {socket.gethostname()}</p>
-                        <p>System uptime: {info["uptime_days"]}d, {info["uptime_hours"]}h, {info["uptime_minutes"]}min</p>
-                        <br>
-                        <div>
-                            <h3>Network:</h3>
-                            {network}
-                        </div>
-                        <br>
-                        <h4>Storage</h4>
-                        <p>Total Storage: {round(info["total_memory"], 2)} GB</p>
-                        <p>Used Storage: {round(info["used_memory"], 2)} GB; Free Storage: {round(info["free_memory"], 2)} GB</p>
-                        <br>
-                        <h4>RAM</h4>
-                        <p>Total RAM: {round(info["total_ram_gb"], 2)} GB; Usage: {round(info["ram_percent"], 2)}%</p>
-                        <p>Used RAM: {round(info["used_ram_gb"], 2)} GB; Free RAM: {round(info["available_ram_gb"], 2)}</p>
-                    </div>
-                </div>
-            </div>
-        """)
-
-        # Get the HTML content from the HTMLBuilder
-        html_content = self.html_builder.get_html()
+        connection = load_template("pi_connection.html")
+        network = [connection.render({"kind": "local", "ip": info.get("local_ip"), "note": "",
+                                      "port": self.pi_local_port, "user": self.pi_user})]
+        if self.pi_external == True:
+            network.insert(0, connection.render({"kind": "external", "ip": info.get("global_ip"),
+                                                 "note": self.ip_changed_note(info),
+                                                 "port": self.pi_external_port, "user": self.pi_user}))
+
+        charts = self.trend_charts(info)
+        context = self.report_context(info, charts)
+        context["network"] = "".join(network)
+        html_content = self.html_builder.render("pi", context)
 
         # Create MIMEText object for the HTML message
-        message = MIMEMultipart()
-        message.attach(MIMEText(html_content, "html"))
+        message = self.html_message(html_content)
 
-        # Generate image content ID
-        image_cid = make_msgid(domain=os.path.join(self.script_dir, 'assets/raspberry_pi_logo.png'))
-
-        # Add image to the attachment
-        with open(os.path.join(self.script_dir, 'assets/raspberry_pi_logo.png'), 'rb') as file:
-            image = MIMEImage(file.read())
-        image.add_header('Content-ID', '<image_cid>')
-        message.attach(image)
+        # Add the cached logo to the attachment
+        message.attach(self.assets.image_part('raspberry_pi_logo.png', 'image_cid'))
+        for _, _, part in charts:
+            message.attach(part)
 
         # Define sender, receiver, and subject
         message["Subject"] = "Daily information from your Raspberry Pi"
@@ -152,76 +386,33 @@ class MailSender:
         Returns:
             MIMEMultipart: Message object.
         """
-        # Add styles to the HTMLBuilder
-        self.html_builder.add_style("""
-            img {
-                height: 35px;
-                margin-right: 10px;
-                vertical-align: middle;
-            }
-        """)
-
-        # Collect information about drives
-        drives = ""
-        for disk_partition in info["disk_partitions"]:
-            if "fixed" in disk_partition.opts:
-                disk_partition_path = disk_partition.mountpoint + "\\"
-                disk_usage = psutil.disk_usage(disk_partition_path)
-                total_gb = disk_usage.total / (1024 ** 3)
-                used_gb = disk_usage.used / (1024 ** 3)
-                free_gb = disk_usage.free / (1024 ** 3)
-                drive_path = ':\\'
-                drives += (
-                    f"<p>Partition {disk_partition.device.replace(drive_path, ' ')} total: {round(total_gb, 2)} GB</p>"
-                    f"<p>Used: {round(used_gb, 2)} GB; Free: {round(free_gb, 2)} GB</p>"
-                )
-
-        # Create HTML content
-        html_content = f"""
-            <div class="main">
-                <div>
-                    <img src="cid:image_cid" alt="Windows Logo">
-                </div>
-                <div style="height: 20px;"></div>
-                <div>
-                    <h2>Here are the current details:</h2>
-                    <div style="height: 20px;"></div>
-                    <div class="device-info">
-                        <h3>Device Information:</h3>
-                        <p>Name: {socket.gethostname()}</p>
-                        <p>System uptime: {info["uptime_days"]}d, {info["uptime_hours"]}h, {info["uptime_minutes"]}min</p>
-                        <br>
-                        <h4> Storage</h4>
-                        {drives}
-                        <br>
-                        <h4> RAM</h4>
-                        <p>Total: {round(info["total_ram_gb"], 2)} GB; Usage: {round(info["ram_percent"], 2)}%</p>
-                        <p>Used: {round(info["used_ram_gb"], 2)} GB; Free: {round(info["available_ram_gb"], 2)} GB</p>
-                        <br>
-                        <h4> CPU</h4>
-                        <p>Physical CPUs: {info["cpu_physical"]}</p>
-                        <p>Current usage: {info["cpu_percent_now"]}%</p>
-                        <br>
-                        <div>
-                            <h3>Network:</h3>
-                            <p>Local IP: {self.local_ip}</p>
-                            <p>Global IP: {self.global_ip}</p>                            
-                        </div>
-                    </div>
-                </div>
-            </div>
-        """
+        # The drives and their usage as read by the collector
+        drive = load_template("windows_drive.html")
+        drives = []
+        for mount in info.get("disk_mounts", ()):
+            device = html.escape(mount.device.replace(':\\', ' '))
+            if not mount.available:
+                drives.append(f"<p>Partition {device} unavailable, {self.MOUNT_STATUS[mount.status]}</p>")
+                continue
+            drives.append(drive.render({
+                "device": device,
+                "total": round(mount.total / (1024 ** 3), 2),
+                "used": round(mount.used / (1024 ** 3), 2),
+                "free": round(mount.free / (1024 ** 3), 2),
+            }))
+
+        charts = self.trend_charts(info)
+        context = self.report_context(info, charts)
+        context["drives"] = "".join(drives)
+        html_content = self.html_builder.render("windows", context)
 
         # Create a MIME object for the HTML message
-        message = MIMEMultipart()
-        message.attach(MIMEText(html_content, "html"))
+        message = self.html_message(html_content)
 
-        # Add an image as an attachment
-        image_cid = make_msgid(domain=os.path.join(self.script_dir, 'assets/windows_logo.png'))
-        with open(os.path.join(self.script_dir, 'assets/windows_logo.png'), 'rb') as file:
-            image = MIMEImage(file.read())
-        image.add_header('Content-ID', '<image_cid>')
-        message.attach(image)
+        # Add the cached logo as an attachment
+        message.attach(self.assets.image_part('windows_logo.png', 'image_cid'))
+        for _, _, part in charts:
+            message.attach(part)
 
         # Define sender, receiver, and subject
         message["Subject"] = "Daily information from your Windows System"
@@ -240,68 +431,16 @@ class MailSender:
         Returns:
             MIMEMultipart: Message object.
         """
-
-        # Add styles to the HTMLBuilder
-        self.html_builder.add_style("""
-            img {
-                height: 100px;
-                margin-right: 10px;
-                vertical-align: middle;
-            }
-        """)
-
-        # Add body content to the HTMLBuilder
-        self.html_builder.add_body_content(f"""
-            <div class="main">
-                <div>
-                    <img src="cid:image_cid" alt="Linux Logo">
-                </div>
-                <div style="height: 20px;"></div>
-                <div>
-                    <h2>Here are the current details:</h2>
-                    <div style="height: 20px;"></div>
-                    <div class="device-info">
-                        <h3>Device Information:</h3>
-                        <p>Name: {socket.gethostname()}</p>
-                        <p>System uptime: {info["uptime_days"]}d, {info["uptime_hours"]}h, {info["uptime_minutes"]}min</p>
-                        <br>
-                        <h4> Storage</h4>
-                        <p>Total Storage: {round(info["total_memory"], 2)} GB</p>
-                        <p>Used Storage: {round(info["used_memory"], 2)} GB; Free Storage: {round(info["free_memory"], 2)} GB</p>
-                        <br>
-                        <h4> RAM</h4>
-                        <p>Total RAM: {round(info["total_ram_gb"], 2)} GB; Usage: {round(info["ram_percent"], 2)}%</p>
-                        <p>Used RAM: {round(info["used_ram_gb"], 2)} GB; Free RAM: {round(info["available_ram_gb"], 2)}</p>
-                        <br>
-                        <h4> CPU</h4>
-                        <p>Physical CPUs: {info["cpu_physical"]}</p>
-                        <p>Current usage: {info["cpu_percent_now"]}%</p>
-                        <br>
-                        <div>
-                            <h3>Network:</h3>
-                            <p>Local IP: {self.local_ip}</p>
-                            <p>Global IP: {self.global_ip}</p>                            
-                        </div>
-                    </div>
-                </div>
-            </div>
-        """)
-
-        # Get the HTML content from the HTMLBuilder
-        html_content = self.html_builder.get_html()
+        charts = self.trend_charts(info)
+        html_content = self.html_builder.render("linux", self.report_context(info, charts))
 
         # Create MIMEText object for the HTML message
-        message = MIMEMultipart()
-        message.attach(MIMEText(html_content, "html"))
-
-        # Generate image content ID
-        image_cid = make_msgid(domain=os.path.join(self.script_dir, 'assets/linux_logo.png'))
+        message = self.html_message(html_content)
 
-        # Add image to the attachment
-        with open(os.path.join(self.script_dir, 'assets/linux_logo.png'), 'rb') as file:
-            image = MIMEImage(file.read())
-        image.add_header('Content-ID', '<image_cid>')
-        message.attach(image)
+        # Add the cached logo to the attachment
+        message.attach(self.assets.image_part('linux_logo.png', 'image_cid'))
+        for _, _, part in charts:
+            message.attach(part)
 
         # Define sender, receiver, and subject
         message["Subject"] = "Daily information from your Linux System"
@@ -310,50 +449,197 @@ class MailSender:
 
         return message
 
-    def send_mail(self):
+    def alert_mail(self, alerts, watch_cost):
         """
-        Send an email with system information based on the operating system.
+        Creates an alert email.
+
+        Args:
+            alerts (list): Descriptions of the alerts.
+            watch_cost (str): The CPU cost of the alert checks.
+
+        Returns:
+            MIMEMultipart: Message object.
+        """
+        html_content = self.html_builder.render("alert", {
+            "hostname": self.dataCollector.host_facts.hostname,
+            "alerts": "".join(f"<li>{html.escape(alert)}</li>" for alert in alerts),
+            "watch_cost": html.escape(watch_cost),
+        })
+
+        message = self.html_message(html_content)
+
+        message["Subject"] = f"Alert from {self.dataCollector.host_facts.hostname}: {alerts[0]}"
+        message["From"] = f"{self.operating_system} System <{self.sender_email}>"
+        message["To"] = self.receiver_email
+
+        return message
+
+    def send_alert(self, alerts, watch_cost):
+        """
+        Sends an alert email right away, without collecting the system information.
+
+        Args:
+            alerts (list): Descriptions of the alerts.
+            watch_cost (str): The CPU cost of the alert checks.
+        """
+        print("Alert:", "; ".join(alerts))
+        with instrumentation.run("alert"):
+            self.deliver(self.alert_mail(alerts, watch_cost))
+
+    @staticmethod
+    def fleet_row(result):
+        """
+        Renders the digest row of one host.
+
+        Args:
+            result (FleetResult): The poll result of the host.
+
+        Returns:
+            str: The HTML table row.
+        """
+        name = html.escape(result.name)
+        if result.snapshot is None:
+            return load_template("fleet_error.html").render({"host": name, "error": html.escape(result.error)})
+
+        snapshot = result.snapshot
+
+        def percent(used, total):
+            return "n/a" if used is None or not total else f"{used / total * 100:.1f}%"
+
+        host = name
+        if snapshot.hostname and snapshot.hostname != result.name:
+            host += f" ({html.escape(snapshot.hostname)})"
+
+        uptime = "n/a"
+        if snapshot.boot_time is not None:
+            days, remainder = divmod(int(snapshot.taken_at - snapshot.boot_time), 86400)
+            uptime = f"{days}d {remainder // 3600}h"
+        return load_template("fleet_row.html").render({
+            "host": host,
+            "uptime": uptime,
+            "cpu": "n/a" if snapshot.cpu_percent is None else f"{snapshot.cpu_percent:.1f}%",
+            "ram": percent(snapshot.ram_used, snapshot.ram_total),
+            "disk": percent(snapshot.disk_used, snapshot.disk_total),
+            "free": "n/a" if snapshot.disk_free is None else f"{snapshot.disk_free / (1024 ** 3):.2f} GB",
+            "ip": html.escape(snapshot.global_ip or "n/a"),
+        })
+
+    def fleet_mail(self, results):
+        """
+        Creates the digest email of a fleet, one row per host.
+
+        Args:
+            results (list): The FleetResult of every host.
+
+        Returns:
+            MIMEMultipart: Message object.
+        """
+        reachable = sum(1 for result in results if result.snapshot is not None)
+        summary = f"{reachable} of {len(results)} hosts reachable"
+        html_content = self.html_builder.render("fleet", {
+            "summary": summary,
+            "rows": "".join(self.fleet_row(result) for result in results),
+        })
+
+        message = self.html_message(html_content)
+
+        message["Subject"] = f"Daily fleet report: {summary}"
+        message["From"] = f"Fleet <{self.sender_email}>"
+        message["To"] = self.receiver_email
+
+        return message
+
+    def send_fleet_digest(self, poller):
+        """
+        Polls all hosts of the fleet and sends one digest email.
+
+        Args:
+            poller (FleetPoller): The poller of the fleet.
+        """
+        with instrumentation.run("fleet_digest"):
+            with instrumentation.stage("fleet.poll"):
+                results = poller.poll()
+            self.deliver(self.fleet_mail(results))
+
+    def deliver(self, message):
         """
-        # Additional variables
-        info = self.dataCollector.system_info(self.disk_path)
-
-        # Default Mail styles
-        self.html_builder.add_style("""
-            body {
-                font-family: Arial, sans-serif;
-                background-color: #f4f4f4;
-                color: #333;
-                margin: 0;
-                padding: 0;
-            }
-            .main {
-                width: 100hv;
-                height: 100hv;
-                margin: auto;
-                padding: 20px;
-                background-color: #fff;
-            }
-            h2, h3, h4, p {
-                margin: 0.5rem;
-            }
-            img {
-                height: 40px;
-                margin-right: 10px;
-                vertical-align: middle;
-            }
-        """)
+        Spools or sends a message.
+
+        Args:
+            message (email.message.Message): The message.
+        """
+        if self.spool is not None:
+            # Hand the email over to the delivery worker, this never blocks on the network
+            mail_id = self.spool.enqueue(message, self.sender_email, self.receiver_email)
+            print(f"Mail {mail_id} spooled.")
+        else:
+            # Send the email over the (possibly already open) secure session
+            self.smtp_session.send(message, self.sender_email, self.receiver_email)
+            print("Mail send.")
+
+    def report_mail(self, info):
+        """
+        Creates the report email for the operating system, without sending it.
+
+        Args:
+            info (dict): System information as returned by DataCollector.collect().
+
+        Returns:
+            MIMEMultipart: Message object.
+        """
+        snapshot = info.get("snapshot")
+        if snapshot is not None:
+            info["delta"] = snapshot.diff(self.last_snapshot)
 
         # Determine the operating system and construct the message accordingly
         if self.operating_system == "Windows":
-            message = self.windows_mail(info)
-        elif self.operating_system == "Raspberry":
-            message = self.pi_mail(info)
-        else:
-            message = self.linux_mail(info)
-
-        # Establish a secure connection with the server and send the email
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL(self.smtp_server_address, self.smtp_server_port, context=context) as server:
-            server.login(self.sender_email, self.mail_password)
-            server.sendmail(self.sender_email, self.receiver_email, message.as_string())
-        print("Mail send.")
+            return self.windows_mail(info)
+        if self.operating_system == "Raspberry":
+            return self.pi_mail(info)
+        return self.linux_mail(info)
+
+    def report_html(self, info):
+        """
+        Renders the report for the operating system as a standalone HTML page.
+
+        The logo and the charts are attached to the mail and referenced by their Content-ID,
+        in the page they are embedded as data: URIs instead.
+
+        Args:
+            info (dict): System information as returned by DataCollector.collect().
+
+        Returns:
+            str: The HTML of the report.
+        """
+        message = self.report_mail(info)
+        parts = message.get_payload()
+        page = parts[0].get_payload(decode=True).decode("utf-8")
+        for part in parts[1:]:
+            content_id = part["Content-ID"]
+            if content_id:
+                # The payload of the cached image parts is already base64
+                data = "".join(part.get_payload().split())
+                page = page.replace(f"cid:{content_id.strip('<>')}", f"data:{part.get_content_type()};base64,{data}")
+        return page
+
+    def send_mail(self):
+        """
+        Send an email with system information based on the operating system.
+        """
+        with instrumentation.run("report"):
+            # Collect the system information and both IP addresses concurrently
+            trigger = time.monotonic()
+            info = self.dataCollector.collect(self.disk_path)
+            with instrumentation.stage("build"):
+                message = self.report_mail(info)
+            print(f"Report ready {time.monotonic() - trigger:.2f}s after the trigger")
+            with instrumentation.stage("deliver"):
+                self.deliver(message)
+
+        # The global IP of this report is the reference for the next change detection
+        self.dataCollector.ip_resolver.mark_reported()
+        snapshot = info.get("snapshot")
+        if snapshot is not None:
+            self.last_snapshot = snapshot
+            if self.snapshot_file:
+                save_snapshot(snapshot, self.snapshot_file)
@@ -0,0 +1,155 @@
+"""
+Small PNG trend charts for the mails, rasterized in pure Python.
+"""
+
+import hashlib
+import struct
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+
+
+def encode_png(rows, width, palette):
+    """
+    Encodes an image with a palette as PNG.
+
+    Args:
+        rows (list): One bytes-like object of palette indexes per row.
+        width (int): Width of the image in pixels.
+        palette (list): RGB tuples.
+
+    Returns:
+        bytes: The PNG file.
+    """
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data
+                + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    # Filter type 0 (none) in front of every row
+    raw = b"".join(b"\x00" + bytes(row) for row in rows)
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, len(rows), 8, 3, 0, 0, 0))
+            + chunk(b"PLTE", b"".join(bytes(color) for color in palette))
+            + chunk(b"IDAT", zlib.compress(raw, 9))
+            + chunk(b"IEND", b""))
+
+
+def resample(values, width):
+    """
+    Reduces or stretches a series to one value per pixel column by averaging.
+
+    Args:
+        values (list): The series.
+        width (int): Number of columns.
+
+    Returns:
+        list: width values.
+    """
+    count = len(values)
+    columns = []
+    for column in range(width):
+        start = column * count // width
+        end = max(start + 1, (column + 1) * count // width)
+        columns.append(sum(values[start:end]) / (end - start))
+    return columns
+
+
+class SparklineRenderer:
+    """
+    Renders percentage series as sparklines and caches their MIME parts by data hash.
+
+    Every chart has a time budget. A chart that can't be drawn within it is left
+    out of the mail rather than delaying the report.
+    """
+
+    BACKGROUND = (255, 255, 255)
+
+    def __init__(self, width=160, height=32, budget=0.25, cache_size=32):
+        """
+        Initialize the SparklineRenderer object.
+
+        Args:
+            width (int): Width of a chart in pixels.
+            height (int): Height of a chart in pixels.
+            budget (float): Maximum seconds to render one chart.
+            cache_size (int): Number of rendered charts kept.
+        """
+        self.width = width
+        self.height = height
+        self.budget = budget
+        self.cache_size = cache_size
+        self._parts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, values, color, deadline=None):
+        """
+        Draws a series between 0 and 100 as line with a lighter filled area below it.
+
+        Args:
+            values (list): The series, oldest first.
+            color (tuple): RGB color of the line.
+            deadline (float): perf_counter() time by which the chart must be done.
+
+        Returns:
+            bytes: The PNG file.
+
+        Raises:
+            TimeoutError: If the deadline passed while drawing.
+        """
+        fill = tuple(channel + (255 - channel) * 3 // 4 for channel in color)
+        height = self.height
+        rows = [bytearray(self.width) for _ in range(height)]
+
+        previous = None
+        for x, value in enumerate(resample(values, self.width)):
+            if deadline is not None and time.perf_counter() > deadline:
+                raise TimeoutError("Sparkline exceeded its time budget")
+            y = round((1 - min(max(value, 0.0), 100.0) / 100) * (height - 1))
+            # The line connects vertically to the previous column, so steep changes stay visible
+            top, bottom = (y, y) if previous is None else (min(y, previous), max(y, previous))
+            for row in range(top, height):
+                rows[row][x] = 2 if row <= bottom else 1
+            previous = y
+
+        return encode_png(rows, self.width, (self.BACKGROUND, fill, color))
+
+    def chart_part(self, values, color, content_id):
+        """
+        Returns the MIME part of a sparkline, rendered only if the same series wasn't drawn before.
+
+        Args:
+            values (list): The series, oldest first.
+            color (tuple): RGB color of the line.
+            content_id (str): Content-ID used to reference the chart from the HTML ("cid:...").
+
+        Returns:
+            MIMEImage: The cached part, or None if the series is too short or the budget was exceeded.
+        """
+        if len(values) < 2:
+            return None
+        digest = hashlib.sha1(array("d", values).tobytes()).hexdigest()
+        key = (digest, color, content_id, self.width, self.height)
+
+        with self._lock:
+            part = self._parts.get(key)
+            if part is not None:
+                self._parts.move_to_end(key)
+                return part
+
+        start = time.perf_counter()
+        try:
+            png = self.render(values, color, start + self.budget)
+        except TimeoutError as e:
+            print(f"Skipping chart {content_id}:", e)
+            return None
+        from email.mime.image import MIMEImage
+        part = MIMEImage(png, "png")
+        part.add_header('Content-ID', f'<{content_id}>')
+
+        with self._lock:
+            self._parts[key] = part
+            while len(self._parts) > self.cache_size:
+                self._parts.popitem(last=False)
+        return part
@@ -0,0 +1,90 @@
+"""
+Minimal HTML templates with {{ name }} placeholders.
+
+A template is parsed once into its literal chunks and placeholder names.
+Rendering only joins these chunks with the values, in a single pass.
+"""
+
+import functools
+import os
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "templates")
+
+
+class Template:
+    """
+    A compiled template.
+    """
+
+    def __init__(self, source):
+        """
+        Initialize the Template object and compile the source.
+
+        Args:
+            source (str): The template text.
+
+        Raises:
+            ValueError: If a placeholder is not closed.
+        """
+        self._literals = []
+        self._fields = []
+        position = 0
+        while True:
+            start = source.find("{{", position)
+            if start == -1:
+                break
+            end = source.find("}}", start)
+            if end == -1:
+                raise ValueError(f"Unclosed placeholder at position {start}")
+            self._literals.append(source[position:start])
+            self._fields.append(source[start + 2:end].strip())
+            position = end + 2
+        self._literals.append(source[position:])
+        self.fields = frozenset(self._fields)
+
+    def render(self, context):
+        """
+        Renders the template.
+
+        Args:
+            context (dict): Values for all placeholders. They are converted with str().
+
+        Returns:
+            str: The rendered text.
+
+        Raises:
+            KeyError: If a placeholder has no value.
+        """
+        chunks = [self._literals[0]]
+        for field, literal in zip(self._fields, self._literals[1:]):
+            chunks.append(str(context[field]))
+            chunks.append(literal)
+        return "".join(chunks)
+
+
+def read_template_file(name):
+    """
+    Reads a file from the template directory.
+
+    Args:
+        name (str): File name, e.g. "pi.html".
+
+    Returns:
+        str: The file content.
+    """
+    with open(os.path.join(TEMPLATE_DIR, name), "r", encoding="utf-8") as file:
+        return file.read()
+
+
+@functools.lru_cache(maxsize=None)
+def load_template(name):
+    """
+    Loads and compiles a template once per process.
+
+    Args:
+        name (str): File name in the template directory.
+
+    Returns:
+        Template: The compiled template.
+    """
+    return Template(read_template_file(name))
@@ -0,0 +1,143 @@
+"""
+Persistent record of scheduled runs.
+
+Every run of a job is identified by its slot, the planned Unix time of the run.
+Before a job runs its slot is claimed in an append-only file, and the claim is
+fsync'd to disk. A slot that has been claimed once is never run again, not even
+after a crash or reboot, so each slot is sent at most once.
+"""
+
+import os
+import threading
+import time
+
+
+class RunLedger:
+    """
+    Append-only ledger of claimed and completed job slots.
+
+    The file is read once when the ledger is opened. Afterwards the latest slot
+    of every job is kept in memory and the file is only appended to.
+    """
+
+    CLAIMED = "claimed"
+    DONE = "done"
+    FAILED = "failed"
+
+    # Rewrite the file once it holds this many more lines than there are jobs
+    COMPACT_THRESHOLD = 1000
+
+    def __init__(self, filename):
+        """
+        Initialize the RunLedger object and load the existing records.
+
+        Args:
+            filename (str): Path to the ledger file.
+        """
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._latest = {}
+        line_count = self._load()
+        if line_count > len(self._latest) + self.COMPACT_THRESHOLD:
+            self._compact()
+        self._file = open(self.filename, "a", encoding="utf-8")
+
+    def _load(self):
+        """
+        Reads the ledger file once and keeps the latest record per job.
+
+        Returns:
+            int: The number of lines in the file.
+        """
+        line_count = 0
+        try:
+            with open(self.filename, "r", encoding="utf-8") as file:
+                for line in file:
+                    line_count += 1
+                    parts = line.rstrip("\n").split("\t")
+                    # A torn last line after a power loss is simply ignored
+                    if len(parts) != 4:
+                        continue
+                    job_name, slot, state, _ = parts
+                    try:
+                        slot = float(slot)
+                    except ValueError:
+                        continue
+                    latest = self._latest.get(job_name)
+                    if latest is None or slot >= latest[0]:
+                        self._latest[job_name] = (slot, state)
+        except FileNotFoundError:
+            pass
+        return line_count
+
+    def _compact(self):
+        """
+        Rewrites the file with only the latest record of each job.
+        """
+        temp_filename = self.filename + ".tmp"
+        with open(temp_filename, "w", encoding="utf-8") as file:
+            for job_name, (slot, state) in self._latest.items():
+                file.write(self._format(job_name, slot, state))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_filename, self.filename)
+
+    @staticmethod
+    def _format(job_name, slot, state):
+        return f"{job_name}\t{slot:.3f}\t{state}\t{time.time():.0f}\n"
+
+    def _append(self, job_name, slot, state):
+        self._file.write(self._format(job_name, slot, state))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._latest[job_name] = (slot, state)
+
+    def last_slot(self, job_name):
+        """
+        Returns the latest slot that was claimed for a job.
+
+        Args:
+            job_name (str): Name of the job.
+
+        Returns:
+            float: The slot as Unix time, or None if the job never ran.
+        """
+        latest = self._latest.get(job_name)
+        return None if latest is None else latest[0]
+
+    def claim(self, job_name, slot):
+        """
+        Claims a slot before the job runs.
+
+        Args:
+            job_name (str): Name of the job.
+            slot (float): The planned Unix time of the run.
+
+        Returns:
+            bool: True if the slot was claimed, False if it (or a later slot) already ran.
+        """
+        with self._lock:
+            latest = self._latest.get(job_name)
+            if latest is not None and slot <= latest[0]:
+                return False
+            self._append(job_name, slot, self.CLAIMED)
+            return True
+
+    def complete(self, job_name, slot, success=True):
+        """
+        Records the outcome of a claimed slot.
+
+        Args:
+            job_name (str): Name of the job.
+            slot (float): The planned Unix time of the run.
+            success (bool): Whether the job finished without an error.
+        """
+        with self._lock:
+            self._append(job_name, slot, self.DONE if success else self.FAILED)
+
+    def close(self):
+        """
+        Closes the ledger file.
+        """
+        with self._lock:
+            self._file.close()
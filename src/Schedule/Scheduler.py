@@ -0,0 +1,495 @@
+"""
+Deadline based job scheduler.
+
+All jobs are kept in a min-heap ordered by their next deadline. A single
+thread sleeps exactly until the earliest deadline, so there are no wakeups
+between scheduled runs. Adding or removing jobs interrupts the sleep.
+
+Each run belongs to a slot, the planned wall-clock time of the run. The
+deadline of a slot is converted to the monotonic clock once, so the sleep is
+not affected by clock adjustments. With a RunLedger every slot runs at most
+once, and slots missed while the service was down are caught up on startup.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+class CronSpec:
+    """
+    A cron-style schedule: "minute hour day-of-month month day-of-week".
+
+    Every field accepts "*", single values, ranges ("1-5"), lists ("0,30")
+    and steps ("*/15", "0-30/10"). Day-of-week uses 0 (or 7) for Sunday.
+    """
+
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        """
+        Initialize the CronSpec object.
+
+        Args:
+            expression (str): The cron expression with five fields.
+
+        Raises:
+            ValueError: If the expression is malformed.
+        """
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: '{expression}'")
+
+        self.expression = expression
+        minutes, hours, days, months, weekdays = (
+            self._parse_field(part, low, high) for part, (low, high) in zip(parts, self.FIELDS)
+        )
+        self.minutes = sorted(minutes)
+        self.hours = sorted(hours)
+        self.days = days
+        self.months = months
+        # Sunday may be written as 0 or 7
+        self.weekdays = {day % 7 for day in weekdays}
+        self._any_day = parts[2] == "*"
+        self._any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def _parse_field(field, low, high):
+        """
+        Parses a single cron field into the set of matching values.
+
+        Args:
+            field (str): The cron field.
+            low (int): The lowest allowed value.
+            high (int): The highest allowed value.
+
+        Returns:
+            set: All values matched by the field.
+        """
+        values = set()
+        for item in field.split(","):
+            step = 1
+            if "/" in item:
+                item, step_text = item.split("/", 1)
+                step = int(step_text)
+                if step < 1:
+                    raise ValueError(f"Invalid step in cron field '{field}'")
+            if item == "*":
+                start, end = low, high
+            elif "-" in item:
+                start_text, end_text = item.split("-", 1)
+                start, end = int(start_text), int(end_text)
+            else:
+                start = int(item)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end:
+                raise ValueError(f"Value out of range in cron field '{field}'")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment):
+        """
+        Checks the day-of-month and day-of-week fields with cron semantics.
+
+        If both fields are restricted, a day matches when either of them matches.
+        """
+        day_match = moment.day in self.days
+        weekday_match = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day:
+            return weekday_match
+        if self._any_weekday:
+            return day_match
+        return day_match or weekday_match
+
+    def next_after(self, timestamp):
+        """
+        Calculates the next matching point in time.
+
+        Args:
+            timestamp (float): Unix time to start searching from (exclusive).
+
+        Returns:
+            float: Unix time of the next matching minute.
+        """
+        candidate = datetime.fromtimestamp(timestamp).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        end = candidate + timedelta(days=366 * 5)
+
+        while candidate < end:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            hour = next((hour for hour in self.hours if hour >= candidate.hour), None)
+            if hour is None:
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if hour != candidate.hour:
+                candidate = candidate.replace(hour=hour, minute=0)
+            minute = next((minute for minute in self.minutes if minute >= candidate.minute), None)
+            if minute is None:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+                continue
+            return candidate.replace(minute=minute).timestamp()
+
+        raise ValueError(f"Cron expression never matches: '{self.expression}'")
+
+    def previous_before(self, timestamp):
+        """
+        Calculates the previous matching point in time, searching backwards like next_after().
+
+        Args:
+            timestamp (float): Unix time to start searching from (exclusive).
+
+        Returns:
+            float: Unix time of the previous matching minute.
+        """
+        candidate = datetime.fromtimestamp(timestamp).replace(second=0, microsecond=0)
+        if candidate.timestamp() >= timestamp:
+            candidate -= timedelta(minutes=1)
+        end = candidate - timedelta(days=366 * 5)
+
+        while candidate > end:
+            if candidate.month not in self.months:
+                # The last minute of the month before
+                candidate = candidate.replace(day=1, hour=23, minute=59) - timedelta(days=1)
+                continue
+            if not self._day_matches(candidate):
+                candidate = candidate.replace(hour=23, minute=59) - timedelta(days=1)
+                continue
+            hour = next((hour for hour in reversed(self.hours) if hour <= candidate.hour), None)
+            if hour is None:
+                candidate = candidate.replace(hour=23, minute=59) - timedelta(days=1)
+                continue
+            if hour != candidate.hour:
+                candidate = candidate.replace(hour=hour, minute=59)
+            minute = next((minute for minute in reversed(self.minutes) if minute <= candidate.minute), None)
+            if minute is None:
+                candidate = candidate.replace(minute=59) - timedelta(hours=1)
+                continue
+            return candidate.replace(minute=minute).timestamp()
+
+        raise ValueError(f"Cron expression never matches: '{self.expression}'")
+
+    def __repr__(self):
+        return f"CronSpec('{self.expression}')"
+
+
+class IntervalSpec:
+    """
+    A fixed interval schedule, aligned to multiples of the interval since the epoch.
+    """
+
+    def __init__(self, seconds):
+        """
+        Initialize the IntervalSpec object.
+
+        Args:
+            seconds (float): The interval in seconds.
+
+        Raises:
+            ValueError: If the interval is not positive.
+        """
+        if seconds <= 0:
+            raise ValueError(f"Interval must be positive: {seconds}")
+        self.seconds = seconds
+
+    def next_after(self, timestamp):
+        """
+        Calculates the next interval boundary.
+
+        Args:
+            timestamp (float): Unix time to start searching from (exclusive).
+
+        Returns:
+            float: Unix time of the next boundary.
+        """
+        boundary = (timestamp // self.seconds + 1) * self.seconds
+        # Guard against float rounding landing on the previous boundary again
+        if boundary <= timestamp:
+            boundary += self.seconds
+        return boundary
+
+    def previous_before(self, timestamp):
+        """
+        Calculates the previous interval boundary.
+
+        Args:
+            timestamp (float): Unix time to start searching from (exclusive).
+
+        Returns:
+            float: Unix time of the previous boundary.
+        """
+        boundary = timestamp // self.seconds * self.seconds
+        if boundary >= timestamp:
+            boundary -= self.seconds
+        return boundary
+
+    def __repr__(self):
+        return f"IntervalSpec({self.seconds})"
+
+
+class Job:
+    """
+    A named job with a schedule and the action to run.
+    """
+
+    def __init__(self, name, spec, action, catch_up=None):
+        """
+        Initialize the Job object.
+
+        Args:
+            name (str): Unique name of the job.
+            spec (CronSpec | IntervalSpec): When the job should run.
+            action (callable): Called without arguments on every run.
+            catch_up (str): Catch-up policy for missed slots, None for the scheduler default.
+        """
+        if catch_up is not None and catch_up not in Scheduler.CATCH_UP_POLICIES:
+            raise ValueError(f"Job '{name}' has an unknown catch-up policy '{catch_up}'")
+        self.name = name
+        self.spec = spec
+        self.action = action
+        self.catch_up = catch_up
+        self.next_run = None
+        self.pending = []
+
+    @classmethod
+    def from_config(cls, name, options, actions):
+        """
+        Creates a job from its settings.conf entry.
+
+        Args:
+            name (str): Name of the job.
+            options (dict): The job options, either {"cron": "..."} or {"every": seconds},
+                            optionally with an "action" (defaults to "report") and a
+                            "catch_up" policy.
+            actions (dict): Maps action names to callables.
+
+        Returns:
+            Job: The configured job.
+
+        Raises:
+            ValueError: If the options are invalid.
+        """
+        if "cron" in options:
+            spec = CronSpec(options["cron"])
+        elif "every" in options:
+            spec = IntervalSpec(options["every"])
+        else:
+            raise ValueError(f"Job '{name}' needs either 'cron' or 'every'")
+
+        action_name = options.get("action", "report")
+        if action_name not in actions:
+            raise ValueError(f"Job '{name}' has an unknown action '{action_name}'")
+        return cls(name, spec, actions[action_name], options.get("catch_up"))
+
+    def __repr__(self):
+        return f"Job('{self.name}', {self.spec!r})"
+
+
+class Scheduler:
+    """
+    Runs jobs at their deadlines from a single background thread.
+
+    Catch-up policies for slots missed while the service was not running:
+        none: skip all missed slots.
+        latest: run only the most recent missed slot.
+        all: run every missed slot, at most MAX_CATCH_UP of them.
+    """
+
+    CATCH_UP_POLICIES = ("none", "latest", "all")
+    MAX_CATCH_UP = 24
+
+    def __init__(self, ledger=None, catch_up="latest"):
+        """
+        Initialize the Scheduler object.
+
+        Args:
+            ledger (RunLedger): Optional ledger to record runs and catch up missed slots.
+            catch_up (str): Default catch-up policy for jobs without their own.
+        """
+        if catch_up not in self.CATCH_UP_POLICIES:
+            raise ValueError(f"Unknown catch-up policy '{catch_up}'")
+        self.ledger = ledger
+        self.catch_up = catch_up
+        self._heap = []
+        self._jobs = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def add_job(self, job, catch_up=True):
+        """
+        Adds a job, replacing any job with the same name.
+
+        Missed slots since the last recorded run are queued according to the catch-up policy.
+
+        Args:
+            job (Job): The job to schedule.
+            catch_up (bool): False to only schedule future slots, e.g. when a changed job
+                             replaces the old one while the service keeps running.
+        """
+        now = time.time()
+        missed = self._missed_slots(job, now) if catch_up else []
+        with self._lock:
+            self._jobs[job.name] = job
+            if missed:
+                print(f"Catching up {len(missed)} missed run(s) of job '{job.name}'")
+                # Missed slots are due right away and run oldest first
+                self._push(job, missed[0], now)
+                job.pending = missed[1:]
+            else:
+                job.pending = []
+                self._push(job, job.spec.next_after(now), now)
+        self._wakeup.set()
+
+    def _missed_slots(self, job, now):
+        """
+        Determines the slots missed since the last recorded run of a job.
+
+        Args:
+            job (Job): The job.
+            now (float): The current Unix time.
+
+        Returns:
+            list: The missed slots to run, oldest first.
+        """
+        policy = job.catch_up or self.catch_up
+        if self.ledger is None or policy == "none":
+            return []
+        last_slot = self.ledger.last_slot(job.name)
+        if last_slot is None:
+            return []
+
+        # The latest slot up to now is found directly, however long the service was down
+        latest = job.spec.previous_before(now)
+        following = job.spec.next_after(latest)
+        if following <= now:
+            latest = following
+        if latest <= last_slot:
+            return []
+        if policy == "latest":
+            return [latest]
+
+        # Only the newest slots are run, walking back from the latest one
+        missed = [latest]
+        while len(missed) < self.MAX_CATCH_UP:
+            slot = job.spec.previous_before(missed[-1])
+            if slot <= last_slot:
+                break
+            missed.append(slot)
+        missed.reverse()
+        return missed
+
+    def remove_job(self, name):
+        """
+        Removes a job by name. Unknown names are ignored.
+
+        Args:
+            name (str): Name of the job.
+        """
+        with self._lock:
+            self._jobs.pop(name, None)
+        self._wakeup.set()
+
+    def jobs(self):
+        """
+        Returns:
+            list: The scheduled jobs ordered by their next run.
+        """
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.next_run)
+
+    def _push(self, job, slot, now):
+        """
+        Queues the next slot of a job. The wall-clock slot is converted to a monotonic deadline.
+        """
+        job.next_run = slot
+        deadline = time.monotonic() + max(0.0, slot - now)
+        heapq.heappush(self._heap, (deadline, next(self._counter), job, slot))
+
+    def _pop_due(self):
+        """
+        Pops the next due job, or returns the time to sleep if nothing is due.
+
+        Stale heap entries of removed or rescheduled jobs are dropped here.
+        """
+        with self._lock:
+            while self._heap:
+                deadline, _, job, slot = self._heap[0]
+                if self._jobs.get(job.name) is not job or job.next_run != slot:
+                    heapq.heappop(self._heap)
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    return None, None, remaining
+                heapq.heappop(self._heap)
+                return job, slot, 0
+            return None, None, None
+
+    def _run_slot(self, job, slot):
+        """
+        Runs one slot of a job, recording it in the ledger if there is one.
+        """
+        if self.ledger is not None and not self.ledger.claim(job.name, slot):
+            print(f"Job '{job.name}' already ran for slot {time.ctime(slot)}, skipping")
+            return
+
+        success = True
+        try:
+            job.action()
+        except Exception as e:
+            success = False
+            print(f"Job '{job.name}' failed:", e)
+
+        if self.ledger is not None:
+            self.ledger.complete(job.name, slot, success)
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.clear()
+            job, slot, timeout = self._pop_due()
+            if job is None:
+                # Sleep until the next deadline or until the job list changes
+                self._wakeup.wait(timeout)
+                continue
+
+            self._run_slot(job, slot)
+
+            with self._lock:
+                if self._jobs.get(job.name) is job:
+                    now = time.time()
+                    if job.pending:
+                        self._push(job, job.pending.pop(0), now)
+                    else:
+                        # The next slot after now: slots that passed during a late run are skipped
+                        # instead of piling up, and a clock set back can't repeat the slot that just ran
+                        self._push(job, job.spec.next_after(max(now, slot)), now)
+
+    def start(self):
+        """
+        Starts the scheduler thread.
+        """
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the scheduler thread after the current job has finished.
+        """
+        self._stopped = True
+        self._wakeup.set()
+
+    def join(self):
+        """
+        Blocks until the scheduler thread has stopped.
+        """
+        if self._thread is not None:
+            self._thread.join()
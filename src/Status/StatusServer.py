@@ -0,0 +1,163 @@
+"""
+Local HTTP endpoint serving the latest status of the host from memory.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class CachedResponse:
+    """
+    A response body prepared once: its ETag and gzip-compressed form are computed on publishing.
+    """
+
+    __slots__ = ("body", "gzipped", "etag", "content_type")
+
+    def __init__(self, body, content_type):
+        self.body = body
+        self.gzipped = gzip.compress(body, 6)
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        self.content_type = content_type
+
+    def matches(self, if_none_match):
+        """
+        Args:
+            if_none_match (str): The If-None-Match header of the request.
+
+        Returns:
+            bool: True if the client already has this version.
+        """
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        # Weak tags match too, the body is the same for both encodings
+        return "*" in tags or any((tag[2:] if tag.startswith("W/") else tag) == self.etag for tag in tags)
+
+
+class _StatusHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = 120
+
+    def _respond(self, send_body):
+        response = self.server.status.responses.get(self.path.split("?", 1)[0])
+        if response is None:
+            self.send_error(404 if self.server.status.responses else 503)
+            return
+
+        if response.matches(self.headers.get("If-None-Match")):
+            self.send_response(304)
+            self.send_header("ETag", response.etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body = response.body
+        use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+        if use_gzip:
+            body = response.gzipped
+        self.send_response(200)
+        self.send_header("Content-Type", response.content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", response.etag)
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Cache-Control", "no-cache")
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._respond(True)
+
+    def do_HEAD(self):
+        self._respond(False)
+
+    def log_message(self, format, *args):
+        # Dashboards poll often, don't print a line for every request
+        pass
+
+
+class StatusServer:
+    """
+    Serves the latest snapshot as JSON and the rendered report as HTML.
+
+    Requests never collect anything: a background thread refreshes the status
+    every interval seconds and publishes the prepared responses, which the
+    request handlers only look up. Clients can revalidate with If-None-Match
+    and get the body gzip-compressed.
+
+    Paths:
+        /status.json: The snapshot.
+        /status.html, /: The report as it would be mailed.
+    """
+
+    def __init__(self, refresh, host="127.0.0.1", port=8080, interval=60):
+        """
+        Initialize the StatusServer object.
+
+        Args:
+            refresh (callable): Called without arguments, returns the current Snapshot and report HTML.
+            host (str): Address to listen on.
+            port (int): Port to listen on, 0 for any free port.
+            interval (float): Seconds between two refreshes.
+        """
+        self.refresh = refresh
+        self.interval = interval
+        self.responses = {}
+        self.updated_at = None
+
+        self.server = ThreadingHTTPServer((host, port), _StatusHandler)
+        self.server.daemon_threads = True
+        self.server.status = self
+        self._stop = threading.Event()
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def publish(self, snapshot, report_html):
+        """
+        Replaces the served status.
+
+        Args:
+            snapshot (Snapshot): The current snapshot.
+            report_html (str): The rendered report.
+        """
+        page = CachedResponse(report_html.encode("utf-8"), "text/html; charset=utf-8")
+        # One dict swap, so a request sees either the old or the new status, never a mix
+        self.responses = {
+            "/status.json": CachedResponse(json.dumps(snapshot._asdict()).encode("utf-8"), "application/json"),
+            "/status.html": page,
+            "/": page,
+        }
+        self.updated_at = time.time()
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.publish(*self.refresh())
+            except Exception as e:
+                print("Error refreshing the status:", e)
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self):
+        """
+        Starts the refresh thread and serving in a background thread.
+        """
+        threading.Thread(target=self._refresh_loop, name="status-refresh", daemon=True).start()
+        threading.Thread(target=self.server.serve_forever, name="status-server", daemon=True).start()
+        print(f"Status endpoint listening on port {self.port}")
+
+    def stop(self):
+        """
+        Stops refreshing and serving.
+        """
+        self._stop.set()
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,149 @@
+"""
+Concurrent collection of independent values with timeouts.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+
+class CollectionResult:
+    """
+    The outcome of one pipeline run.
+
+    Every collector has a status:
+        ok: collected in this run.
+        stale: timed out or failed, the value of an earlier run is used.
+        missing: timed out or failed and no earlier value exists.
+    """
+
+    OK = "ok"
+    STALE = "stale"
+    MISSING = "missing"
+
+    def __init__(self):
+        self.values = {}
+        self.status = {}
+        self.durations = {}
+        self.errors = {}
+        self.elapsed = 0.0
+
+    def names(self, status):
+        """
+        Args:
+            status (str): One of OK, STALE or MISSING.
+
+        Returns:
+            list: The names of all collectors with that status.
+        """
+        return [name for name, value in self.status.items() if value == status]
+
+    def summary(self):
+        """
+        Returns:
+            str: A one-line description of the run.
+        """
+        text = f"Collected {len(self.names(self.OK))}/{len(self.status)} values in {self.elapsed:.2f}s"
+        for status in (self.STALE, self.MISSING):
+            names = self.names(status)
+            if names:
+                text += f"; {status}: {', '.join(names)}"
+        return text
+
+
+class CollectionPipeline:
+    """
+    Runs registered collectors in parallel with a timeout per collector and a total deadline.
+
+    Every collector runs in its own daemon thread, so a call that never returns
+    (a stalled HTTP request, a hung mount) can't block the report or the exit of
+    the process. While such a call is still running it is not started again.
+    """
+
+    def __init__(self, timeout=5, deadline=10):
+        """
+        Initialize the CollectionPipeline object.
+
+        Args:
+            timeout (float): Default timeout per collector in seconds.
+            deadline (float): Maximum time for the whole run in seconds.
+        """
+        self.timeout = timeout
+        self.deadline = deadline
+        self._collectors = {}
+        self._running = {}
+        self._last_values = {}
+
+    def add(self, name, function, timeout=None):
+        """
+        Registers a collector.
+
+        Args:
+            name (str): Name of the collected value.
+            function (callable): Called without arguments, returns the value.
+            timeout (float): Timeout for this collector, None for the default.
+        """
+        self._collectors[name] = (function, self.timeout if timeout is None else timeout)
+
+    @staticmethod
+    def _start(function):
+        future = Future()
+
+        def target():
+            if not future.set_running_or_notify_cancel():
+                return
+            started = time.monotonic()
+            try:
+                value = function()
+            except BaseException as e:
+                future.duration = time.monotonic() - started
+                future.set_exception(e)
+            else:
+                future.duration = time.monotonic() - started
+                future.set_result(value)
+
+        threading.Thread(target=target, daemon=True).start()
+        return future
+
+    def run(self, deadline=None):
+        """
+        Runs all collectors and waits for them until their timeout or the deadline.
+
+        Args:
+            deadline (float): Maximum time for this run in seconds, None for the default deadline.
+
+        Returns:
+            CollectionResult: The collected values and their status.
+        """
+        start = time.monotonic()
+        deadline = start + (self.deadline if deadline is None else deadline)
+        result = CollectionResult()
+
+        futures = {}
+        for name, (function, timeout) in self._collectors.items():
+            future = self._running.get(name)
+            if future is None or future.done():
+                future = self._running[name] = self._start(function)
+            futures[name] = (future, min(start + timeout, deadline))
+
+        for name, (future, until) in futures.items():
+            try:
+                value = future.result(timeout=max(0.0, until - time.monotonic()))
+            except TimeoutError:
+                result.errors[name] = "timed out"
+            except Exception as e:
+                result.errors[name] = str(e)
+            else:
+                result.values[name] = self._last_values[name] = value
+                result.status[name] = CollectionResult.OK
+                result.durations[name] = future.duration
+                continue
+
+            if name in self._last_values:
+                result.values[name] = self._last_values[name]
+                result.status[name] = CollectionResult.STALE
+            else:
+                result.status[name] = CollectionResult.MISSING
+
+        result.elapsed = time.monotonic() - start
+        return result
@@ -1,17 +1,25 @@
 """
-Deprecated
+Collection of the system information for the reports, the status endpoint and the fleet agent.
 
-Not needed anymore
+Uptime, disk, CPU, RAM, mounts, processes and both IP addresses are collected
+concurrently by a CollectionPipeline, each with its own timeout. The static
+facts of the host come from HostFacts, the raw values from the fastest probe.
 
 By: Timothy
 """
 import sys
+import threading
 import time
-import psutil
-import requests
-import platform
 import socket
-import os
+
+from ..Telemetry.Instrumentation import instrumentation
+from .CollectionPipeline import CollectionPipeline
+from .DiskCollector import DiskCollector
+from .GlobalIPResolver import GlobalIPResolver
+from .HostFacts import HostFacts
+from .ProcessScanner import ProcessScanner
+from .Snapshot import Snapshot
+from .SystemProbe import create_probe
 
 
 class DataCollector:
@@ -23,8 +31,41 @@ class DataCollector:
     and for obtaining the global IP address.
     """
 
-    def __init__(self):
-        pass
+    def __init__(self, sampler=None, collector_timeout=5, collect_deadline=10, ip_resolver=None, metric_store=None,
+                 probe=None, host_facts=None, disk_timeout=2, top_processes=5, process_budget=0.5):
+        """
+        Initialize the DataCollector object.
+
+        Args:
+            sampler (MetricSampler): Optional background sampler. If it has samples,
+                                     the CPU usage is read from it instead of blocking.
+            collector_timeout (float): Timeout in seconds for every single value in collect().
+            collect_deadline (float): Maximum time in seconds for the whole collect() call.
+            ip_resolver (GlobalIPResolver): Resolver for the global IP address, by default
+                                            one with the standard providers and no disk cache.
+            metric_store (MetricStore): Optional store of the sampled metrics, for the
+                                        24-hour and 7-day history in collect().
+            probe (PsutilProbe): Backend the values are read with, by default the fastest
+                                 one available (/proc on Linux, psutil elsewhere).
+            host_facts (HostFacts): The static facts of the host, determined once and shared.
+            disk_timeout (float): Seconds the usage of every single mount may take.
+            top_processes (int): Number of processes listed by CPU, RAM and I/O, 0 to not scan them.
+            process_budget (float): Seconds a scan of the processes may take.
+        """
+        self.probe = probe if probe is not None else create_probe()
+        self.host_facts = host_facts if host_facts is not None else HostFacts()
+        self.sampler = sampler
+        self.metric_store = metric_store
+        self.ip_resolver = ip_resolver if ip_resolver is not None else GlobalIPResolver()
+        self.disks = DiskCollector(self.probe, disk_timeout)
+        self.processes = ProcessScanner(top_processes, process_budget) if top_processes > 0 else None
+        self.collector_timeout = collector_timeout
+        self.collect_deadline = collect_deadline
+        self.pipeline = None
+        self._pipeline_disk_path = None
+        self._collect_lock = threading.Lock()
+        # The snapshot of the last collection and its time.monotonic(), for readers that accept a recent one
+        self.latest_snapshot = (None, 0.0)
 
     @staticmethod
     def get_local_ip():
@@ -56,115 +97,233 @@ class DataCollector:
             # If there's an error retrieving the IP address, return None
             return None
 
-    @staticmethod
-    def get_operating_system():
+    def get_operating_system(self):
         """
         Checks the operating system and returns a message along with the detected system type.
 
         Returns:
             str: The detected system type (Windows, Linux, Raspberry).
         """
-        # Get the system type
-        system = platform.system()
+        # Detected once and kept in the host facts
+        system = self.host_facts.operating_system
 
-        # Check if the system is Windows
         if system == "Windows":
             print("You are on a Windows system.")
-            return "Windows"
-        # Check if the system is Linux
+        elif system == "Raspberry":
+            print("You are on a Raspberry Pi.")
         elif system == "Linux":
-            # Check if it's a Raspberry Pi
-            if platform.machine() == "armv7l" or os.path.exists('/boot/config.txt'):
-                print("You are on a Raspberry Pi.")
-                return "Raspberry"
-            else:
-                print("You are on a Linux system.")
-                return "Linux"
+            print("You are on a Linux system.")
         else:
             print("The operating system is not recognized. Exiting...")
             sys.exit(1)
+        return system
 
-    @staticmethod
-    def system_info(disk_path):
+    def get_uptime(self):
         """
-        Collects information about the system.
-
-        Args:
-            disk_path (str): The path to the disk to collect information from.
+        Collects the system uptime.
 
         Returns:
-            dict: A dictionary containing system information including
-                  uptime, disk usage, and CPU usage.
+            dict: The uptime split into days, hours, minutes and seconds, and the boot time.
         """
         # System uptime in seconds since the last boot
-        uptime_seconds = time.time() - psutil.boot_time()
+        uptime_seconds = self.probe.uptime_seconds()
 
         # Convert seconds to days, hours, minutes, and seconds
         days, remainder = divmod(uptime_seconds, 86400)
         hours, remainder = divmod(remainder, 3600)
         minutes, seconds = divmod(remainder, 60)
 
-        # Disk information
-        disk_usage = psutil.disk_usage(disk_path)
-        total_disk_gb = disk_usage.total / (1024 ** 3)  # Total disk space in gigabytes
-        used_disk_gb = disk_usage.used / (1024 ** 3)  # Used disk space in gigabytes
-        free_disk_gb = disk_usage.free / (1024 ** 3)  # Free disk space in gigabytes
-
-        # CPU usage
-        cpu_percent_now = psutil.cpu_percent(interval=1)
-        cpu_freq = psutil.cpu_freq()
-        cpu_physical = psutil.cpu_count(logical=False)
-
-        # RAM-Information
-        ram = psutil.virtual_memory()
-        total_ram_gb = ram.total / (1024 ** 3)
-        used_ram_gb = ram.used / (1024 ** 3)
-        available_ram_gb = ram.available / (1024 ** 3)
-        ram_percent = ram.percent
-
-        # Partitions
-        disk_partitions = psutil.disk_partitions(all=True)
-
         return {
             "uptime_days": int(days),
             "uptime_hours": int(hours),
             "uptime_minutes": int(minutes),
             "uptime_seconds": int(seconds),
-            "total_memory": total_disk_gb,
-            "used_memory": used_disk_gb,
-            "free_memory": free_disk_gb,
+            "boot_time": time.time() - uptime_seconds
+        }
+
+    def get_disk_usage(self, disk_path):
+        """
+        Collects the usage of a disk.
+
+        Args:
+            disk_path (str): The path to the disk to collect information from.
+
+        Returns:
+            dict: Total, used and free disk space in gigabytes, and the same in bytes.
+        """
+        total, used, free, _ = self.probe.disk_usage(disk_path)
+        return {
+            "total_memory": total / (1024 ** 3),  # Total disk space in gigabytes
+            "used_memory": used / (1024 ** 3),  # Used disk space in gigabytes
+            "free_memory": free / (1024 ** 3),  # Free disk space in gigabytes
+            "disk_total_bytes": total,
+            "disk_used_bytes": used,
+            "disk_free_bytes": free
+        }
+
+    def get_cpu_info(self):
+        """
+        Collects the CPU usage, from the sampler if possible to avoid blocking for a second.
+
+        Returns:
+            dict: Current usage and frequency in MHz. With a sampler, "metrics"
+                  holds the latest, min, avg, max and p95 values of every sampled metric
+                  over its window.
+        """
+        metrics = None
+        metrics_window = 0
+        if self.sampler is not None and self.sampler.has_samples():
+            metrics = self.sampler.summary()
+            metrics_window = self.sampler.window_seconds
+            cpu_percent_now = metrics["cpu_percent"]["latest"]
+        else:
+            cpu_percent_now = self.probe.cpu_percent(interval=1)
+
+        return {
             "cpu_percent_now": cpu_percent_now,
-            "cpu_freq": cpu_freq,
-            "cpu_physical": cpu_physical,
-            "total_ram_gb": total_ram_gb,
-            "used_ram_gb": used_ram_gb,
-            "available_ram_gb": available_ram_gb,
-            "ram_percent": ram_percent,
-            "disk_partitions": disk_partitions
+            "cpu_freq_mhz": self.probe.cpu_freq_mhz(),
+            "metrics": metrics,
+            "metrics_window": metrics_window
         }
 
-    @staticmethod
-    def get_global_ip():
+    def get_ram_info(self):
+        """
+        Collects the RAM usage.
+
+        Returns:
+            dict: Total, used and available RAM in gigabytes, the same in bytes and the usage in percent.
+        """
+        total, used, available, percent = self.probe.memory()
+        return {
+            "total_ram_gb": total / (1024 ** 3),
+            "used_ram_gb": used / (1024 ** 3),
+            "available_ram_gb": available / (1024 ** 3),
+            "ram_percent": percent,
+            "ram_total_bytes": total,
+            "ram_used_bytes": used,
+            "ram_available_bytes": available
+        }
+
+    def get_disks(self):
+        """
+        Collects the usage of every real mount, a hung network mount is reported as unavailable.
+
+        Returns:
+            dict: "disk_mounts" with a MountUsage per mount and "mounts" with the sorted mount points.
+        """
+        usages = self.disks.collect()
+        return {"disk_mounts": usages, "mounts": tuple(usage.mountpoint for usage in usages)}
+
+    def get_processes(self):
+        """
+        Collects the processes using the most CPU, RAM and I/O since the last call.
+
+        Returns:
+            dict: "processes" with the ProcessTop, None if the scan is disabled.
+        """
+        return {"processes": self.processes.scan() if self.processes is not None else None}
+
+    def get_history(self):
+        """
+        Collects the min, avg and max of CPU, RAM and disk usage over the last 24 hours and 7 days,
+        and their series over the last 24 hours.
+
+        Returns:
+            dict: "history" with the summaries by period and "trends" with the series by metric,
+                  both None without a metric store.
+        """
+        if self.metric_store is None:
+            return {"history": None, "trends": None}
+        return {"history": self.metric_store.history(), "trends": self.metric_store.trends()}
+
+    def system_info(self, disk_path):
+        """
+        Collects information about the system one value after the other.
+
+        Args:
+            disk_path (str): The path to the disk to collect information from.
+
+        Returns:
+            dict: A dictionary containing system information including
+                  uptime, disk usage, and CPU usage.
+        """
+        info = self.host_facts.as_dict()
+        info.update(self.get_uptime())
+        info.update(self.get_disk_usage(disk_path))
+        info.update(self.get_cpu_info())
+        info.update(self.get_ram_info())
+        info.update(self.get_disks())
+        info.update(self.get_processes())
+        return info
+
+    def collect(self, disk_path, deadline=None):
+        """
+        Collects the system information and both IP addresses concurrently.
+
+        Every collector has its own timeout and the whole collection is bounded by a deadline.
+        Values that could not be collected in time are taken from the previous run (stale)
+        or left out (missing). Calls from several threads (scheduler, status endpoint, fleet agent)
+        run one after the other, the pipeline and the scanners keep state between runs.
+
+        Args:
+            disk_path (str): The path to the disk to collect information from.
+            deadline (float): Maximum time in seconds for this call, None for collect_deadline.
+
+        Returns:
+            dict: The system information like system_info, plus "local_ip", "global_ip",
+                  "global_ip_changed", "history", "collection" with the CollectionResult
+                  of the run and "snapshot" with the values as Snapshot.
+        """
+        with self._collect_lock:
+            return self._collect(disk_path, deadline)
+
+    def _collect(self, disk_path, deadline):
+        taken_at = time.time()
+        if self.pipeline is None or self._pipeline_disk_path != disk_path:
+            self.pipeline = CollectionPipeline(self.collector_timeout, self.collect_deadline)
+            self.pipeline.add("uptime", self.get_uptime)
+            self.pipeline.add("disk", lambda: self.get_disk_usage(disk_path))
+            self.pipeline.add("cpu", self.get_cpu_info)
+            self.pipeline.add("ram", self.get_ram_info)
+            self.pipeline.add("disks", self.get_disks)
+            if self.processes is not None:
+                self.pipeline.add("processes", self.get_processes)
+            self.pipeline.add("local_ip", self.get_local_ip)
+            self.pipeline.add("global_ip", self.get_global_ip)
+            self.pipeline.add("history", self.get_history)
+            self._pipeline_disk_path = disk_path
+
+        with instrumentation.stage("collect"):
+            result = self.pipeline.run(deadline)
+        print(result.summary())
+        for name, seconds in result.durations.items():
+            instrumentation.record(f"collect.{name}", seconds)
+
+        info = {"local_ip": None, "global_ip": None}
+        info.update(self.host_facts.as_dict())
+        for name, value in result.values.items():
+            if isinstance(value, dict):
+                info.update(value)
+            else:
+                info[name] = value
+        info["global_ip_changed"] = self.ip_resolver.changed
+        info["collection"] = result
+        info["snapshot"] = Snapshot.from_info(info, taken_at)
+        self.latest_snapshot = (info["snapshot"], time.monotonic())
+        return info
+
+    def get_global_ip(self):
         """
         Retrieves the global IP address.
 
+        The address is cached by the resolver and only fetched again once its TTL has expired.
+
         Returns:
             str: The global IP address of the device.
                  None if the IP address retrieval fails.
         """
         try:
-            # API endpoint for retrieving the global IP address
-            url = 'https://api.ipify.org'
-
-            # Send HTTP request to the API
-            response = requests.get(url)
-
-            # Check response and extract the global IP address
-            if response.status_code == 200:
-                return response.text
-            else:
-                print("Error retrieving global IP:", response.status_code)
-                return None
+            return self.ip_resolver.resolve()
         except Exception as e:
             print("Error:", e)
             return None
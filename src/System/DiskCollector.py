@@ -0,0 +1,222 @@
+"""
+Usage of all real mounts, read in parallel with a hard timeout per mount.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import NamedTuple, Optional
+
+# Kernel and virtual file systems, they have no storage worth reporting
+PSEUDO_FILESYSTEMS = frozenset({
+    "autofs", "binfmt_misc", "bpf", "cgroup", "cgroup2", "configfs", "debugfs", "devpts", "devtmpfs",
+    "efivarfs", "fusectl", "hugetlbfs", "mqueue", "nsfs", "proc", "pstore", "ramfs", "rpc_pipefs",
+    "securityfs", "selinuxfs", "sysfs", "tracefs", "tmpfs", "nfsd",
+    # The merged views of container layers, on Docker hosts there is one per container
+    "overlay",
+    # Read-only images of snaps, always 100% full
+    "squashfs",
+})
+
+# File systems whose statvfs() goes over the network and may block forever
+NETWORK_FILESYSTEMS = frozenset({
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs", "9p", "ceph", "glusterfs", "fuse.glusterfs", "davfs",
+})
+
+
+class MountUsage(NamedTuple):
+    """
+    The usage of one mount.
+
+    status is "ok", "hung" (statvfs did not return in time, the mount is not
+    queried again until that call returns), "skipped" (not queried before the
+    deadline) or "error". The byte values are None unless the status is "ok".
+    """
+
+    mountpoint: str
+    device: str
+    fstype: str
+    status: str
+    total: Optional[int] = None
+    used: Optional[int] = None
+    free: Optional[int] = None
+    percent: Optional[float] = None
+
+    @property
+    def available(self):
+        return self.status == "ok"
+
+    @property
+    def network(self):
+        return self.fstype in NETWORK_FILESYSTEMS
+
+
+def real_partitions(partitions):
+    """
+    Filters the pseudo file systems, empty drives and bind mounts out of a partition list.
+
+    Args:
+        partitions (list): Device, mount point, file system type and options, as returned by the probe.
+
+    Returns:
+        list: The remaining partitions in their order.
+    """
+    devices = set()
+    result = []
+    for device, mountpoint, fstype, opts in partitions:
+        # The root file system is always kept, in containers or the read-only mode
+        # of Raspberry Pi OS it may well be an overlay or even a tmpfs
+        if mountpoint != "/":
+            # Empty CD drives on Windows have no file system
+            if not fstype or fstype in PSEUDO_FILESYSTEMS or "cdrom" in opts.split(","):
+                continue
+        # The same block device mounted again is a bind mount, the first mount point counts
+        if device.startswith("/dev/"):
+            if device in devices:
+                continue
+            devices.add(device)
+        result.append((device, mountpoint, fstype, opts))
+    return result
+
+
+class _WorkerPool:
+    """
+    A fixed number of daemon threads that run the usage queries.
+
+    A worker stuck in a hung call is given up and replaced, so the pool keeps
+    its size and a stuck thread never blocks the exit of the process.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._tasks = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._workers = 0
+
+    def submit(self, function, *args):
+        """
+        Args:
+            function (callable): Called with args in a worker.
+
+        Returns:
+            Future: Its result. future.started is set when a worker picks it up.
+        """
+        future = Future()
+        future.started = None
+        future.abandoned = False
+        self._tasks.put((future, function, args))
+        with self._lock:
+            if self._workers < self.size:
+                self._workers += 1
+                threading.Thread(target=self._work, name="disk-usage", daemon=True).start()
+        return future
+
+    def abandon(self, future):
+        """
+        Gives up a running task, its worker is replaced and ends once the call returns.
+        """
+        future.abandoned = True
+        with self._lock:
+            self._workers -= 1
+
+    def _work(self):
+        while True:
+            future, function, args = self._tasks.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            future.started = time.monotonic()
+            try:
+                future.set_result(function(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            if future.abandoned:
+                # A replacement already took the place of this worker
+                return
+
+
+class DiskCollector:
+    """
+    Reads the usage of every real mount in a worker pool.
+
+    Pseudo file systems are filtered out before anything is queried. Every
+    statvfs() call gets timeout seconds; a mount that doesn't answer in time is
+    reported as hung and remembered, and it is only queried again once the hung
+    call has returned, so a stale NFS or CIFS mount costs one stuck thread, not
+    one per report.
+    """
+
+    def __init__(self, probe, timeout=2, workers=4):
+        """
+        Initialize the DiskCollector object.
+
+        Args:
+            probe (PsutilProbe): Backend that lists the partitions and reads their usage.
+            timeout (float): Seconds every single mount may take.
+            workers (int): Number of mounts queried at the same time.
+        """
+        self.probe = probe
+        self.timeout = timeout
+        self._pool = _WorkerPool(workers)
+        # Mount point -> future of the call that hung on it
+        self._hung = {}
+
+    def hung_mounts(self):
+        """
+        Returns:
+            list: Mount points whose last usage query has not returned yet.
+        """
+        return sorted(mountpoint for mountpoint, future in self._hung.items() if not future.done())
+
+    def collect(self):
+        """
+        Reads the usage of all real mounts.
+
+        Returns:
+            tuple: A MountUsage per mount, sorted by mount point.
+        """
+        partitions = real_partitions(self.probe.partitions())
+        futures = {}
+        usages = {}
+        for device, mountpoint, fstype, _ in partitions:
+            hung = self._hung.get(mountpoint)
+            if hung is not None and not hung.done():
+                usages[mountpoint] = MountUsage(mountpoint, device, fstype, "hung")
+                continue
+            self._hung.pop(mountpoint, None)
+            futures[mountpoint] = (device, fstype, self._pool.submit(self.probe.disk_usage, mountpoint))
+
+        # Queued queries get the time the ones before them might take, started ones their own timeout
+        rounds = -(-len(futures) // self._pool.size) if futures else 0
+        deadline = time.monotonic() + self.timeout * rounds
+        for mountpoint, (device, fstype, future) in futures.items():
+            while not future.done():
+                now = time.monotonic()
+                until = deadline if future.started is None else min(deadline, future.started + self.timeout)
+                if now >= until:
+                    break
+                try:
+                    future.exception(timeout=until - now)
+                except Exception:
+                    pass
+
+            if not future.done():
+                if future.cancel():
+                    usages[mountpoint] = MountUsage(mountpoint, device, fstype, "skipped")
+                else:
+                    print(f"The usage of {mountpoint} ({fstype}) did not arrive within {self.timeout}s, "
+                          f"reporting it as unavailable until the call returns")
+                    self._pool.abandon(future)
+                    self._hung[mountpoint] = future
+                    usages[mountpoint] = MountUsage(mountpoint, device, fstype, "hung")
+            elif future.exception() is not None:
+                usages[mountpoint] = MountUsage(mountpoint, device, fstype, "error")
+            else:
+                usages[mountpoint] = MountUsage(mountpoint, device, fstype, "ok", *future.result())
+
+        # Mounts that disappeared don't need to be remembered
+        current = {mountpoint for _, mountpoint, _, _ in partitions}
+        for mountpoint in list(self._hung):
+            if mountpoint not in current and self._hung[mountpoint].done():
+                del self._hung[mountpoint]
+        return tuple(usages[mountpoint] for mountpoint in sorted(usages))
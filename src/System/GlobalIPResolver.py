@@ -0,0 +1,285 @@
+"""
+Cached lookup of the global IP address from several providers.
+"""
+
+import functools
+import ipaddress
+import json
+import os
+import queue
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+@functools.lru_cache(maxsize=None)
+def _ssl_context():
+    # Imported here, ssl is only needed once a provider is actually asked
+    import ssl
+    return ssl.create_default_context()
+
+
+class GlobalIPResolver:
+    """
+    Resolves the global IP address by racing several providers.
+
+    All providers are asked at the same time and the first valid answer wins.
+    The result is cached for a TTL and persisted to disk, so a restart doesn't
+    fetch it again. The resolver also remembers the address of the last report
+    to tell whether it has changed since.
+
+    Clients:
+        http.client: the standard library, nothing to import on startup, one keep-alive connection per provider.
+        requests: one pooled session, honours the proxy environment variables.
+        auto: requests if a proxy is configured in the environment, http.client otherwise.
+    """
+
+    CLIENTS = ("auto", "http.client", "requests")
+    PROXY_VARIABLES = ("HTTPS_PROXY", "https_proxy", "HTTP_PROXY", "http_proxy", "ALL_PROXY", "all_proxy")
+
+    DEFAULT_PROVIDERS = (
+        "https://api.ipify.org",
+        "https://icanhazip.com",
+        "https://ifconfig.me/ip",
+    )
+
+    def __init__(self, providers=None, ttl=3600, cache_file=None, timeout=5, client="auto"):
+        """
+        Initialize the GlobalIPResolver object.
+
+        Args:
+            providers (list): URLs that answer with the plain IP address.
+            ttl (float): Seconds a resolved address is used before it is fetched again.
+            cache_file (str): Optional path of the file the cache is persisted to.
+            timeout (float): Seconds to wait for the providers.
+            client (str): One of CLIENTS, the HTTP client the providers are asked with.
+
+        Raises:
+            ValueError: If the client is unknown.
+        """
+        if client not in self.CLIENTS:
+            raise ValueError(f"Unknown HTTP client '{client}'")
+        if client == "auto":
+            client = "requests" if any(os.environ.get(name) for name in self.PROXY_VARIABLES) else "http.client"
+        self.providers = list(providers or self.DEFAULT_PROVIDERS)
+        self.ttl = ttl
+        self.cache_file = cache_file
+        self.timeout = timeout
+        self.client = client
+        # Created on the first lookup, so requests is never imported if the cache is fresh
+        self.session = None
+        # (scheme, host, port) -> idle http.client connection
+        self._connections = {}
+        self._connections_lock = threading.Lock()
+
+        self._lock = threading.Lock()
+        self.ip = None
+        self.fetched_at = 0.0
+        self.reported_ip = None
+        self._load()
+
+    def _load(self):
+        """
+        Loads the persisted cache, if there is one.
+        """
+        if self.cache_file is None:
+            return
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as file:
+                cache = json.load(file)
+            self.ip = cache.get("ip")
+            self.fetched_at = cache.get("fetched_at", 0.0)
+            self.reported_ip = cache.get("reported_ip")
+        except FileNotFoundError:
+            pass
+        except (ValueError, OSError) as e:
+            print("Error reading the global IP cache:", e)
+
+    def _save(self):
+        """
+        Persists the cache atomically.
+        """
+        if self.cache_file is None:
+            return
+        cache = {"ip": self.ip, "fetched_at": self.fetched_at, "reported_ip": self.reported_ip}
+        temp_file = self.cache_file + ".tmp"
+        try:
+            with open(temp_file, "w", encoding="utf-8") as file:
+                json.dump(cache, file)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            print("Error writing the global IP cache:", e)
+
+    def _create_session(self):
+        """
+        Creates the requests session with one connection pool per provider, reused for every lookup.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.providers), pool_maxsize=2)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _connect(self, parts):
+        """
+        Returns:
+            tuple: An idle keep-alive connection to the host of a provider, a new one if there is none,
+                   and whether it was used before.
+        """
+        import http.client
+        key = (parts.scheme, parts.hostname, parts.port)
+        with self._connections_lock:
+            connection = self._connections.pop(key, None)
+        if connection is not None:
+            return connection, True
+        if parts.scheme == "https":
+            connection = http.client.HTTPSConnection(parts.hostname, parts.port, timeout=self.timeout,
+                                                     context=_ssl_context())
+        else:
+            connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=self.timeout)
+        return connection, False
+
+    def _release(self, parts, connection):
+        """
+        Keeps a connection for the next lookup, unless the thread of a previous race was faster.
+        """
+        key = (parts.scheme, parts.hostname, parts.port)
+        with self._connections_lock:
+            if key not in self._connections:
+                self._connections[key] = connection
+                return
+        connection.close()
+
+    def _fetch_http_client(self, url):
+        """
+        Returns:
+            str: The body of the answer of a provider, fetched with http.client.
+
+        Every provider host keeps one connection between lookups. A connection the
+        server closed in the meantime fails on its first request, which is then
+        repeated once on a new connection.
+
+        Raises:
+            http.client.HTTPException: If the provider didn't answer with 200.
+            OSError: If the connection failed.
+        """
+        # Imported here, http.client loads ssl as well
+        import http.client
+        parts = urlsplit(url)
+        while True:
+            connection, reused = self._connect(parts)
+            try:
+                connection.request("GET", parts.path or "/", headers={"Accept": "text/plain"})
+                response = connection.getresponse()
+                body = response.read(256)
+            except ConnectionError:
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            if response.isclosed():
+                # Fully read, so the connection is ready for the next request
+                self._release(parts, connection)
+            else:
+                connection.close()
+            if response.status != 200:
+                raise http.client.HTTPException(f"{response.status} {response.reason}")
+            return body.decode("ascii", "replace")
+
+    def _fetch(self, url):
+        """
+        Asks a single provider for the global IP address.
+
+        Args:
+            url (str): URL of the provider.
+
+        Returns:
+            str: The validated IP address.
+
+        Raises:
+            ValueError: If the provider answered with something other than an IP address.
+            Exception: If the request failed, as raised by the client.
+        """
+        if self.client == "requests":
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            text = response.text
+        else:
+            text = self._fetch_http_client(url)
+        return str(ipaddress.ip_address(text.strip()))
+
+    def _race(self):
+        """
+        Asks all providers at once and returns the first valid answer.
+
+        Returns:
+            str: The global IP address, or None if no provider answered in time.
+        """
+        if self.client == "requests" and self.session is None:
+            self.session = self._create_session()
+        answers = queue.Queue()
+
+        def ask(url):
+            try:
+                answers.put((url, self._fetch(url), None))
+            except Exception as e:
+                answers.put((url, None, e))
+
+        for url in self.providers:
+            threading.Thread(target=ask, args=(url,), daemon=True).start()
+
+        deadline = time.monotonic() + self.timeout
+        for _ in self.providers:
+            try:
+                url, ip, error = answers.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if ip is not None:
+                return ip
+            print(f"Error retrieving global IP from {url}:", error)
+        return None
+
+    def resolve(self, force=False):
+        """
+        Returns the global IP address, from the cache while it is fresh.
+
+        Args:
+            force (bool): Ask the providers even if the cached address is still fresh.
+
+        Returns:
+            str: The global IP address. If no provider answers, the last known
+                 address is returned, or None if there is none.
+        """
+        with self._lock:
+            if not force and self.ip is not None and time.time() - self.fetched_at < self.ttl:
+                return self.ip
+
+            ip = self._race()
+            if ip is not None:
+                self.ip = ip
+                self.fetched_at = time.time()
+                self._save()
+            return self.ip
+
+    @property
+    def changed(self):
+        """
+        Returns:
+            bool: True if the address differs from the one in the last report.
+        """
+        return self.reported_ip is not None and self.ip is not None and self.ip != self.reported_ip
+
+    def mark_reported(self):
+        """
+        Remembers the current address as the one that was last reported.
+        """
+        with self._lock:
+            if self.ip is not None and self.ip != self.reported_ip:
+                self.reported_ip = self.ip
+                self._save()
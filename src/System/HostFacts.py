@@ -0,0 +1,84 @@
+"""
+Facts about the host that don't change while the process runs.
+"""
+
+import os
+import platform
+import socket
+import threading
+
+
+class HostFacts:
+    """
+    Hostname, operating system and CPU counts.
+
+    Every fact is determined on first use and then kept, so the reports only
+    collect the values that actually change. refresh() forgets all facts, e.g.
+    after a SIGHUP, and they are determined again on their next use.
+    """
+
+    def __init__(self):
+        """
+        Initialize the HostFacts object.
+        """
+        self._facts = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key, compute):
+        with self._lock:
+            if key not in self._facts:
+                self._facts[key] = compute()
+            return self._facts[key]
+
+    def refresh(self):
+        """
+        Forgets all facts, they are determined again on their next use.
+        """
+        with self._lock:
+            self._facts.clear()
+
+    @staticmethod
+    def detect_operating_system():
+        """
+        Returns:
+            str: "Windows", "Raspberry" or "Linux", or None if the system is not supported.
+        """
+        system = platform.system()
+        if system == "Windows":
+            return "Windows"
+        if system == "Linux":
+            if platform.machine() == "armv7l" or os.path.exists('/boot/config.txt'):
+                return "Raspberry"
+            return "Linux"
+        return None
+
+    @property
+    def operating_system(self):
+        return self._get("operating_system", self.detect_operating_system)
+
+    @property
+    def hostname(self):
+        return self._get("hostname", socket.gethostname)
+
+    @property
+    def cpu_physical(self):
+        def compute():
+            import psutil
+            return psutil.cpu_count(logical=False)
+        return self._get("cpu_physical", compute)
+
+    @property
+    def cpu_logical(self):
+        return self._get("cpu_logical", os.cpu_count)
+
+    def as_dict(self):
+        """
+        Returns:
+            dict: The facts used by the reports.
+        """
+        return {
+            "hostname": self.hostname,
+            "operating_system": self.operating_system,
+            "cpu_physical": self.cpu_physical,
+            "cpu_logical": self.cpu_logical,
+        }
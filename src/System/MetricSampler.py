@@ -0,0 +1,248 @@
+"""
+Background sampling of system metrics into fixed-size ring buffers.
+"""
+
+import threading
+import time
+from array import array
+
+import psutil
+
+from .SystemProbe import create_probe
+
+
+class RingBuffer:
+    """
+    A fixed-size ring buffer of floats backed by a single array.
+
+    The buffer never grows, its memory footprint is capacity * 8 bytes.
+    """
+
+    def __init__(self, capacity):
+        """
+        Initialize the RingBuffer object.
+
+        Args:
+            capacity (int): Maximum number of values kept.
+        """
+        if capacity < 1:
+            raise ValueError(f"Capacity must be positive: {capacity}")
+        self.capacity = capacity
+        self._values = array("d", bytes(8 * capacity))
+        self._index = 0
+        self.count = 0
+
+    def append(self, value):
+        """
+        Adds a value, overwriting the oldest one if the buffer is full.
+
+        Args:
+            value (float): The value to add.
+        """
+        self._values[self._index] = value
+        self._index = (self._index + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def latest(self):
+        """
+        Returns:
+            float: The most recent value, or None if the buffer is empty.
+        """
+        if self.count == 0:
+            return None
+        return self._values[self._index - 1]
+
+    def values(self):
+        """
+        Returns:
+            array: A copy of the stored values, oldest first.
+        """
+        if self.count < self.capacity:
+            return self._values[:self.count]
+        return self._values[self._index:] + self._values[:self._index]
+
+    def stats(self):
+        """
+        Calculates latest, min, avg, max and 95th percentile over the stored values.
+
+        Returns:
+            dict: The statistics, or None if the buffer is empty.
+        """
+        if self.count == 0:
+            return None
+        values = sorted(self.values())
+        return {
+            "latest": self.latest(),
+            "min": values[0],
+            "avg": sum(values) / len(values),
+            "max": values[-1],
+            "p95": values[min(len(values) - 1, int(0.95 * len(values)))],
+        }
+
+    @property
+    def footprint_bytes(self):
+        """
+        Returns:
+            int: Size of the value storage in bytes.
+        """
+        return self._values.itemsize * self.capacity
+
+
+class MetricSampler:
+    """
+    Samples CPU, RAM, load, disk and network metrics in a background thread.
+
+    Counters (disk and network I/O) are stored as rates per second between two samples.
+    """
+
+    METRICS = (
+        "cpu_percent",
+        "ram_percent",
+        "load_1",
+        "disk_percent",
+        "disk_read_bps",
+        "disk_write_bps",
+        "net_sent_bps",
+        "net_recv_bps",
+    )
+
+    def __init__(self, disk_path, interval=10, window=360, store=None, probe=None):
+        """
+        Initialize the MetricSampler object.
+
+        Args:
+            disk_path (str): Path of the disk whose usage is sampled.
+            interval (float): Seconds between two samples.
+            window (int): Number of samples kept per metric.
+            store (MetricStore): Optional store every sample is also added to, for the history.
+            probe (PsutilProbe): Backend the values are read with, by default the fastest one available.
+        """
+        self.probe = probe if probe is not None else create_probe()
+        self.disk_path = disk_path
+        self.interval = interval
+        self.window = window
+        self.store = store
+        self.buffers = {name: RingBuffer(window) for name in self.METRICS}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_counters = None
+
+    @property
+    def footprint_bytes(self):
+        """
+        Returns:
+            int: Size of all ring buffers in bytes.
+        """
+        return sum(buffer.footprint_bytes for buffer in self.buffers.values())
+
+    @property
+    def window_seconds(self):
+        """
+        Returns:
+            float: The time span covered by the currently stored samples.
+        """
+        return self.buffers["cpu_percent"].count * self.interval
+
+    def _read_counters(self):
+        """
+        Reads the cumulative disk and network counters.
+
+        Returns:
+            tuple: Monotonic time, bytes read, bytes written, bytes sent, bytes received.
+        """
+        disk_io = psutil.disk_io_counters()
+        net_io = psutil.net_io_counters()
+        return (
+            time.monotonic(),
+            disk_io.read_bytes if disk_io else 0,
+            disk_io.write_bytes if disk_io else 0,
+            net_io.bytes_sent if net_io else 0,
+            net_io.bytes_recv if net_io else 0,
+        )
+
+    def sample(self):
+        """
+        Takes one sample of every metric and stores it in the ring buffers.
+        """
+        counters = self._read_counters()
+        if self._last_counters is None:
+            rates = (0.0, 0.0, 0.0, 0.0)
+        else:
+            elapsed = max(counters[0] - self._last_counters[0], 1e-6)
+            rates = tuple(max(0, new - old) / elapsed for new, old in zip(counters[1:], self._last_counters[1:]))
+        self._last_counters = counters
+
+        values = (
+            # Measures the CPU usage since the previous call, so it never blocks
+            self.probe.cpu_percent(),
+            self.probe.memory()[3],
+            self.probe.load_1(),
+            self.probe.disk_usage(self.disk_path)[3],
+        ) + rates
+
+        with self._lock:
+            for name, value in zip(self.METRICS, values):
+                self.buffers[name].append(value)
+
+        if self.store is not None:
+            self.store.add(time.time(), dict(zip(self.METRICS, values)))
+
+    def has_samples(self):
+        """
+        Returns:
+            bool: True if at least one sample was taken.
+        """
+        return self.buffers["cpu_percent"].count > 0
+
+    def latest(self, name):
+        """
+        Returns the latest value of a metric.
+
+        Args:
+            name (str): Name of the metric.
+
+        Returns:
+            float: The latest value, or None if nothing was sampled yet.
+        """
+        with self._lock:
+            return self.buffers[name].latest()
+
+    def summary(self):
+        """
+        Returns:
+            dict: Maps every metric to its latest, min, avg, max and p95 values over the window.
+        """
+        with self._lock:
+            return {name: buffer.stats() for name, buffer in self.buffers.items()}
+
+    def _run(self):
+        # Prime the CPU counters, the first value of cpu_percent() is meaningless
+        self.probe.cpu_percent()
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                print("Error sampling metrics:", e)
+
+    def start(self):
+        """
+        Starts the sampler thread.
+        """
+        print(f"Metric sampler started: {len(self.METRICS)} metrics x {self.window} samples "
+              f"every {self.interval}s ({self.footprint_bytes} bytes)")
+        self._last_counters = self._read_counters()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metric-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the sampler thread and writes the samples kept in memory.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.store is not None:
+            self.store.close()
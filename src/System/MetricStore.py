@@ -0,0 +1,309 @@
+"""
+Compact on-disk history of sampled metrics with rollups and retention.
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+
+
+class _Bucket:
+    """
+    Accumulates the samples of one rollup interval.
+    """
+
+    def __init__(self, start, width):
+        self.start = start
+        self.count = 0
+        self.mins = [float("inf")] * width
+        self.sums = [0.0] * width
+        self.maxs = [float("-inf")] * width
+
+    def add(self, count, mins, sums, maxs):
+        self.count += count
+        for index in range(len(self.sums)):
+            self.mins[index] = min(self.mins[index], mins[index])
+            self.sums[index] += sums[index]
+            self.maxs[index] = max(self.maxs[index], maxs[index])
+
+    def record(self):
+        values = [float(self.start), float(self.count)]
+        for minimum, total, maximum in zip(self.mins, self.sums, self.maxs):
+            values += (minimum, total, maximum)
+        return values
+
+
+class MetricStore:
+    """
+    Stores sampled metrics in day-segmented files of fixed-width binary records.
+
+    There are three tiers: the raw samples, 5-minute and hourly rollups. Every
+    record is a row of doubles: timestamp, sample count and min, sum and max of
+    every metric, so rollups and raw samples share one layout and aggregate the
+    same way. Each tier keeps one file per UTC day in its own directory and
+    drops whole files once they are older than the tier's retention.
+
+    Samples are only kept in memory until flush(), which appends every tier's
+    new records with one write per file, so the SD card of a Pi sees a few
+    small writes per flush interval instead of one per sample. Queries map the
+    segment files and aggregate over strided memoryviews of the record columns,
+    plus the pending records and the rollup interval still in progress.
+    """
+
+    METRICS = ("cpu_percent", "ram_percent", "disk_percent")
+
+    # Name, seconds per record (0 for the raw samples)
+    TIERS = (("raw", 0), ("5m", 300), ("1h", 3600))
+    DEFAULT_RETENTION_DAYS = {"raw": 2, "5m": 30, "1h": 400}
+
+    FIELDS = 2 + 3 * len(METRICS)
+    RECORD = struct.Struct(f"<{FIELDS}d")
+
+    def __init__(self, directory, retention_days=None, flush_interval=600):
+        """
+        Initialize the MetricStore object and create its directories.
+
+        Args:
+            directory (str): Path of the store directory.
+            retention_days (dict): Days every tier is kept, by tier name.
+            flush_interval (float): Seconds between two writes to disk.
+        """
+        self.directory = directory
+        self.retention_days = dict(self.DEFAULT_RETENTION_DAYS)
+        self.retention_days.update(retention_days or {})
+        self.flush_interval = flush_interval
+        for name, _ in self.TIERS:
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._pending = {name: [] for name, _ in self.TIERS}
+        self._buckets = {}
+        self._last_flush = time.monotonic()
+
+    def add(self, timestamp, values):
+        """
+        Adds one sample and flushes to disk once the flush interval has passed.
+
+        Args:
+            timestamp (float): Unix time of the sample.
+            values (dict): The sampled value of every metric in METRICS.
+        """
+        sample = [values[name] for name in self.METRICS]
+        with self._lock:
+            record = [float(timestamp), 1.0]
+            for value in sample:
+                record += (value, value, value)
+            self._pending["raw"].append(record)
+
+            for name, seconds in self.TIERS[1:]:
+                start = timestamp - timestamp % seconds
+                bucket = self._buckets.get(name)
+                if bucket is not None and bucket.start != start:
+                    # The interval is complete, its rollup becomes a record
+                    self._pending[name].append(bucket.record())
+                    bucket = None
+                if bucket is None:
+                    bucket = self._buckets[name] = _Bucket(start, len(sample))
+                bucket.add(1, sample, sample, sample)
+
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def _segment_path(self, tier, day):
+        return os.path.join(self.directory, tier, f"{day}.bin")
+
+    @staticmethod
+    def _day(timestamp):
+        return time.strftime("%Y-%m-%d", time.gmtime(timestamp))
+
+    def flush(self, close_buckets=False):
+        """
+        Appends all pending records to their segment files and applies the retention.
+
+        Args:
+            close_buckets (bool): Also write the rollup intervals still in progress, before a shutdown.
+                                  After a restart within the same interval it gets a second record,
+                                  both aggregate like one.
+        """
+        with self._lock:
+            if close_buckets:
+                for name, bucket in self._buckets.items():
+                    self._pending[name].append(bucket.record())
+                self._buckets.clear()
+            pending = self._pending
+            self._pending = {name: [] for name, _ in self.TIERS}
+            self._last_flush = time.monotonic()
+
+        for tier, records in pending.items():
+            by_day = {}
+            for record in records:
+                by_day.setdefault(self._day(record[0]), []).append(self.RECORD.pack(*record))
+            for day, packed in by_day.items():
+                with open(self._segment_path(tier, day), "ab") as file:
+                    file.write(b"".join(packed))
+        self.expire()
+
+    def close(self):
+        """
+        Writes everything kept in memory, including the rollup intervals in progress.
+        """
+        self.flush(close_buckets=True)
+
+    def expire(self, now=None):
+        """
+        Removes the segment files that are older than their tier's retention.
+
+        Args:
+            now (float): Unix time to measure the age against, by default the current time.
+
+        Returns:
+            int: The number of removed files.
+        """
+        now = time.time() if now is None else now
+        removed = 0
+        for tier, _ in self.TIERS:
+            oldest = self._day(now - self.retention_days[tier] * 86400)
+            for name in os.listdir(os.path.join(self.directory, tier)):
+                # Day names in ISO format sort like the days themselves
+                if name.endswith(".bin") and name[:-4] < oldest:
+                    os.remove(os.path.join(self.directory, tier, name))
+                    removed += 1
+        return removed
+
+    def _tier_for(self, seconds):
+        """
+        Returns:
+            str: The finest tier that still covers the given period.
+        """
+        for name, _ in self.TIERS:
+            if self.retention_days[name] * 86400 >= seconds:
+                return name
+        return self.TIERS[-1][0]
+
+    def _scan_segment(self, path, since, function):
+        """
+        Maps one segment file and calls function with a flat view of its records from since on.
+        """
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            return
+        with file:
+            # A record cut off by a crash during a write is ignored
+            count = os.fstat(file.fileno()).st_size // self.RECORD.size
+            if count == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped, \
+                    memoryview(mapped) as raw, \
+                    raw[:count * self.RECORD.size].cast("d") as values:
+                with values[0::self.FIELDS] as timestamps:
+                    first = bisect.bisect_left(timestamps, since)
+                if first == count:
+                    return
+                rows = values[first * self.FIELDS:]
+                with rows:
+                    function(rows)
+
+    def _aggregate_rows(self, rows, totals):
+        """
+        Adds a flat sequence of records to the running totals, one column at a time.
+        """
+        with rows[1::self.FIELDS] as counts:
+            totals["count"] += sum(counts)
+        for index, name in enumerate(self.METRICS):
+            offset = 2 + 3 * index
+            total = totals[name]
+            with rows[offset::self.FIELDS] as column:
+                total["min"] = min(total["min"], min(column))
+            with rows[offset + 1::self.FIELDS] as column:
+                total["sum"] += sum(column)
+            with rows[offset + 2::self.FIELDS] as column:
+                total["max"] = max(total["max"], max(column))
+
+    def _scan(self, seconds, now, function):
+        """
+        Calls function with flat views of all records of a past period, on disk, pending and
+        the rollup interval in progress, oldest first.
+        """
+        now = time.time() if now is None else now
+        since = now - seconds
+        tier = self._tier_for(seconds)
+
+        day = since - since % 86400
+        while day <= now:
+            self._scan_segment(self._segment_path(tier, self._day(day)), since, function)
+            day += 86400
+
+        with self._lock:
+            records = list(self._pending[tier])
+            bucket = self._buckets.get(tier)
+            if bucket is not None:
+                records.append(bucket.record())
+            pending = [value for record in records if record[0] >= since for value in record]
+        if pending:
+            with memoryview(array("d", pending)) as rows:
+                function(rows)
+
+    def series(self, name, seconds, now=None):
+        """
+        Returns the average values of a metric over a past period, one per record of the tier used.
+
+        Args:
+            name (str): Name of the metric.
+            seconds (float): Length of the period.
+            now (float): Unix time the period ends at, by default the current time.
+
+        Returns:
+            list: The values, oldest first.
+        """
+        offset = 2 + 3 * self.METRICS.index(name)
+        values = []
+
+        def collect(rows):
+            with rows[offset + 1::self.FIELDS] as sums, rows[1::self.FIELDS] as counts:
+                values.extend(total / count for total, count in zip(sums, counts))
+
+        self._scan(seconds, now, collect)
+        return values
+
+    def trends(self, seconds=86400):
+        """
+        Returns:
+            dict: The series of every metric over the last 24 hours.
+        """
+        now = time.time()
+        return {name: self.series(name, seconds, now) for name in self.METRICS}
+
+    def summary(self, seconds, now=None):
+        """
+        Calculates min, avg and max of every metric over a past period.
+
+        Args:
+            seconds (float): Length of the period.
+            now (float): Unix time the period ends at, by default the current time.
+
+        Returns:
+            dict: Maps every metric to its min, avg and max, or None if there are no records.
+        """
+        totals = {"count": 0.0}
+        for name in self.METRICS:
+            totals[name] = {"min": float("inf"), "sum": 0.0, "max": float("-inf")}
+        self._scan(seconds, now, lambda rows: self._aggregate_rows(rows, totals))
+
+        if totals["count"] == 0:
+            return None
+        return {name: {"min": totals[name]["min"], "avg": totals[name]["sum"] / totals["count"],
+                       "max": totals[name]["max"]} for name in self.METRICS}
+
+    def history(self):
+        """
+        Returns:
+            dict: The summaries of the last 24 hours and the last 7 days.
+        """
+        now = time.time()
+        return {"24h": self.summary(86400, now), "7d": self.summary(7 * 86400, now)}
@@ -0,0 +1,149 @@
+"""
+The processes using the most CPU, RAM and I/O.
+"""
+
+import sys
+import threading
+import time
+from typing import NamedTuple, Optional, Tuple
+
+
+class ProcessUsage(NamedTuple):
+    """
+    The usage of one process. CPU and I/O are averaged over the time since the
+    previous scan, for processes started since then over their whole lifetime.
+    """
+
+    pid: int
+    name: str
+    cpu_percent: float
+    rss: int
+    io_rate: Optional[float]
+
+
+class ProcessTop(NamedTuple):
+    """
+    The result of one scan: the top processes by CPU, resident memory and I/O.
+    """
+
+    by_cpu: Tuple[ProcessUsage, ...]
+    by_rss: Tuple[ProcessUsage, ...]
+    by_io: Tuple[ProcessUsage, ...]
+    scanned: int
+    complete: bool
+    seconds: float
+    # Seconds since the previous scan the averages cover, None on the first scan
+    interval: Optional[float]
+
+    def processes(self):
+        """
+        Returns:
+            list: Every process of the three lists once, by CPU usage.
+        """
+        unique = {process.pid: process for process in self.by_cpu + self.by_rss + self.by_io}
+        return sorted(unique.values(), key=lambda process: process.cpu_percent, reverse=True)
+
+
+class ProcessScanner:
+    """
+    Scans the processes incrementally and ranks them.
+
+    psutil.process_iter() keeps its Process objects between calls and every
+    process is read within oneshot(), so a scan reads each /proc entry once.
+    The CPU times and I/O bytes of the previous scan are kept by PID, the
+    percentages are the difference to them, without sleeping. Kernel threads
+    are skipped and a scan stops after its time budget, so hosts with thousands
+    of processes can't make the report late.
+    """
+
+    # On Linux every kernel thread is a child of kthreadd
+    KTHREADD_PID = 2
+
+    def __init__(self, top=5, budget=0.5):
+        """
+        Initialize the ProcessScanner object.
+
+        Args:
+            top (int): Number of processes in every list.
+            budget (float): Seconds a scan may take, the remaining processes are left out.
+        """
+        self.top = top
+        self.budget = budget
+        self._lock = threading.Lock()
+        # PID -> creation time, time of the scan, CPU seconds and I/O bytes
+        self._last = {}
+        self._last_scan = None
+        self._skip_kernel_threads = sys.platform.startswith("linux")
+
+    def _is_kernel_thread(self, process):
+        if process.pid == 0:
+            # The idle process of Windows and the scheduler of BSD and macOS
+            return True
+        return self._skip_kernel_threads and (process.pid == self.KTHREADD_PID
+                                              or process.info["ppid"] == self.KTHREADD_PID)
+
+    def scan(self):
+        """
+        Scans the running processes.
+
+        Returns:
+            ProcessTop: The top processes.
+        """
+        import psutil
+        with self._lock:
+            started = time.monotonic()
+            until = started + self.budget
+            now = time.time()
+            interval = now - self._last_scan if self._last_scan is not None else None
+
+            seen = {}
+            usages = []
+            complete = True
+            for process in psutil.process_iter(["ppid", "name"]):
+                if time.monotonic() > until:
+                    complete = False
+                    break
+                if self._is_kernel_thread(process):
+                    continue
+                try:
+                    with process.oneshot():
+                        cpu_times = process.cpu_times()
+                        rss = process.memory_info().rss
+                        created = process.create_time()
+                        try:
+                            counters = process.io_counters()
+                            io_bytes = counters.read_bytes + counters.write_bytes
+                        except (psutil.AccessDenied, AttributeError):
+                            # Other users' processes without root, and macOS has no I/O counters
+                            io_bytes = None
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+
+                cpu_seconds = cpu_times.user + cpu_times.system
+                last = self._last.get(process.pid)
+                if last is not None and last[0] == created:
+                    _, since, last_cpu, last_io = last
+                else:
+                    # New since the last scan, or the PID was reused: average over the lifetime
+                    since, last_cpu, last_io = created, 0.0, 0
+                elapsed = max(now - since, 1e-3)
+                io_rate = None
+                if io_bytes is not None and last_io is not None:
+                    io_rate = max(io_bytes - last_io, 0) / elapsed
+                seen[process.pid] = (created, now, cpu_seconds, io_bytes)
+                usages.append(ProcessUsage(process.pid, process.info["name"] or "?",
+                                           round(max(cpu_seconds - last_cpu, 0.0) / elapsed * 100, 1), rss, io_rate))
+
+            if complete:
+                # Processes that are gone are forgotten
+                self._last = seen
+            else:
+                self._last.update(seen)
+            self._last_scan = now
+
+            by_io = [usage for usage in usages if usage.io_rate]
+            return ProcessTop(
+                tuple(sorted(usages, key=lambda usage: usage.cpu_percent, reverse=True)[:self.top]),
+                tuple(sorted(usages, key=lambda usage: usage.rss, reverse=True)[:self.top]),
+                tuple(sorted(by_io, key=lambda usage: usage.io_rate, reverse=True)[:self.top]),
+                len(usages), complete, time.monotonic() - started, interval)
@@ -1,8 +1,22 @@
 import os
+import re
+import shutil
 import subprocess
+import tempfile
+
+from ..Schedule.Scheduler import CronSpec
 
 
 class Service:
+    SYSTEMD_DIR = "/etc/systemd/system"
+    WEEKDAYS = ("Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat")
+
+    # The keys every generated unit section needs
+    REQUIRED_KEYS = {
+        "service": {"Unit": ("Description",), "Service": ("Type", "ExecStart")},
+        "timer": {"Unit": ("Description",), "Timer": ("Unit",), "Install": ("WantedBy",)},
+    }
+
     def __init__(self, script_dir):
         # Initialize attributes for sudo password and script directory
         self.script_dir = script_dir
@@ -69,3 +83,226 @@ class Service:
         else:
             print(f"The file '{filename}' does not exist in the directory '{directory}'.")
             return False
+
+    @staticmethod
+    def unit_name(job_name):
+        """
+        Returns:
+            str: The name of the units of a job, without suffix.
+        """
+        return "info-mail-" + re.sub(r"[^A-Za-z0-9_.-]", "-", job_name)
+
+    @classmethod
+    def on_calendar(cls, expression):
+        """
+        Translates a cron expression into systemd OnCalendar values.
+
+        Cron matches a day if either the day-of-month or the day-of-week matches when both are
+        restricted, systemd only if both match, so such an expression becomes two values.
+
+        Args:
+            expression (str): The cron expression with five fields.
+
+        Returns:
+            list: The OnCalendar values.
+
+        Raises:
+            ValueError: If the expression is malformed.
+        """
+        spec = CronSpec(expression)
+        minute, hour, day, month, weekday = expression.split()
+
+        def values(field, parsed):
+            return "*" if field == "*" else ",".join(f"{value:02d}" for value in sorted(parsed))
+
+        time_part = f"{values(hour, spec.hours)}:{values(minute, spec.minutes)}:00"
+        date_part = f"*-{values(month, spec.months)}-{values(day, spec.days)}"
+        weekdays = ",".join(cls.WEEKDAYS[value] for value in sorted(spec.weekdays))
+        if day != "*" and weekday != "*":
+            return [f"{date_part} {time_part}", f"{weekdays} *-{values(month, spec.months)}-* {time_part}"]
+        if weekday != "*":
+            return [f"{weekdays} {date_part} {time_part}"]
+        return [f"{date_part} {time_part}"]
+
+    def timer_units(self, job_name, options):
+        """
+        Generates a oneshot service and the timer that starts it on the schedule of a job.
+
+        Args:
+            job_name (str): Name of the job in settings.conf.
+            options (dict): The job options, with "cron" or "every" and optionally "action".
+
+        Returns:
+            tuple: The text of the .service and of the .timer unit.
+
+        Raises:
+            ValueError: If the job has no schedule.
+        """
+        action = options.get("action", "report")
+        name = self.unit_name(job_name)
+        python = os.path.join(self.script_dir, '.venv', 'bin', 'python')
+        service = (
+            "[Unit]\n"
+            f"Description=Mail Service to send systeminformation ({job_name})\n"
+            "Wants=network-online.target\n"
+            "After=network-online.target\n"
+            "\n"
+            "[Service]\n"
+            "Type=oneshot\n"
+            f"WorkingDirectory={self.script_dir}\n"
+            f"ExecStart={python} {os.path.join(self.script_dir, 'main.py')} --once {action}\n"
+            "StandardOutput=append:/var/log/info-mail.log\n"
+            "StandardError=append:/var/log/info-mail-error.log\n"
+        )
+
+        if "cron" in options:
+            triggers = "".join(f"OnCalendar={value}\n" for value in self.on_calendar(options["cron"]))
+        elif "every" in options:
+            seconds = int(options["every"])
+            if seconds <= 0:
+                raise ValueError(f"Job '{job_name}' needs a positive interval")
+            triggers = f"OnBootSec=60\nOnUnitActiveSec={seconds}\n"
+        else:
+            raise ValueError(f"Job '{job_name}' needs either 'cron' or 'every'")
+
+        timer = (
+            "[Unit]\n"
+            f"Description=Schedule of the mail service job {job_name}\n"
+            "\n"
+            "[Timer]\n"
+            f"{triggers}"
+            # Runs missed while the device was off are started right after the next boot
+            "Persistent=true\n"
+            f"Unit={name}.service\n"
+            "\n"
+            "[Install]\n"
+            "WantedBy=timers.target\n"
+        )
+        return service, timer
+
+    @classmethod
+    def validate_unit(cls, text, kind):
+        """
+        Checks a generated unit without systemd: sections, key syntax and the required keys.
+
+        Args:
+            text (str): The unit file.
+            kind (str): "service" or "timer".
+
+        Returns:
+            list: A description of every problem, empty if the unit is valid.
+        """
+        problems = []
+        sections = {}
+        current = None
+        for number, line in enumerate(text.splitlines(), 1):
+            line = line.strip()
+            if not line or line.startswith(("#", ";")):
+                continue
+            if line.startswith("[") and line.endswith("]"):
+                current = sections.setdefault(line[1:-1], {})
+                continue
+            key, separator, value = line.partition("=")
+            if current is None:
+                problems.append(f"line {number}: setting outside of a section")
+            elif not separator or not re.fullmatch(r"[A-Za-z][A-Za-z0-9]*", key.strip()):
+                problems.append(f"line {number}: not a 'Key=Value' setting: {line}")
+            elif not value.strip():
+                problems.append(f"line {number}: {key.strip()} has no value")
+            else:
+                current.setdefault(key.strip(), []).append(value.strip())
+
+        for section, keys in cls.REQUIRED_KEYS[kind].items():
+            if section not in sections:
+                problems.append(f"section [{section}] is missing")
+                continue
+            problems += [f"[{section}] needs {key}=" for key in keys if key not in sections[section]]
+
+        if kind == "service":
+            command = sections.get("Service", {}).get("ExecStart", [""])[0].split()
+            if command and not os.path.isabs(command[0]):
+                problems.append(f"ExecStart needs an absolute path: {command[0]}")
+            if sections.get("Service", {}).get("Type", ["oneshot"])[0] != "oneshot":
+                problems.append("Type= must be oneshot")
+        else:
+            timer = sections.get("Timer", {})
+            if not any(key in timer for key in ("OnCalendar", "OnUnitActiveSec", "OnBootSec")):
+                problems.append("[Timer] has no trigger")
+        return problems
+
+    @staticmethod
+    def verify_with_systemd(files):
+        """
+        Runs "systemd-analyze verify" on generated units if systemd-analyze is installed. Nothing is installed.
+
+        Args:
+            files (dict): Maps unit file names to their text.
+
+        Returns:
+            list: The problems reported by systemd-analyze, empty if it found none or is not available.
+        """
+        if shutil.which("systemd-analyze") is None:
+            return []
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for filename, text in files.items():
+                path = os.path.join(directory, filename)
+                with open(path, "w") as file:
+                    file.write(text)
+                paths.append(path)
+            result = subprocess.run(["systemd-analyze", "verify", *paths], capture_output=True, text=True,
+                                    shell=False)
+        # Only lines about the generated units count, not about unrelated units of the system
+        return [line for line in result.stderr.splitlines() if any(name in line for name in files)]
+
+    def setLinuxTimer(self, jobs):
+        """
+        Installs a oneshot service and a timer for every job instead of the resident service.
+
+        The interpreter only runs while a job is sent, no daemon stays in memory.
+
+        Args:
+            jobs (dict): The jobs from settings.conf.
+
+        Returns:
+            bool: True if the units were installed.
+        """
+        files = {}
+        for job_name, options in jobs.items():
+            name = self.unit_name(job_name)
+            try:
+                service, timer = self.timer_units(job_name, options)
+            except ValueError as e:
+                print("Invalid job:", e)
+                return False
+            files[f"{name}.service"] = service
+            files[f"{name}.timer"] = timer
+
+        problems = [f"{filename}: {problem}" for filename, text in files.items()
+                    for problem in self.validate_unit(text, filename.rsplit(".", 1)[1])]
+        problems += self.verify_with_systemd(files)
+        if problems:
+            for problem in problems:
+                print("Invalid unit:", problem)
+            return False
+
+        try:
+            for filename, text in files.items():
+                with open(os.path.join(self.SYSTEMD_DIR, filename), "w") as file:
+                    file.write(text)
+            print("Timer units were successfully written to the system directory.")
+
+            subprocess.run(["systemctl", "daemon-reload"], check=True, shell=False)
+            # The resident service would send every mail a second time
+            if os.path.exists(os.path.join(self.SYSTEMD_DIR, "info-mail.service")):
+                subprocess.run(["systemctl", "disable", "--now", "info-mail.service"], shell=False)
+            timers = [filename for filename in files if filename.endswith(".timer")]
+            subprocess.run(["systemctl", "enable", "--now", *timers], check=True, shell=False)
+            print("Timers were successfully enabled:", ", ".join(timers))
+        except OSError as e:
+            print("Error writing the timer units:", e)
+            return False
+        except subprocess.CalledProcessError as e:
+            print("Timers could not be enabled:", e)
+            return False
+        return True
@@ -0,0 +1,189 @@
+"""
+Immutable snapshot of the collected values and the changes between two reports.
+"""
+
+import json
+import os
+from typing import NamedTuple, Optional, Tuple
+
+
+class SnapshotDelta(NamedTuple):
+    """
+    What changed between two snapshots.
+    """
+
+    elapsed: float
+    disk_growth: Optional[int]
+    new_mounts: Tuple[str, ...]
+    removed_mounts: Tuple[str, ...]
+    previous_ip: Optional[str]
+    rebooted: bool
+
+    @property
+    def ip_changed(self):
+        return self.previous_ip is not None
+
+    def lines(self):
+        """
+        Returns:
+            list: One human-readable line per change worth mentioning.
+        """
+        lines = []
+        if self.rebooted:
+            lines.append("The system was rebooted.")
+        if self.disk_growth:
+            direction = "grew" if self.disk_growth > 0 else "shrank"
+            lines.append(f"Used storage {direction} by {abs(self.disk_growth) / (1024 ** 3):.2f} GB.")
+        if self.new_mounts:
+            lines.append(f"New mounts: {', '.join(self.new_mounts)}.")
+        if self.removed_mounts:
+            lines.append(f"Mounts gone: {', '.join(self.removed_mounts)}.")
+        if self.ip_changed:
+            lines.append(f"The global IP changed, it was {self.previous_ip}.")
+        return lines
+
+
+class Snapshot(NamedTuple):
+    """
+    The values of one collection, with sizes in bytes and times as Unix time.
+
+    A value that could not be collected is None.
+    """
+
+    taken_at: float
+    hostname: Optional[str]
+    boot_time: Optional[float]
+    disk_total: Optional[int]
+    disk_used: Optional[int]
+    disk_free: Optional[int]
+    ram_total: Optional[int]
+    ram_used: Optional[int]
+    ram_available: Optional[int]
+    cpu_percent: Optional[float]
+    cpu_freq_mhz: Optional[float]
+    mounts: Tuple[str, ...]
+    local_ip: Optional[str]
+    global_ip: Optional[str]
+
+    # Boot times derived from the uptime jitter by a few seconds between two readings
+    REBOOT_TOLERANCE = 60
+
+    @classmethod
+    def from_info(cls, info, taken_at):
+        """
+        Creates a snapshot from the system information of DataCollector.collect().
+
+        Args:
+            info (dict): The system information.
+            taken_at (float): Unix time of the collection.
+
+        Returns:
+            Snapshot: The snapshot.
+        """
+        return cls(
+            taken_at=taken_at,
+            hostname=info.get("hostname"),
+            boot_time=info.get("boot_time"),
+            disk_total=info.get("disk_total_bytes"),
+            disk_used=info.get("disk_used_bytes"),
+            disk_free=info.get("disk_free_bytes"),
+            ram_total=info.get("ram_total_bytes"),
+            ram_used=info.get("ram_used_bytes"),
+            ram_available=info.get("ram_available_bytes"),
+            cpu_percent=info.get("cpu_percent_now"),
+            cpu_freq_mhz=info.get("cpu_freq_mhz"),
+            mounts=tuple(info.get("mounts") or ()),
+            local_ip=info.get("local_ip"),
+            global_ip=info.get("global_ip"),
+        )
+
+    def diff(self, previous):
+        """
+        Compares this snapshot with an earlier one.
+
+        Args:
+            previous (Snapshot): The earlier snapshot, None if there is none.
+
+        Returns:
+            SnapshotDelta: The changes, or None without an earlier snapshot.
+        """
+        if previous is None:
+            return None
+
+        disk_growth = None
+        if self.disk_used is not None and previous.disk_used is not None:
+            disk_growth = self.disk_used - previous.disk_used
+
+        previous_ip = None
+        if self.global_ip is not None and previous.global_ip is not None and self.global_ip != previous.global_ip:
+            previous_ip = previous.global_ip
+
+        rebooted = (self.boot_time is not None and previous.boot_time is not None
+                    and self.boot_time - previous.boot_time > self.REBOOT_TOLERANCE)
+
+        # Mounts are only compared if both snapshots could read them
+        new_mounts = removed_mounts = ()
+        if self.mounts and previous.mounts:
+            new_mounts = tuple(sorted(set(self.mounts) - set(previous.mounts)))
+            removed_mounts = tuple(sorted(set(previous.mounts) - set(self.mounts)))
+
+        return SnapshotDelta(self.taken_at - previous.taken_at, disk_growth, new_mounts, removed_mounts,
+                             previous_ip, rebooted)
+
+    def to_json(self):
+        """
+        Returns:
+            str: The snapshot as JSON object.
+        """
+        return json.dumps(self._asdict())
+
+    @classmethod
+    def from_json(cls, text):
+        """
+        Args:
+            text (str): A snapshot as written by to_json().
+
+        Returns:
+            Snapshot: The snapshot. Fields missing in older files are None.
+        """
+        values = json.loads(text)
+        fields = {name: values.get(name) for name in cls._fields}
+        fields["mounts"] = tuple(fields["mounts"] or ())
+        return cls(**fields)
+
+
+def load_snapshot(filename):
+    """
+    Loads the snapshot persisted by save_snapshot().
+
+    Args:
+        filename (str): Path of the snapshot file.
+
+    Returns:
+        Snapshot: The snapshot, or None if there is none or it can't be read.
+    """
+    try:
+        with open(filename, "r", encoding="utf-8") as file:
+            return Snapshot.from_json(file.read())
+    except FileNotFoundError:
+        return None
+    except (ValueError, TypeError, OSError) as e:
+        print("Error reading the last snapshot:", e)
+        return None
+
+
+def save_snapshot(snapshot, filename):
+    """
+    Persists a snapshot atomically.
+
+    Args:
+        snapshot (Snapshot): The snapshot.
+        filename (str): Path of the snapshot file.
+    """
+    temp_file = filename + ".tmp"
+    try:
+        with open(temp_file, "w", encoding="utf-8") as file:
+            file.write(snapshot.to_json())
+        os.replace(temp_file, filename)
+    except OSError as e:
+        print("Error writing the last snapshot:", e)
@@ -0,0 +1,296 @@
+"""
+Backends that read the raw system values for the collector, the sampler and the alerts.
+
+ProcProbe reads the Linux /proc files directly and is used wherever it works,
+PsutilProbe is the portable fallback. Both return the same values in the same units.
+"""
+
+import os
+import sys
+import threading
+import time
+
+_OCTAL_DIGITS = b"01234567"
+
+
+def _unescape_mount_field(field):
+    """
+    Decodes the octal escapes like \\040 the kernel writes for spaces, tabs and backslashes in paths.
+
+    Args:
+        field (bytes): A field of /proc/self/mounts.
+
+    Returns:
+        str: The decoded field.
+    """
+    pieces = field.split(b"\\")
+    result = bytearray(pieces[0])
+    for piece in pieces[1:]:
+        code = piece[:3]
+        if len(code) == 3 and all(digit in _OCTAL_DIGITS for digit in code):
+            result.append(int(code, 8))
+            result += piece[3:]
+        else:
+            result += b"\\" + piece
+    return os.fsdecode(bytes(result))
+
+
+class PsutilProbe:
+    """
+    Reads the system values through psutil.
+
+    psutil is imported on the first reading, the /proc probe on Linux never needs it.
+    """
+
+    name = "psutil"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_cpu = None
+
+    @staticmethod
+    def uptime_seconds():
+        """
+        Returns:
+            float: Seconds since the last boot.
+        """
+        import psutil
+        return time.time() - psutil.boot_time()
+
+    @staticmethod
+    def disk_usage(path):
+        """
+        Args:
+            path (str): A path on the disk.
+
+        Returns:
+            tuple: Total, used and free bytes and the usage in percent.
+        """
+        import psutil
+        usage = psutil.disk_usage(path)
+        return usage.total, usage.used, usage.free, usage.percent
+
+    @staticmethod
+    def partitions():
+        """
+        Lists the mounted file systems without touching them, so a hung mount can't block it.
+
+        Returns:
+            list: Device, mount point, file system type and options of every mount, pseudo file systems included.
+        """
+        import psutil
+        return [(partition.device, partition.mountpoint, partition.fstype, partition.opts)
+                for partition in psutil.disk_partitions(all=True)]
+
+    @staticmethod
+    def memory():
+        """
+        Returns:
+            tuple: Total, used and available bytes of RAM and the usage in percent.
+        """
+        import psutil
+        ram = psutil.virtual_memory()
+        return ram.total, ram.used, ram.available, ram.percent
+
+    @staticmethod
+    def load_1():
+        """
+        Returns:
+            float: The load average over the last minute.
+        """
+        import psutil
+        return psutil.getloadavg()[0]
+
+    @staticmethod
+    def cpu_freq_mhz():
+        """
+        Returns:
+            float: The current CPU frequency in MHz, None if the system doesn't report it.
+        """
+        import psutil
+        # Not every platform has cpu_freq(), and on some it returns None
+        freq = psutil.cpu_freq() if hasattr(psutil, "cpu_freq") else None
+        return freq.current if freq else None
+
+    def _cpu_times(self):
+        """
+        Returns:
+            tuple: Total and idle CPU time.
+        """
+        import psutil
+        times = psutil.cpu_times()
+        # Guest time is already part of the user time on Linux
+        total = sum(times) - getattr(times, "guest", 0) - getattr(times, "guest_nice", 0)
+        return total, times.idle + getattr(times, "iowait", 0)
+
+    def cpu_percent(self, interval=None):
+        """
+        Measures the CPU usage like psutil.cpu_percent, but with its own reference point,
+        so several users of different probes don't disturb each other.
+
+        Args:
+            interval (float): Seconds to measure over, None for the time since the previous call.
+
+        Returns:
+            float: The CPU usage in percent, 0.0 on the first call without an interval.
+        """
+        with self._lock:
+            if interval:
+                self._last_cpu = self._cpu_times()
+                time.sleep(interval)
+            current = self._cpu_times()
+            last, self._last_cpu = self._last_cpu, current
+        if last is None:
+            return 0.0
+        total = current[0] - last[0]
+        if total <= 0:
+            return 0.0
+        busy = total - (current[1] - last[1])
+        return round(min(max(busy / total * 100, 0.0), 100.0), 1)
+
+
+class ProcProbe(PsutilProbe):
+    """
+    Reads the system values from /proc and statvfs without going through psutil.
+
+    The /proc files are opened once and re-read from offset 0 with a single
+    pread each time, and parsed by splitting instead of regular expressions.
+    """
+
+    name = "proc"
+
+    # Bytes read per file, the values needed are all at their start
+    READ_SIZES = {"stat": 512, "meminfo": 4096, "uptime": 128, "loadavg": 128}
+
+    # The frequency of the first core in kHz, only there with a cpufreq driver
+    CPU_FREQ_PATH = "/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq"
+
+    def __init__(self):
+        """
+        Initialize the ProcProbe object and open the /proc files.
+
+        Raises:
+            OSError: If a file can't be opened, e.g. on systems without /proc.
+        """
+        super().__init__()
+        self._fds = {}
+        try:
+            for name in self.READ_SIZES:
+                self._fds[name] = os.open(f"/proc/{name}", os.O_RDONLY)
+        except OSError:
+            self.close()
+            raise
+        # The frequency comes from sysfs, else from the "cpu MHz" line of x86 kernels, else from psutil
+        self._freq_fd = None
+        self._cpuinfo_fd = None
+        try:
+            self._freq_fd = os.open(self.CPU_FREQ_PATH, os.O_RDONLY)
+        except OSError:
+            try:
+                self._cpuinfo_fd = os.open("/proc/cpuinfo", os.O_RDONLY)
+            except OSError:
+                pass
+
+    def _read(self, name):
+        return os.pread(self._fds[name], self.READ_SIZES[name], 0)
+
+    def uptime_seconds(self):
+        return float(self._read("uptime").split(None, 1)[0])
+
+    @staticmethod
+    def disk_usage(path):
+        stat = os.statvfs(path)
+        total = stat.f_blocks * stat.f_frsize
+        used = (stat.f_blocks - stat.f_bfree) * stat.f_frsize
+        free = stat.f_bavail * stat.f_frsize
+        # Like df, the space reserved for root counts neither as used nor as available
+        usable = used + free
+        return total, used, free, round(used / usable * 100, 1) if usable else 0.0
+
+    @staticmethod
+    def partitions():
+        with open("/proc/self/mounts", "rb") as file:
+            lines = file.read().splitlines()
+        partitions = []
+        for line in lines:
+            fields = line.split(None, 4)
+            if len(fields) < 4:
+                continue
+            # Spaces and tabs in paths are written as octal escapes like \040
+            partitions.append(tuple(_unescape_mount_field(field) for field in fields[:4]))
+        return partitions
+
+    def memory(self):
+        wanted = {b"MemTotal", b"MemFree", b"MemAvailable"}
+        values = {}
+        for line in self._read("meminfo").splitlines():
+            key, _, rest = line.partition(b":")
+            if key in wanted:
+                values[key] = int(rest.split()[0]) * 1024
+                if len(values) == len(wanted):
+                    break
+
+        total = values[b"MemTotal"]
+        # Kernels before 3.14 have no MemAvailable
+        available = values.get(b"MemAvailable", values[b"MemFree"])
+        used = total - available
+        return total, used, available, round(used / total * 100, 1)
+
+    def load_1(self):
+        return float(self._read("loadavg").split(None, 1)[0])
+
+    def cpu_freq_mhz(self):
+        if self._freq_fd is not None:
+            return int(os.pread(self._freq_fd, 32, 0)) / 1000
+        if self._cpuinfo_fd is not None:
+            # The first core comes first, its "cpu MHz" is within the first few hundred bytes
+            for line in os.pread(self._cpuinfo_fd, 4096, 0).splitlines():
+                if line.startswith(b"cpu MHz"):
+                    return float(line.partition(b":")[2])
+            # ARM and others have no such line, don't look again
+            os.close(self._cpuinfo_fd)
+            self._cpuinfo_fd = None
+        return super().cpu_freq_mhz()
+
+    def _cpu_times(self):
+        # "cpu  user nice system idle iowait irq softirq steal guest guest_nice", in ticks
+        fields = self._read("stat").split(b"\n", 1)[0].split()
+        times = [int(value) for value in fields[1:9]]
+        return sum(times), times[3] + times[4]
+
+    def close(self):
+        """
+        Closes the /proc files.
+        """
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+        for name in ("_freq_fd", "_cpuinfo_fd"):
+            fd = getattr(self, name, None)
+            if fd is not None:
+                os.close(fd)
+                setattr(self, name, None)
+
+
+def create_probe():
+    """
+    Creates the fastest probe that works on this system.
+
+    Returns:
+        PsutilProbe: A ProcProbe on Linux, else a PsutilProbe.
+    """
+    if sys.platform.startswith("linux"):
+        probe = None
+        try:
+            probe = ProcProbe()
+            # Make sure all files can be parsed before relying on them
+            probe.uptime_seconds()
+            probe.memory()
+            probe.load_1()
+            probe.cpu_percent()
+            return probe
+        except (OSError, ValueError, IndexError, KeyError) as e:
+            print("Reading /proc failed, falling back to psutil:", e)
+            if probe is not None:
+                probe.close()
+    return PsutilProbe()
@@ -0,0 +1,267 @@
+"""
+Timing instrumentation of the report pipeline.
+
+A run (a report, a delivery) is made of stages, each with a duration and
+optionally a byte count. At the end of a run its stages are written as one
+JSON log line and to a Prometheus textfile-collector file. While the
+instrumentation is disabled, stage() and run() return a shared no-op object,
+so the hooks cost a single attribute check.
+"""
+
+import cProfile
+import json
+import os
+import threading
+import time
+
+
+class _NullStage:
+    """
+    Stage and run used while the instrumentation is disabled.
+    """
+
+    __slots__ = ()
+
+    bytes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        # Assigning the byte count of a disabled stage is simply dropped
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("instrumentation", "name", "bytes", "_start")
+
+    def __init__(self, instrumentation, name, nbytes):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.bytes = nbytes
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.instrumentation.record(self.name, time.perf_counter() - self._start, self.bytes)
+        return False
+
+
+class _Run:
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.stages = {}
+        self.outer = None
+        self.profiler = None
+
+    def __enter__(self):
+        local = self.instrumentation._local
+        self.outer = getattr(local, "run", None)
+        if self.outer is None:
+            local.run = self
+            self.started = time.time()
+            self._start = time.perf_counter()
+            if self.instrumentation._profile_requested.is_set():
+                self.instrumentation._profile_requested.clear()
+                self.profiler = cProfile.Profile()
+                self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self.outer is not None:
+            # Nested runs add their stages to the outer run
+            return False
+        self.instrumentation._local.run = None
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.instrumentation._dump_profile(self.name, self.profiler)
+        self.instrumentation._finish(self, time.perf_counter() - self._start, exc is None)
+        return False
+
+
+class Instrumentation:
+    """
+    Collects the stage timings of runs and exports them.
+
+    Runs are tracked per thread, a stage outside of a run only updates the
+    Prometheus figures.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.log_file = None
+        self.textfile = None
+        self.profile_dir = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._profile_requested = threading.Event()
+        # Latest figures by stage: seconds, bytes, count
+        self._stages = {}
+        self._runs = {}
+
+    def configure(self, enabled, log_file=None, textfile=None, profile_dir=None):
+        """
+        Args:
+            enabled (bool): Whether to record anything at all.
+            log_file (str): File the JSON lines are appended to, None to print them.
+            textfile (str): Path of the Prometheus textfile, None to skip it.
+            profile_dir (str): Directory the cProfile dumps are written to.
+        """
+        self.enabled = enabled
+        self.log_file = log_file
+        self.textfile = textfile
+        self.profile_dir = profile_dir
+
+    def stage(self, name, nbytes=None):
+        """
+        Times a stage in a with block. The byte count can also be set on the returned object.
+
+        Args:
+            name (str): Name of the stage, e.g. "render.linux".
+            nbytes (int): Number of bytes the stage produced or transferred.
+
+        Returns:
+            A context manager.
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, nbytes)
+
+    def run(self, name):
+        """
+        Groups all stages recorded by this thread in a with block into one run.
+
+        Args:
+            name (str): Name of the run, e.g. "report".
+
+        Returns:
+            A context manager.
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Run(self, name)
+
+    def record(self, name, seconds, nbytes=None):
+        """
+        Records a stage that was timed elsewhere.
+
+        Args:
+            name (str): Name of the stage.
+            seconds (float): Its duration.
+            nbytes (int): Number of bytes, None if not applicable.
+        """
+        if not self.enabled:
+            return
+        run = getattr(self._local, "run", None)
+        if run is not None:
+            stage = run.stages.setdefault(name, {"seconds": 0.0})
+            stage["seconds"] += seconds
+            if nbytes is not None:
+                stage["bytes"] = stage.get("bytes", 0) + nbytes
+        with self._lock:
+            stage = self._stages.setdefault(name, [0.0, None, 0])
+            stage[0] = seconds
+            stage[1] = nbytes
+            stage[2] += 1
+
+    def request_profile(self):
+        """
+        Profiles the next run with cProfile and dumps its stats. Safe to call from a signal handler.
+        """
+        self._profile_requested.set()
+
+    def _dump_profile(self, name, profiler):
+        directory = self.profile_dir or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.pstats")
+            profiler.dump_stats(path)
+            print(f"Profile of the '{name}' run written to {path}")
+        except OSError as e:
+            print("Error writing the profile:", e)
+
+    def _finish(self, run, seconds, ok):
+        with self._lock:
+            figures = self._runs.setdefault(run.name, [0.0, 0, 0])
+            figures[0] = seconds
+            figures[1] += 1
+            if not ok:
+                figures[2] += 1
+
+        line = json.dumps({"event": "run", "run": run.name, "time": round(run.started, 3), "ok": ok,
+                           "seconds": round(seconds, 6), "stages": {
+                               name: {key: round(value, 6) if key == "seconds" else value
+                                      for key, value in stage.items()}
+                               for name, stage in run.stages.items()}})
+        try:
+            if self.log_file:
+                with open(self.log_file, "a", encoding="utf-8") as file:
+                    file.write(line + "\n")
+            else:
+                print(line)
+            if self.textfile:
+                self.write_textfile()
+        except OSError as e:
+            print("Error writing the instrumentation:", e)
+
+    @staticmethod
+    def _label(value):
+        return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+    def prometheus_text(self):
+        """
+        Returns:
+            str: The latest figures in the Prometheus text exposition format.
+        """
+        with self._lock:
+            stages = {name: list(values) for name, values in self._stages.items()}
+            runs = {name: list(values) for name, values in self._runs.items()}
+
+        lines = [
+            "# HELP infomail_stage_seconds Duration of the latest execution of a stage.",
+            "# TYPE infomail_stage_seconds gauge",
+        ]
+        lines += [f'infomail_stage_seconds{{stage="{self._label(name)}"}} {values[0]:.6f}'
+                  for name, values in sorted(stages.items())]
+        lines += ["# HELP infomail_stage_bytes Bytes of the latest execution of a stage.",
+                  "# TYPE infomail_stage_bytes gauge"]
+        lines += [f'infomail_stage_bytes{{stage="{self._label(name)}"}} {values[1]}'
+                  for name, values in sorted(stages.items()) if values[1] is not None]
+        lines += ["# HELP infomail_stage_executions_total Executions of a stage.",
+                  "# TYPE infomail_stage_executions_total counter"]
+        lines += [f'infomail_stage_executions_total{{stage="{self._label(name)}"}} {values[2]}'
+                  for name, values in sorted(stages.items())]
+        lines += ["# HELP infomail_run_seconds Duration of the latest run.",
+                  "# TYPE infomail_run_seconds gauge"]
+        lines += [f'infomail_run_seconds{{run="{self._label(name)}"}} {values[0]:.6f}'
+                  for name, values in sorted(runs.items())]
+        lines += ["# HELP infomail_runs_total Runs, including failed ones.",
+                  "# TYPE infomail_runs_total counter"]
+        lines += [f'infomail_runs_total{{run="{self._label(name)}"}} {values[1]}' for name, values in sorted(runs.items())]
+        lines += ["# HELP infomail_run_failures_total Runs that ended with an error.",
+                  "# TYPE infomail_run_failures_total counter"]
+        lines += [f'infomail_run_failures_total{{run="{self._label(name)}"}} {values[2]}'
+                  for name, values in sorted(runs.items())]
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self):
+        """
+        Writes the Prometheus figures atomically, so the collector never reads a partial file.
+        """
+        temp_file = self.textfile + ".tmp"
+        with open(temp_file, "w", encoding="utf-8") as file:
+            file.write(self.prometheus_text())
+        os.replace(temp_file, self.textfile)
+
+
+# Shared by all modules, configured once by main.py
+instrumentation = Instrumentation()
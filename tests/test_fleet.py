@@ -0,0 +1,152 @@
+"""
+Tests for the fleet agents and the aggregator polling them, all on localhost ports.
+"""
+
+import http.client
+import socket
+import time
+
+import pytest
+
+from src.Fleet.Agent import SnapshotAgent, _AgentHandler
+from src.Fleet.FleetPoller import FleetPoller
+from src.System.Snapshot import Snapshot
+
+
+class StubCollector:
+    """
+    Stands in for DataCollector, every collection returns a snapshot of the given host.
+    """
+
+    def __init__(self, hostname, fresh=False):
+        self.hostname = hostname
+        self.collections = 0
+        self.latest_snapshot = (self._snapshot(), time.monotonic()) if fresh else (None, 0.0)
+
+    def _snapshot(self):
+        return Snapshot.from_info({"hostname": self.hostname, "cpu_percent_now": 12.5, "mounts": ["/"]}, time.time())
+
+    def collect(self, disk_path, deadline=None):
+        self.collections += 1
+        snapshot = self._snapshot()
+        self.latest_snapshot = (snapshot, time.monotonic())
+        return {"snapshot": snapshot}
+
+
+@pytest.fixture
+def agents():
+    started = []
+
+    def start(hostname, **kwargs):
+        agent = SnapshotAgent(StubCollector(hostname, **kwargs), "/", "127.0.0.1", 0)
+        agent.start()
+        started.append(agent)
+        return agent
+
+    yield start
+    for agent in started:
+        agent.stop()
+
+
+@pytest.fixture
+def silent_port():
+    # Connections are accepted by the kernel, but nothing is ever answered
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(8)
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+def closed_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_agent_serves_a_fresh_snapshot_without_collecting(agents):
+    agent = agents("pi-1", fresh=True)
+    connection = http.client.HTTPConnection("127.0.0.1", agent.port, timeout=5)
+    connection.request("GET", "/snapshot")
+    response = connection.getresponse()
+    assert response.status == 200
+    assert Snapshot.from_json(response.read().decode()).hostname == "pi-1"
+    assert agent.data_collector.collections == 0
+
+    connection.request("GET", "/other")
+    response = connection.getresponse()
+    response.read()
+    assert response.status == 404
+    connection.close()
+
+
+def test_agent_collects_once_the_snapshot_is_too_old(agents):
+    agent = agents("pi-1")
+    first = agent.snapshot_json()
+    assert agent.snapshot_json() is first
+    assert agent.data_collector.collections == 1
+
+    agent.max_age = 0
+    assert agent.snapshot_json() is not first
+    assert agent.data_collector.collections == 2
+
+
+def test_poll_reports_every_host(agents, silent_port):
+    hosts = {f"pi-{number}": f"127.0.0.1:{agents(f'pi-{number}').port}" for number in range(3)}
+    hosts["silent"] = f"127.0.0.1:{silent_port}"
+    hosts["down"] = f"127.0.0.1:{closed_port()}"
+    poller = FleetPoller(hosts, timeout=0.5)
+    try:
+        start = time.monotonic()
+        results = poller.poll()
+        # The hosts are polled at once, the silent one costs one timeout and not more
+        assert time.monotonic() - start < 1.5
+
+        assert [result.name for result in results] == list(hosts)
+        by_name = {result.name: result for result in results}
+        for number in range(3):
+            result = by_name[f"pi-{number}"]
+            assert result.error is None
+            assert result.snapshot.hostname == f"pi-{number}"
+            assert result.snapshot.cpu_percent == 12.5
+        assert by_name["silent"].snapshot is None
+        assert by_name["silent"].error == "timed out after 0.5s"
+        assert by_name["down"].snapshot is None
+        assert by_name["down"].error
+    finally:
+        poller.close()
+
+
+def test_second_poll_reuses_the_connections(agents):
+    hosts = {f"pi-{number}": f"127.0.0.1:{agents(f'pi-{number}').port}" for number in range(3)}
+    poller = FleetPoller(hosts, timeout=2)
+    try:
+        poller.poll()
+        writers = {name: connection[1] for name, connection in poller._connections.items()}
+        assert len(writers) == 3
+
+        results = poller.poll()
+        assert all(result.error is None for result in results)
+        assert {name: connection[1] for name, connection in poller._connections.items()} == writers
+    finally:
+        poller.close()
+
+
+def test_connection_closed_by_the_agent_is_opened_again(agents, monkeypatch):
+    # The agent closes connections idle for longer than this
+    monkeypatch.setattr(_AgentHandler, "timeout", 0.2)
+    agent = agents("pi-1")
+    poller = FleetPoller({"pi-1": f"127.0.0.1:{agent.port}"}, timeout=2)
+    try:
+        poller.poll()
+        writer = poller._connections["pi-1"][1]
+        time.sleep(0.5)
+
+        [result] = poller.poll()
+        assert result.error is None
+        assert result.snapshot.hostname == "pi-1"
+        assert poller._connections["pi-1"][1] is not writer
+    finally:
+        poller.close()
@@ -0,0 +1,141 @@
+"""
+Tests for the provider race and the cache of the global IP resolver, against local HTTP servers.
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.System.GlobalIPResolver import GlobalIPResolver
+
+
+class Provider:
+    """
+    A local provider answering with a fixed body after a delay.
+    """
+
+    def __init__(self, body, delay=0.0, status=200):
+        self.body = body
+        self.delay = delay
+        self.status = status
+        self.requests = 0
+        self.connections = set()
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                provider.requests += 1
+                provider.connections.add(self.client_address)
+                time.sleep(provider.delay)
+                body = provider.body.encode()
+                self.send_response(provider.status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def providers():
+    started = []
+
+    def start(*args, **kwargs):
+        provider = Provider(*args, **kwargs)
+        started.append(provider)
+        return provider
+
+    yield start
+    for provider in started:
+        provider.stop()
+
+
+def test_fastest_valid_answer_wins(providers):
+    slow = providers("198.51.100.1", delay=0.5)
+    broken = providers("<html>not an address</html>")
+    fast = providers("203.0.113.7\n", delay=0.1)
+    resolver = GlobalIPResolver([slow.url, broken.url, fast.url], client="http.client", timeout=2)
+
+    start = time.monotonic()
+    assert resolver.resolve() == "203.0.113.7"
+    assert time.monotonic() - start < 0.4
+
+
+def test_no_answer_keeps_the_last_known_address(providers):
+    failing = providers("unavailable", status=503)
+    resolver = GlobalIPResolver([failing.url], client="http.client", timeout=1)
+    assert resolver.resolve() is None
+
+    resolver.ip = "203.0.113.7"
+    assert resolver.resolve(force=True) == "203.0.113.7"
+
+
+def test_fresh_address_is_served_from_the_cache(providers, tmp_path):
+    provider = providers("203.0.113.7")
+    cache_file = str(tmp_path / "global-ip.json")
+    resolver = GlobalIPResolver([provider.url], ttl=3600, cache_file=cache_file, client="http.client")
+    assert resolver.resolve() == "203.0.113.7"
+    assert resolver.resolve() == "203.0.113.7"
+    assert provider.requests == 1
+
+    # The cache survives a restart
+    restarted = GlobalIPResolver([provider.url], ttl=3600, cache_file=cache_file, client="http.client")
+    assert restarted.resolve() == "203.0.113.7"
+    assert provider.requests == 1
+
+    assert restarted.resolve(force=True) == "203.0.113.7"
+    assert provider.requests == 2
+
+
+def test_expired_address_is_fetched_again(providers):
+    provider = providers("203.0.113.7")
+    resolver = GlobalIPResolver([provider.url], ttl=3600, client="http.client")
+    resolver.resolve()
+    resolver.fetched_at -= 3601
+    provider.body = "203.0.113.8"
+    assert resolver.resolve() == "203.0.113.8"
+    assert provider.requests == 2
+
+
+def test_change_detection(providers, tmp_path):
+    provider = providers("203.0.113.7")
+    cache_file = str(tmp_path / "global-ip.json")
+    resolver = GlobalIPResolver([provider.url], ttl=0, cache_file=cache_file, client="http.client")
+    resolver.resolve()
+    assert not resolver.changed
+    resolver.mark_reported()
+
+    provider.body = "203.0.113.8"
+    resolver.resolve()
+    assert resolver.changed
+    resolver.mark_reported()
+    assert not resolver.changed
+    assert GlobalIPResolver(cache_file=cache_file).reported_ip == "203.0.113.8"
+
+
+def test_connection_is_reused_between_lookups(providers):
+    provider = providers("203.0.113.7")
+    resolver = GlobalIPResolver([provider.url], ttl=0, client="http.client")
+    for _ in range(3):
+        assert resolver.resolve() == "203.0.113.7"
+    assert provider.requests == 3
+    assert len(provider.connections) == 1
+
+
+def test_unknown_client_is_rejected():
+    with pytest.raises(ValueError):
+        GlobalIPResolver(client="curl")
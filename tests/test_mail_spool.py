@@ -0,0 +1,160 @@
+"""
+Tests for the mail spool: retries with backoff, dead letters and the cleanup of interrupted writes.
+"""
+
+import os
+import smtplib
+import time
+from email.message import EmailMessage
+
+import pytest
+
+from src.Mail.MailSpool import DeliveryWorker, MailSpool
+
+
+class FakeSession:
+    """
+    Stands in for SMTPSession. errors maps a recipient to the exception its delivery raises.
+    """
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.delivered = []
+        self.attempts = []
+
+    def send_many(self, messages):
+        for file, from_addr, to_addrs in messages:
+            self.attempts.append(to_addrs[0])
+            error = self.errors.get(to_addrs[0])
+            if error is not None:
+                raise error
+            self.delivered.append((to_addrs[0], file.read()))
+
+
+def message(subject):
+    mail = EmailMessage()
+    mail["Subject"] = subject
+    mail.set_content(".dot\nbody\n")
+    return mail
+
+
+def enqueue(spool, to_addr, age=0):
+    """
+    Spools a mail created age seconds ago, so mails are delivered in a known order.
+    """
+    entry_id = spool.enqueue(message(to_addr), "info@example.com", to_addr)
+    [entry] = [entry for entry in spool.pending() if entry.id == entry_id]
+    old_name = entry.filename
+    entry.created -= age
+    entry.next_try -= age
+    os.replace(os.path.join(spool.new_dir, old_name), os.path.join(spool.new_dir, entry.filename))
+    return entry
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return MailSpool(str(tmp_path / "spool"))
+
+
+def test_enqueue_and_open(spool):
+    spool.enqueue(message("Report"), "info@example.com", "admin@example.com")
+    assert os.listdir(spool.tmp_dir) == []
+    [entry] = spool.pending()
+    from_addr, to_addrs, file = spool.open(entry)
+    with file:
+        data = file.read()
+    assert (from_addr, to_addrs) == ("info@example.com", ["admin@example.com"])
+    assert b"Subject: Report\r\n" in data
+    assert b"\r\n.dot\r\n" in data
+
+
+def test_delivered_mails_are_removed(spool):
+    session = FakeSession()
+    enqueue(spool, "a@example.com", age=10)
+    enqueue(spool, "b@example.com")
+    assert DeliveryWorker(spool, session).deliver_due() is None
+    assert [to for to, _ in session.delivered] == ["a@example.com", "b@example.com"]
+    assert spool.pending() == []
+
+
+def test_temporary_rejection_only_delays_that_mail(spool):
+    session = FakeSession({"a@example.com": smtplib.SMTPRecipientsRefused({"a@example.com": (450, b"busy")})})
+    enqueue(spool, "a@example.com", age=10)
+    enqueue(spool, "b@example.com")
+    worker = DeliveryWorker(spool, session, retry_base=30)
+
+    before = time.time()
+    timeout = worker.deliver_due()
+    assert [to for to, _ in session.delivered] == ["b@example.com"]
+    [entry] = spool.pending()
+    assert entry.attempts == 1
+    assert before + 15 - 1 <= entry.next_try <= time.time() + 30 + 1
+    assert 0 < timeout <= 31
+
+    # Not due yet, so it isn't tried again
+    worker.deliver_due()
+    assert session.attempts == ["a@example.com", "b@example.com"]
+
+
+def test_permanent_rejection_moves_the_mail_to_the_dead_letters(spool):
+    session = FakeSession({"a@example.com": smtplib.SMTPRecipientsRefused({"a@example.com": (550, b"unknown")})})
+    spool.enqueue(message("One"), "info@example.com", "a@example.com")
+    DeliveryWorker(spool, session).deliver_due()
+    assert spool.pending() == []
+    assert len(os.listdir(spool.dead_dir)) == 1
+
+    assert spool.replay_dead() == 1
+    [entry] = spool.pending()
+    assert entry.attempts == 0
+    assert os.listdir(spool.dead_dir) == []
+
+
+def test_unreachable_server_holds_back_the_other_mails(spool):
+    session = FakeSession({"a@example.com": ConnectionRefusedError("refused")})
+    enqueue(spool, "a@example.com", age=10)
+    enqueue(spool, "b@example.com")
+    DeliveryWorker(spool, session).deliver_due()
+    assert session.attempts == ["a@example.com"]
+    assert sorted(entry.attempts for entry in spool.pending()) == [0, 1]
+
+
+def test_mails_older_than_max_age_are_given_up(spool):
+    session = FakeSession()
+    entry = enqueue(spool, "a@example.com", age=3 * 86400)
+    DeliveryWorker(spool, session, max_age=2 * 86400).deliver_due()
+    assert session.attempts == []
+    assert os.listdir(spool.dead_dir) == [entry.filename]
+
+
+def test_retry_delay_grows_up_to_the_maximum(spool):
+    worker = DeliveryWorker(spool, FakeSession(), retry_base=30, retry_max=3600)
+    for attempts, full in ((0, 30), (1, 60), (3, 240), (10, 3600), (1000, 3600)):
+        for _ in range(20):
+            assert full / 2 <= worker.retry_delay(attempts) <= full
+
+
+def test_errors_are_classified():
+    assert DeliveryWorker.is_permanent(smtplib.SMTPDataError(554, b"spam"))
+    assert not DeliveryWorker.is_permanent(smtplib.SMTPDataError(451, b"try later"))
+    assert not DeliveryWorker.is_permanent(smtplib.SMTPAuthenticationError(535, b"bad login"))
+    assert not DeliveryWorker.is_permanent(smtplib.SMTPRecipientsRefused(
+        {"a@example.com": (550, b"unknown"), "b@example.com": (450, b"busy")}))
+
+    assert DeliveryWorker.is_server_down(smtplib.SMTPServerDisconnected())
+    assert DeliveryWorker.is_server_down(TimeoutError())
+    assert not DeliveryWorker.is_server_down(smtplib.SMTPDataError(451, b"try later"))
+
+
+def test_stale_temporary_files_are_removed_on_open(tmp_path):
+    directory = str(tmp_path / "spool")
+    spool = MailSpool(directory)
+    stale = os.path.join(spool.tmp_dir, "stale.eml")
+    recent = os.path.join(spool.tmp_dir, "recent.eml")
+    for path in (stale, recent):
+        with open(path, "wb") as file:
+            file.write(b"{}\n")
+    old = time.time() - MailSpool.STALE_TMP_AGE - 60
+    os.utime(stale, (old, old))
+
+    MailSpool(directory)
+    assert os.listdir(spool.tmp_dir) == ["recent.eml"]
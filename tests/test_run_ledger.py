@@ -0,0 +1,81 @@
+"""
+Tests for the run ledger and the catch-up of the scheduler after a restart.
+"""
+
+from src.Schedule.RunLedger import RunLedger
+from src.Schedule.Scheduler import IntervalSpec, Job, Scheduler
+
+
+def test_slot_is_claimed_once(tmp_path):
+    ledger = RunLedger(str(tmp_path / "ledger.log"))
+    assert ledger.claim("report", 600)
+    assert not ledger.claim("report", 600)
+    # An older slot never runs after a newer one
+    assert not ledger.claim("report", 540)
+    assert ledger.claim("other", 540)
+    ledger.complete("report", 600)
+    ledger.close()
+
+
+def test_claims_survive_a_restart(tmp_path):
+    filename = str(tmp_path / "ledger.log")
+    ledger = RunLedger(filename)
+    ledger.claim("report", 600)
+    ledger.complete("report", 600, success=False)
+    ledger.claim("report", 660)
+    ledger.close()
+
+    reopened = RunLedger(filename)
+    assert reopened.last_slot("report") == 660
+    assert reopened.last_slot("unknown") is None
+    assert not reopened.claim("report", 660)
+    reopened.close()
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    filename = tmp_path / "ledger.log"
+    ledger = RunLedger(str(filename))
+    ledger.claim("report", 600)
+    ledger.close()
+    with open(filename, "a", encoding="utf-8") as file:
+        file.write("report\t66")
+
+    reopened = RunLedger(str(filename))
+    assert reopened.last_slot("report") == 600
+    reopened.close()
+
+
+def test_large_ledger_is_compacted_on_open(tmp_path):
+    filename = tmp_path / "ledger.log"
+    ledger = RunLedger(str(filename))
+    for slot in range(RunLedger.COMPACT_THRESHOLD + 10):
+        ledger.claim("report", slot)
+    ledger.close()
+
+    reopened = RunLedger(str(filename))
+    assert reopened.last_slot("report") == RunLedger.COMPACT_THRESHOLD + 9
+    reopened.close()
+    assert len(filename.read_text(encoding="utf-8").splitlines()) == 1
+
+
+def test_scheduler_catches_up_from_the_ledger(tmp_path, monkeypatch):
+    ledger = RunLedger(str(tmp_path / "ledger.log"))
+    ledger.claim("report", 600)
+    ledger.complete("report", 600)
+    monkeypatch.setattr("time.time", lambda: 930.0)
+
+    scheduler = Scheduler(ledger, catch_up="all")
+    job = Job("report", IntervalSpec(60), lambda: None)
+    scheduler.add_job(job)
+    assert job.next_run == 660
+    assert job.pending == [720, 780, 840, 900]
+
+    runs = []
+    job.action = lambda: runs.append(True)
+    for slot in [job.next_run] + job.pending:
+        scheduler._run_slot(job, slot)
+    # A slot that already ran, e.g. by a second instance, is skipped
+    scheduler._run_slot(job, 900)
+    assert len(runs) == 5
+    assert ledger.last_slot("report") == 900
+    ledger.close()
@@ -0,0 +1,103 @@
+"""
+Tests for the cron and interval schedules and the catch-up of missed slots.
+"""
+
+from datetime import datetime
+
+import pytest
+
+from src.Schedule.Scheduler import CronSpec, IntervalSpec, Job, Scheduler
+
+
+def at(*args):
+    return datetime(*args).timestamp()
+
+
+class FakeLedger:
+    def __init__(self, last_slot):
+        self._last_slot = last_slot
+
+    def last_slot(self, job_name):
+        return self._last_slot
+
+
+@pytest.mark.parametrize("expression, start, expected", [
+    ("*/15 * * * *", at(2024, 5, 6, 10, 7), at(2024, 5, 6, 10, 15)),
+    ("*/15 * * * *", at(2024, 5, 6, 10, 45), at(2024, 5, 6, 11, 0)),
+    ("0 8 * * 1-5", at(2024, 5, 10, 9, 0), at(2024, 5, 13, 8, 0)),
+    ("30 2 1 * *", at(2024, 12, 15, 0, 0), at(2025, 1, 1, 2, 30)),
+    ("0 0 29 2 *", at(2023, 3, 1, 0, 0), at(2024, 2, 29, 0, 0)),
+    # Sunday written as 7
+    ("0 12 * * 7", at(2024, 5, 6, 0, 0), at(2024, 5, 12, 12, 0)),
+    # Day of month and day of week both restricted: either matches
+    ("0 0 13 * 5", at(2024, 5, 6, 0, 0), at(2024, 5, 10, 0, 0)),
+])
+def test_cron_next_after(expression, start, expected):
+    assert CronSpec(expression).next_after(start) == expected
+
+
+def test_cron_next_after_is_exclusive():
+    spec = CronSpec("0 * * * *")
+    assert spec.next_after(at(2024, 5, 6, 10, 0)) == at(2024, 5, 6, 11, 0)
+
+
+@pytest.mark.parametrize("expression", ["*/15 * * * *", "0 8 * * 1-5", "30 2 1 * *", "0 0 29 2 *", "5,35 9-17 * * *"])
+def test_cron_previous_before_mirrors_next_after(expression):
+    spec = CronSpec(expression)
+    slot = spec.next_after(at(2024, 1, 1, 0, 0))
+    for _ in range(5):
+        following = spec.next_after(slot)
+        assert spec.previous_before(following) == slot
+        assert spec.previous_before(following + 30) == following
+        slot = following
+
+
+@pytest.mark.parametrize("expression", ["* * *", "60 * * * *", "* 24 * * *", "*/0 * * * *", "5-1 * * * *", "x * * * *"])
+def test_cron_rejects_bad_expressions(expression):
+    with pytest.raises(ValueError):
+        CronSpec(expression)
+
+
+def test_interval_boundaries():
+    spec = IntervalSpec(300)
+    assert spec.next_after(600) == 900
+    assert spec.next_after(601) == 900
+    assert spec.previous_before(900) == 600
+    assert spec.previous_before(899) == 600
+    with pytest.raises(ValueError):
+        IntervalSpec(0)
+
+
+def missed(policy, spec, last_slot, now):
+    scheduler = Scheduler(FakeLedger(last_slot), catch_up=policy)
+    return scheduler._missed_slots(Job("report", spec, lambda: None), now)
+
+
+def test_catch_up_policies():
+    spec = IntervalSpec(60)
+    assert missed("none", spec, 600, 900) == []
+    assert missed("latest", spec, 600, 900) == [900]
+    assert missed("all", spec, 600, 930) == [660, 720, 780, 840, 900]
+    # Nothing missed yet
+    assert missed("all", spec, 600, 659) == []
+
+
+def test_catch_up_all_is_capped_after_a_long_downtime():
+    spec = IntervalSpec(60)
+    now = 600 + 60 * 10 ** 7
+    slots = missed("all", spec, 600, now)
+    assert len(slots) == Scheduler.MAX_CATCH_UP
+    assert slots[-1] == now
+    assert slots == sorted(slots)
+
+
+def test_catch_up_without_a_recorded_run():
+    assert missed("all", IntervalSpec(60), None, 900) == []
+    assert Scheduler(None)._missed_slots(Job("report", IntervalSpec(60), lambda: None), 900) == []
+
+
+def test_catch_up_with_cron():
+    spec = CronSpec("0 8 * * *")
+    assert missed("latest", spec, at(2024, 5, 1, 8, 0), at(2024, 5, 4, 9, 0)) == [at(2024, 5, 4, 8, 0)]
+    assert missed("all", spec, at(2024, 5, 1, 8, 0), at(2024, 5, 4, 8, 0)) == [
+        at(2024, 5, 2, 8, 0), at(2024, 5, 3, 8, 0), at(2024, 5, 4, 8, 0)]
@@ -0,0 +1,136 @@
+"""
+Tests for parsing and validating settings.conf and reloading it.
+"""
+
+import os
+
+import pytest
+
+from src.Config.Settings import ConfigError, Settings, SettingsWatcher, load_settings
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VALID = '''
+"""
+Comment
+"""
+SENDER_MAIL = "info@example.com"
+SENDER_PASSWORD = "secret"
+RECEIVER_MAIL = "admin@example.com"
+SMTP_SERVER_ADDRESS = "smtp.example.com"
+SMTP_SERVER_PORT = 465
+PI_EXTERNAL = False
+PI_EXTERNAL_PORT = 2222
+PI_LOCAL_PORT = 22
+PI_USER = "pi"
+JOBS = {"daily": {"cron": "0 8 * * *"}}
+SPOOL_MAX_AGE = 2 * 86400
+'''
+
+
+def parse_problems(text):
+    with pytest.raises(ConfigError) as info:
+        Settings.parse(text, "test.conf")
+    return info.value.problems
+
+
+def test_shipped_settings_file_is_valid():
+    settings = load_settings(os.path.join(REPO_DIR, "settings.conf"))
+    assert settings.CONFIG_CHECK_INTERVAL == 0
+
+
+def test_values_defaults_and_arithmetic():
+    settings = Settings.parse(VALID)
+    assert settings["SMTP_SERVER_PORT"] == 465
+    assert settings.RECEIVER_MAIL == "admin@example.com"
+    assert settings.SPOOL_MAX_AGE == 172800
+    assert settings.SMTP_SECURITY == "ssl"
+    assert settings.get("GLOBAL_IP_PROVIDERS", ["fallback"]) == ["fallback"]
+    with pytest.raises(AttributeError):
+        settings.NO_SUCH_SETTING
+
+
+def test_defaults_are_not_shared_between_versions():
+    first = Settings.parse(VALID)
+    first.ALERTS["disk"] = {}
+    assert Settings.parse(VALID).ALERTS == {}
+
+
+def test_unknown_settings_are_ignored(capsys):
+    settings = Settings.parse(VALID + "SMTP_SERVR_PORT = 25\n")
+    assert "SMTP_SERVR_PORT" not in settings
+    assert "unknown setting SMTP_SERVR_PORT" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("line, problem", [
+    ('SMTP_SERVER_PORT = "465"', "SMTP_SERVER_PORT must be int, not str"),
+    ("SMTP_SERVER_PORT = 70000", "SMTP_SERVER_PORT is not a port number"),
+    ("SMTP_SERVER_PORT = True", "SMTP_SERVER_PORT must be int, not True"),
+    ('RECEIVER_MAIL = ["a@example.com", "b@example.com"]', "RECEIVER_MAIL must be str, not list"),
+    ('SMTP_SECURITY = "tls"', "SMTP_SECURITY must be one of 'ssl', 'starttls', 'none'"),
+    ("SPOOL_RETRY_BASE = 0", "SPOOL_RETRY_BASE must be greater than 0"),
+    ("CONFIG_CHECK_INTERVAL = -1", "CONFIG_CHECK_INTERVAL must not be negative"),
+    ('JOBS = {"daily": {"cron": "0 25 * * *"}}', "JOBS job 'daily'"),
+    ('JOBS = {"daily": {"every": 60, "catch_up": "some"}}', "unknown catch-up policy 'some'"),
+    ('JOBS = {"daily": {}}', "job 'daily' needs either 'cron' or 'every'"),
+    ('JOBS = {"daily": {"cron": "0 8 * * *", "action": "reprot"}}', "job 'daily' has an unknown action 'reprot'"),
+    ('JOBS = {"daily": {"cron": "0 0 31 2 *"}}', "never matches"),
+    ("SEND_HOUR = 25", "SEND_HOUR must be between 0 and 23"),
+    ("SEND_MINUTE = 60", "SEND_MINUTE must be between 0 and 59"),
+    ('ALERTS = {"disk": {"metric": "disk_fre_gb", "below": 5}}', "unknown metric 'disk_fre_gb'"),
+    ('ALERTS = {"disk": {"metric": "disk_free_gb"}}', "needs exactly one of 'above', 'below' or 'changed'"),
+    ('ALERTS = {"cpu": {"metric": "cpu_percent", "above": "90"}}', "'above' must be a number"),
+    ('ALERTS = {"cpu": 90}', "rule 'cpu' must be a dict"),
+    ('SENDER_PASSWORD = open("/etc/passwd").read()', "SENDER_PASSWORD must be a plain value"),
+    ('SPOOL_MAX_AGE = "2" * 3', "SPOOL_MAX_AGE must be a plain value"),
+    ("import os", "only 'NAME = value' assignments are allowed"),
+])
+def test_bad_values_are_rejected(line, problem):
+    problems = parse_problems(VALID + line + "\n")
+    assert len(problems) == 1
+    assert problem in problems[0]
+    assert problems[0].startswith(f"line {VALID.count(chr(10)) + 1}:")
+
+
+def test_fleet_digest_needs_fleet_hosts():
+    jobs = 'JOBS = {"digest": {"every": 60, "action": "fleet_digest"}}\n'
+    assert parse_problems(VALID + jobs) == ["JOBS: the action 'fleet_digest' of digest needs FLEET_HOSTS"]
+    settings = Settings.parse(VALID + jobs + 'FLEET_HOSTS = {"pi": "http://pi.local:8766"}\n')
+    assert settings.JOBS["digest"]["action"] == "fleet_digest"
+
+
+def test_every_problem_is_reported():
+    text = VALID.replace('PI_USER = "pi"\n', "").replace("JOBS = ", "ALERTS = 1\nJOBS = ")
+    problems = parse_problems(text + "SMTP_SERVER_PORT = -1\n")
+    assert len(problems) == 3
+    assert problems[-1] == "PI_USER is missing"
+
+
+def test_rejected_value_is_not_reported_as_missing_as_well():
+    assert parse_problems(VALID.replace('"pi"', "1")) == [f"line {VALID.count(chr(10)) - 2}: PI_USER must be str, not int"]
+    assert parse_problems(VALID.replace("JOBS = {", "JOBS = None\n#")) == ["JOBS is missing"]
+
+
+def test_syntax_error_names_the_line():
+    [problem] = parse_problems(VALID + "SMTP_SERVER_PORT = \n")
+    assert problem.startswith(f"line {VALID.count(chr(10)) + 1}: ")
+
+
+def test_watcher_keeps_the_settings_on_a_broken_file(tmp_path):
+    filename = tmp_path / "settings.conf"
+    filename.write_text(VALID, encoding="utf-8")
+    applied = []
+    watcher = SettingsWatcher(str(filename), load_settings(str(filename)), lambda old, new: applied.append(new))
+    assert not watcher.check()
+
+    filename.write_text(VALID + "SMTP_SERVER_PORT = 587\n", encoding="utf-8")
+    assert watcher.check()
+    assert applied[-1].SMTP_SERVER_PORT == 587
+    assert applied[-1].changed(load_settings(str(filename))) == set()
+
+    filename.write_text(VALID + "SMTP_SERVER_PORT = 'xx'\n", encoding="utf-8")
+    assert not watcher.check()
+    assert watcher.settings.SMTP_SERVER_PORT == 587
+    # The broken version is reported once, not on every check
+    assert not watcher.check()
+    assert len(applied) == 1
@@ -0,0 +1,201 @@
+"""
+Tests for the dot-stuffing of the DATA phase and the reuse of the SMTP session, against a local SMTP server.
+"""
+
+import smtplib
+import socketserver
+import threading
+from email.message import EmailMessage
+
+import pytest
+
+from src.Mail.SMTPSession import SMTPSession, _DataWriter
+
+
+class Sink(socketserver.ThreadingTCPServer):
+    """
+    A minimal SMTP server that keeps the raw DATA of every message.
+
+    RCPT TO addresses starting with "reject" are refused with 550. With
+    drop_after_message set, the connection is closed after the next message.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+        self.drop_after_message = False
+        super().__init__(("127.0.0.1", 0), SinkHandler)
+        threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True).start()
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.reply("250 sink")
+            elif verb == "RCPT" and "<reject" in command:
+                self.reply("550 no such user")
+            elif verb == "DATA":
+                self.reply("354 go ahead")
+                data = []
+                while True:
+                    line = self.rfile.readline()
+                    if line in (b".\r\n", b""):
+                        break
+                    data.append(line)
+                self.server.messages.append(b"".join(data))
+                self.reply("250 queued")
+                if self.server.drop_after_message:
+                    self.server.drop_after_message = False
+                    return
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+@pytest.fixture
+def sink():
+    server = Sink()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def session(sink):
+    session = SMTPSession("127.0.0.1", sink.server_address[1], security="none", noop_after=3600)
+    yield session
+    session.close()
+
+
+class FakeSocket:
+    def __init__(self):
+        self.data = bytearray()
+
+    def sendall(self, data):
+        self.data += data
+
+
+def message(body):
+    mail = EmailMessage()
+    mail["From"] = "info@example.com"
+    mail["To"] = "admin@example.com"
+    mail["Subject"] = "Report"
+    mail.set_content(body)
+    return mail
+
+
+def test_lines_starting_with_a_dot_are_stuffed():
+    sock = FakeSocket()
+    writer = _DataWriter(sock)
+    writer.write(b".first\r\nmiddle\r\n")
+    # A dot at the start of a write that continues a line is not a line start
+    writer.write(b"still the same line .x")
+    writer.write(b"\r\n")
+    writer.write(b"..two dots\r\n.")
+    writer.finish()
+    assert bytes(sock.data) == (b"..first\r\nmiddle\r\nstill the same line .x\r\n"
+                                b"...two dots\r\n..\r\n.\r\n")
+    assert writer.bytes_sent == len(sock.data)
+
+
+def test_data_is_sent_in_chunks():
+    sock = FakeSocket()
+    writer = _DataWriter(sock)
+    writer.write(b"x" * (_DataWriter.CHUNK_SIZE + 1))
+    assert len(sock.data) == _DataWriter.CHUNK_SIZE + 1
+    writer.finish()
+    assert bytes(sock.data).endswith(b"x\r\n.\r\n")
+
+
+def test_dot_lines_arrive_stuffed(sink, session):
+    session.send(message("before\n.\n.hidden\nafter\n"), "info@example.com", "admin@example.com")
+    assert b"\r\n..\r\n..hidden\r\nafter\r\n" in sink.messages[0]
+
+
+def test_sends_reuse_one_connection(sink, session):
+    mails = [(message(f"mail {number}"), "info@example.com", ["admin@example.com"]) for number in range(3)]
+    session.send_many(mails)
+    session.send(message("later"), "info@example.com", "admin@example.com")
+    assert len(sink.messages) == 4
+    assert sink.connections == 1
+
+
+def test_rejected_recipient_keeps_the_session(sink, session):
+    session.send(message("first"), "info@example.com", "admin@example.com")
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        session.send(message("refused"), "info@example.com", "reject@example.com")
+    session.send(message("second"), "info@example.com", "admin@example.com")
+    assert len(sink.messages) == 2
+    assert sink.connections == 1
+
+
+def test_partly_refused_recipients_are_logged(sink, session, capsys):
+    session.send(message("both"), "info@example.com", ["admin@example.com", "reject@example.com"])
+    assert len(sink.messages) == 1
+    assert "recipient reject@example.com refused (550 no such user)" in capsys.readouterr().out
+
+
+class BrokenFile:
+    """
+    A spooled mail whose read fails after the first chunk.
+    """
+
+    def __init__(self):
+        self.chunks = [b"Subject: broken\r\n\r\nfirst part\r\n"]
+
+    def tell(self):
+        return 0
+
+    def read(self, size):
+        if not self.chunks:
+            raise ValueError("read failed")
+        return self.chunks.pop()
+
+
+def test_error_during_data_drops_the_connection(sink, session):
+    session.timeout = 2
+    session.send(message("first"), "info@example.com", "admin@example.com")
+    with pytest.raises(ValueError):
+        session.send_many([(BrokenFile(), "info@example.com", ["admin@example.com"])])
+    session.send(message("second"), "info@example.com", "admin@example.com")
+    assert sink.connections == 2
+    # The next transaction must not have been written into the broken message
+    assert not any(b"mail from" in data.lower() for data in sink.messages)
+    assert b"second" in sink.messages[-1]
+
+
+def test_connection_closed_by_the_server_is_reopened(sink, session):
+    sink.drop_after_message = True
+    session.send(message("first"), "info@example.com", "admin@example.com")
+    session.send(message("second"), "info@example.com", "admin@example.com")
+    assert len(sink.messages) == 2
+    assert sink.connections == 2
+
+
+def test_spooled_bytes_are_streamed_from_a_file(sink, session, tmp_path):
+    path = tmp_path / "mail.eml"
+    path.write_bytes(b"Subject: spooled\r\n\r\n.line\r\n")
+    with open(path, "rb") as file:
+        session.send_many([(file, "info@example.com", ["admin@example.com"])])
+    assert sink.messages == [b"Subject: spooled\r\n\r\n..line\r\n"]
+
+
+def test_unknown_security_mode_is_rejected():
+    with pytest.raises(ValueError):
+        SMTPSession("127.0.0.1", 25, security="tls")
@@ -0,0 +1,68 @@
+"""
+Cold start of main.py: the timer units start a new interpreter for every mail.
+
+The import of main.py is measured with "python -X importtime" and must stay
+within STARTUP_BUDGET_MS (default 150, raise it on slow devices like the Pi
+Zero), and none of the heavy modules that are only needed later may be
+imported on startup. "python benchmark.py --startup" runs this test.
+"""
+
+import os
+import re
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be imported by "import main", they are only loaded when used
+LAZY_MODULES = ("requests", "urllib3", "psutil", "asyncio", "http.server", "email.mime.multipart", "smtplib", "ssl")
+
+DEFAULT_BUDGET_MS = 150
+
+_LINE_PATTERN = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+
+def import_times(module, runs=5):
+    """
+    Imports a module in fresh interpreters with -X importtime.
+
+    Args:
+        module (str): The module to import.
+        runs (int): Number of interpreters, the fastest run counts.
+
+    Returns:
+        tuple: The cumulative import time of the module in milliseconds and a dict with the
+               self time in milliseconds of every module imported by it.
+    """
+    best = None
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=REPO_DIR,
+                                capture_output=True, text=True, check=True)
+        total = None
+        modules = {}
+        # Everything after the interpreter startup (site) belongs to the import of the module
+        for line in result.stderr.splitlines():
+            match = _LINE_PATTERN.match(line)
+            if match is None:
+                continue
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = int(self_us) / 1000
+            if name == module and not indent:
+                total = int(cumulative_us) / 1000
+            elif not indent and name == "site":
+                modules.clear()
+        if total is not None and (best is None or total < best[0]):
+            best = (total, modules)
+    return best
+
+
+def test_cold_start_within_budget():
+    budget = float(os.environ.get("STARTUP_BUDGET_MS", DEFAULT_BUDGET_MS))
+    total, modules = import_times("main")
+    print(f"Importing main.py takes {total:.1f} ms (budget {budget:.0f} ms), slowest modules:")
+    for name, milliseconds in sorted(modules.items(), key=lambda item: item[1], reverse=True)[:8]:
+        print(f"  {name:<40} {milliseconds:>8.1f} ms")
+
+    eager = [name for name in LAZY_MODULES if name in modules]
+    assert not eager, f"Imported on startup although only needed later: {', '.join(eager)}"
+    assert total <= budget, f"Startup exceeds the budget by {total - budget:.1f} ms"
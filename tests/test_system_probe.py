@@ -0,0 +1,37 @@
+"""
+Tests for the parsing of the /proc files by ProcProbe.
+"""
+
+import sys
+
+import pytest
+
+from src.System.SystemProbe import ProcProbe, _unescape_mount_field
+
+
+@pytest.mark.parametrize("field, expected", [
+    (b"/mnt/usb", "/mnt/usb"),
+    (b"/mnt/my\\040disk", "/mnt/my disk"),
+    (b"/mnt/tab\\011and\\040space\\134", "/mnt/tab\tand space\\"),
+    (b"\\040", " "),
+    # Not an escape, kept as it is
+    (b"/mnt/a\\9bc", "/mnt/a\\9bc"),
+    (b"/mnt/a\\04", "/mnt/a\\04"),
+])
+def test_mount_paths_are_unescaped(field, expected):
+    assert _unescape_mount_field(field) == expected
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="needs /proc")
+def test_proc_probe_reads_plausible_values():
+    probe = ProcProbe()
+    try:
+        total, used, available, percent = probe.memory()
+        assert 0 < used <= total and 0 <= available <= total and 0 <= percent <= 100
+        assert probe.uptime_seconds() > 0
+        assert probe.load_1() >= 0
+        assert any(mountpoint == "/" for _, mountpoint, _, _ in probe.partitions())
+        freq = probe.cpu_freq_mhz()
+        assert freq is None or freq > 0
+    finally:
+        probe.close()